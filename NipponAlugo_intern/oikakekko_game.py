@@ -2,17 +2,25 @@ import pygame
 import sys
 import random
 import os
+import argparse
 
 # oni.pyから鬼の移動アルゴリズムを読み込む
 from oni import get_oni_next_move
+from path_table import PathTableCache, ready_table
+from flow_field import FlowField
 
 # 初期化
 pygame.init()
 
-# グリッド設定
-GRID_SIZE = 60
-GRID_WIDTH = 10
-GRID_HEIGHT = 10
+# グリッド設定（--width / --height で盤面の大きさを変えられる。窓が大きくなりすぎないよう、広い盤面ではマスを小さくする）
+parser = argparse.ArgumentParser()
+parser.add_argument("--width", type=int, default=10)
+parser.add_argument("--height", type=int, default=10)
+args = parser.parse_args()
+GRID_WIDTH, GRID_HEIGHT = args.width, args.height
+GRID_SIZE = max(12, min(60, 600 // max(GRID_WIDTH, GRID_HEIGHT)))
+# 岩の個数の範囲。10x10 で 5〜10 個（盤面の 5〜10%）になるよう面積に比例させる
+ROCK_MIN, ROCK_MAX = 5 * GRID_WIDTH * GRID_HEIGHT // 100, 10 * GRID_WIDTH * GRID_HEIGHT // 100
 WIDTH = GRID_WIDTH * GRID_SIZE
 HEIGHT = GRID_HEIGHT * GRID_SIZE
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
@@ -31,7 +39,7 @@ UI_PANEL_SCALE = 0.8
 # --- 画像読み込み ---
 try:
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    OVERLAP_SIZE = 90
+    OVERLAP_SIZE = GRID_SIZE * 3 // 2
     OHTERS_SIZE = GRID_SIZE
     OFFSET = (OVERLAP_SIZE - GRID_SIZE) // 2
 
@@ -102,6 +110,9 @@ field, last_move_time, coin_count = [], 0, 0
 rope_pos = (GRID_WIDTH // 2, GRID_HEIGHT // 2)
 rope = None
 oni_list = []
+bfs_map, path_future, flow_field = [], None, None
+# 岩は reset_game のたびにランダムに置き直すので、同じ配置の表を読み直すことはない。ディスクには保存しない
+path_tables = PathTableCache(cache_dir=None)
 scroll_y = 0
 is_scrolling = False # ▼▼▼【変更】スクロール中かどうかのフラグを追加 ▼▼▼
 MODE = "START_SCREEN"
@@ -134,8 +145,8 @@ class Oni:
         self.x, self.y, self.last_move_time = x, y, 0
         self.move_interval = random.randint(450, 650)
         self.image = oni_img
-    def update_position(self, bfs_map, player_pos):
-        self.x, self.y = get_oni_next_move(bfs_map, (self.x, self.y), player_pos)
+    def update_position(self, bfs_map, player_pos, pursuit=None):
+        self.x, self.y = get_oni_next_move(bfs_map, (self.x, self.y), player_pos, pursuit)
     def draw(self, surface):
         surface.blit(self.image, (self.x * GRID_SIZE, self.y * GRID_SIZE))
 
@@ -168,12 +179,12 @@ class Leaf:
         surface.blit(rotated_leaf, leaf_rect)
 
 def reset_game():
-    global player_x, player_y, field, last_move_time, coin_count, rope, oni_list
+    global player_x, player_y, field, last_move_time, coin_count, rope, oni_list, bfs_map, path_future, flow_field
     player_x, player_y = rope_pos; coin_count = 0; rope = None; oni_list = []
     field = [[{"type": "grass", "bush": False, "coin": False} for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
     occupied_positions = {(player_x, player_y)}
     rocks_set = set()
-    while len(rocks_set) < random.randint(5, 10):
+    while len(rocks_set) < random.randint(ROCK_MIN, ROCK_MAX):
         rx, ry = random.randint(0, GRID_WIDTH - 1), random.randint(0, GRID_HEIGHT - 1)
         if (rx, ry) not in occupied_positions:
             field[ry][rx]["type"] = "rock"; rocks_set.add((rx, ry)); occupied_positions.add((rx, ry))
@@ -193,6 +204,10 @@ def reset_game():
             distance = abs(ox - player_x) + abs(oy - player_y)
             if (ox, oy) not in occupied_positions and distance >= 3:
                 oni_list.append(Oni(ox, oy)); occupied_positions.add((ox, oy)); break
+    # 岩の配置はプレイ中に変わらないので、BFS用マップと最短経路表はここで一度だけ用意する
+    bfs_map = ["".join(["#" if cell["type"] == "rock" else "." for cell in row]) for row in field]
+    path_future = path_tables.request(bfs_map)
+    flow_field = FlowField(bfs_map)
     last_move_time = 0
 
 def draw_coin_counter(surface, count):
@@ -294,10 +309,11 @@ while True:
             MODE = "STAGE_CLEAR"
         if rope: rope.update()
         
-        bfs_map = ["".join(["#" if cell["type"] == "rock" else "." for cell in row]) for row in field]
+        # 最短経路表の準備ができるまでは、全員で1つのフローフィールドを読んで追いかける
+        pursuit = ready_table(path_future) or flow_field
         for oni in oni_list:
             if current_time - oni.last_move_time > oni.move_interval:
-                oni.update_position(bfs_map, (player_x, player_y)); oni.last_move_time = current_time
+                oni.update_position(bfs_map, (player_x, player_y), pursuit); oni.last_move_time = current_time
             if (oni.x, oni.y) == (player_x, player_y):
                 MODE = "GAME_OVER"; break
         
@@ -36,15 +36,20 @@ def bfs(grid, start_pos, end_pos):
     
     return None # 目的地までの経路が見つからなかった場合
 
-def get_oni_next_move(grid, oni_pos, player_pos):
+def get_oni_next_move(grid, oni_pos, player_pos, pursuit=None):
     """
     鬼が次に動くべき最適な座標を返す。
 
     :param grid: 2Dリストのマップデータ
     :param oni_pos: 鬼の現在座標 (x, y)
     :param player_pos: プレイヤーの現在座標 (x, y)
+    :param pursuit: grid の PathTable（path_table.py）か FlowField（flow_field.py）。
+                    あれば BFS せずに表を引くだけで済む
     :return: 鬼が次に移動すべき座標 (x, y)。経路がない場合は現在の座標を返す。
     """
+    if pursuit is not None:
+        return pursuit.next_move(oni_pos, player_pos)
+
     # BFSで鬼からプレイヤーへの最短経路を探す
     path = bfs(grid, oni_pos, player_pos)
 
@@ -0,0 +1,185 @@
+# path_table.py
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# 探索順は oni.py の bfs と同じ (下, 上, 右, 左)。同じ長さの経路が複数あるときも bfs と同じ一歩を選ぶ
+DIRECTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+STAY = len(DIRECTIONS)  # 動かない（到達不能 / すでに同じマス）
+UNREACHABLE = 255  # uint8 の距離表での到達不能（256 マス以上のマップは uint16 で、UNREACHABLE_WIDE）
+UNREACHABLE_WIDE = 65535
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+MAX_CACHE_FILES = 64
+# 表は マス数^2 の大きさを2枚持つ（距離は 255 マスまで uint8、それより大きいと uint16）ので、
+# これより大きいマップでは作らない（FlowField を使う）
+MAX_TABLE_CELLS = 50 * 50
+
+
+def to_passable(grid):
+    """
+    マップを通れるマスの bool 配列 (height, width) にする。
+
+    :param grid: bfs 用の文字列マップ ('#'は壁) またはステージの ROCK_LAYOUT (1=岩)
+    """
+    if isinstance(grid[0], str):
+        return np.array([[c != '#' for c in row] for row in grid], dtype=bool)
+    return np.asarray(grid) != 1
+
+
+def layout_key(passable):
+    """レイアウトのハッシュ（ディスクキャッシュのキー）"""
+    h, w = passable.shape
+    return hashlib.sha1(f"{w}x{h}:".encode() + np.packbits(passable).tobytes()).hexdigest()[:16]
+
+
+class PathTable:
+    """
+    1つのレイアウトの全マス間の最短距離と次の一歩を持つ表。
+
+    dist[target, cell] は cell から target までの歩数、step[target, cell] はそのときの
+    最初の移動方向 (DIRECTIONS の添字, 動かない場合は STAY)。step は uint8[cells, cells]、
+    dist は 255 マスまでなら uint8（到達不能は UNREACHABLE）、それより大きいマップでは歩数が 254 を
+    超えうるので uint16（到達不能は UNREACHABLE_WIDE）。到達不能の値は self.unreachable。
+    """
+
+    def __init__(self, width, height, dist, step):
+        self.width, self.height = width, height
+        self.dist, self.step = dist, step
+        self.unreachable = int(np.iinfo(dist.dtype).max)
+
+    @classmethod
+    def build(cls, passable):
+        """全マスから同時に幅優先探索して表を作る"""
+        height, width = passable.shape
+        n = width * height
+        free = passable.reshape(-1)
+        cells = np.arange(n)
+        xs, ys = cells % width, cells // width
+
+        # 各マスの4方向の隣（通れない方向は自分自身を指し、valid=False）
+        nbr = np.empty((n, len(DIRECTIONS)), dtype=np.int64)
+        valid = np.empty((n, len(DIRECTIONS)), dtype=bool)
+        for k, (dx, dy) in enumerate(DIRECTIONS):
+            nx, ny = xs + dx, ys + dy
+            inside = (0 <= nx) & (nx < width) & (0 <= ny) & (ny < height)
+            nbr[:, k] = np.where(inside, ny * width + nx, cells)
+            valid[:, k] = inside & free[nbr[:, k]] & free
+
+        # 最短経路は最長で マス数-1 歩なので、255 マスまでなら uint8 に収まる
+        unreachable = UNREACHABLE if n <= UNREACHABLE else UNREACHABLE_WIDE
+        dist = np.full((n, n), unreachable, dtype=np.uint8 if n <= UNREACHABLE else np.uint16)
+        dist[cells[free], cells[free]] = 0
+        # 探索中の目的地だけについて、前の歩数で届いたマス (frontier) を盤面の形のまま上下左右にずらして広げる。
+        # 広がらなくなった目的地は外すので、細長い迷路のように歩数が大きいマップでも速い
+        targets = cells[free]
+        frontier = np.zeros((len(targets), height, width), dtype=bool)
+        frontier.reshape(len(targets), n)[np.arange(len(targets)), targets] = True
+        unseen = np.broadcast_to(passable, frontier.shape) & ~frontier
+        for d in range(1, unreachable):
+            reached = np.zeros_like(frontier)
+            reached[:, 1:, :] |= frontier[:, :-1, :]
+            reached[:, :-1, :] |= frontier[:, 1:, :]
+            reached[:, :, 1:] |= frontier[:, :, :-1]
+            reached[:, :, :-1] |= frontier[:, :, 1:]
+            reached &= unseen
+            rows, hit = np.nonzero(reached.reshape(len(targets), n))
+            if not len(rows):
+                break
+            dist[targets[rows], hit] = d
+            unseen &= ~reached
+            alive = reached.any(axis=(1, 2))
+            if alive.all():
+                frontier = reached
+            else:
+                targets, frontier, unseen = targets[alive], reached[alive], unseen[alive]
+
+        # 次の一歩: 距離が1減る隣のうち探索順で最初の方向
+        step = np.full((n, n), STAY, dtype=np.uint8)
+        for k in reversed(range(len(DIRECTIONS))):
+            closer = valid[None, :, k] & (dist[:, nbr[:, k]].astype(np.int32) == dist.astype(np.int32) - 1)
+            step[closer] = k
+        return cls(width, height, dist, step)
+
+    def next_move(self, pos, target):
+        """pos から target へ向かうときの次の座標 (x, y)"""
+        x, y = pos
+        k = self.step[target[1] * self.width + target[0], y * self.width + x]
+        if k == STAY:
+            return pos
+        dx, dy = DIRECTIONS[k]
+        return (x + dx, y + dy)
+
+    def distance(self, pos, target):
+        """pos から target までの歩数（到達できなければ self.unreachable）"""
+        return int(self.dist[target[1] * self.width + target[0], pos[1] * self.width + pos[0]])
+
+    def save(self, path):
+        np.savez_compressed(path, width=self.width, height=self.height, dist=self.dist, step=self.step)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(int(data["width"]), int(data["height"]), data["dist"], data["step"])
+
+
+def load_or_build(passable, cache_dir=CACHE_DIR):
+    """ディスクキャッシュにあれば読み込み、なければ作って保存する（cache_dir が None なら作るだけ）"""
+    if cache_dir is None:
+        return PathTable.build(passable)
+    path = os.path.join(cache_dir, f"path_table_{layout_key(passable)}.npz")
+    if os.path.exists(path):
+        try:
+            return PathTable.load(path)
+        except (OSError, ValueError, KeyError):
+            pass  # 壊れたキャッシュは作り直す
+    table = PathTable.build(passable)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = path + ".tmp.npz"
+    table.save(tmp_path)
+    os.replace(tmp_path, path)
+    _prune_cache(cache_dir)
+    return table
+
+
+def _prune_cache(cache_dir):
+    """キャッシュが増えすぎたら古いものから消す"""
+    files = [os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.startswith("path_table_")]
+    files.sort(key=os.path.getmtime)
+    for f in files[:-MAX_CACHE_FILES]:
+        os.remove(f)
+
+
+class PathTableCache:
+    """
+    レイアウトごとの PathTable をバックグラウンドで用意する。
+
+    request() はすぐに Future を返すので、ステージ選択時に呼んでおけばゲームは待たされない。
+    表ができるまでは呼び出し側で従来の bfs を使う。MAX_TABLE_CELLS より大きいマップでは None を返す。
+    毎回配置が変わるマップでは cache_dir=None にして、ディスクに保存せずメモリ上だけで持つ。
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="path_table")
+        self._futures = {}
+
+    def request(self, grid):
+        passable = to_passable(grid)
+        if passable.size > MAX_TABLE_CELLS:
+            return None
+        key = layout_key(passable)
+        if key not in self._futures:
+            if len(self._futures) >= MAX_CACHE_FILES:
+                self._futures.pop(next(iter(self._futures)))
+            self._futures[key] = self._executor.submit(load_or_build, passable, self.cache_dir)
+        return self._futures[key]
+
+
+def ready_table(future):
+    """Future が完了していれば PathTable、まだなら None を返す"""
+    if future is None or not future.done() or future.exception() is not None:
+        return None
+    return future.result()
@@ -0,0 +1,109 @@
+import gc
+import importlib.util
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_module(folder, name):
+    """
+    ROOT/folder/name.py を読み込む。
+
+    各フォルダは同じ名前のモジュール（field_grid.py, oni_env.py など）を持っているので、
+    そのフォルダを sys.path の先頭に置き、別のフォルダから読み込み済みの同名モジュールは外してから読む。
+    """
+    directory = os.path.join(ROOT, folder)
+    local = {f[:-3] for f in os.listdir(directory) if f.endswith(".py")}
+    for mod_name in local:
+        mod = sys.modules.get(mod_name)
+        if mod is not None and os.path.dirname(os.path.abspath(getattr(mod, "__file__", "") or "")) != directory:
+            del sys.modules[mod_name]
+    sys.path.insert(0, directory)
+    try:
+        spec = importlib.util.spec_from_file_location(f"{folder}.{name}", os.path.join(directory, f"{name}.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(directory)
+    return module
+
+
+def metric(value, unit, higher_is_better, check=True):
+    """
+    結果1つ分。check=False のもの（p99 など揺れが大きい値）は記録するだけで回帰判定には使わない
+    """
+    return {"value": float(value), "unit": unit, "higher_is_better": higher_is_better, "check": check}
+
+
+def _rounds(rounds):
+    """計測の各回。timeit と同じく、計測中はガベージコレクションを止める（各回の前に済ませておく）"""
+    enabled = gc.isenabled()
+    try:
+        for i in range(rounds):
+            gc.collect()
+            gc.disable()
+            yield i
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def throughput(fn, min_time=0.5, batch=1, rounds=3):
+    """
+    fn() をくり返し、1秒あたりの回数を返す。
+
+    min_time 秒を rounds 回に分けて測り、一番速かった回の値を使う（他の処理に割り込まれた回を外す）。
+
+    :param batch: fn() 1回で処理する件数（1秒あたりの件数にする）
+    """
+    fn()  # 1回目はキャッシュなどの準備を含むので数えない
+    best = 0.0
+    for _ in _rounds(rounds):
+        calls, start = 0, time.perf_counter()
+        while True:
+            fn()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time / rounds:
+                break
+        best = max(best, calls * batch / elapsed)
+    return best
+
+
+def latency(fn, args_list, min_time=0.5, rounds=3, max_calls=100_000):
+    """
+    args_list を順にくり返し fn(*args) を呼び、1回ごとの所要時間 (マイクロ秒) の統計を返す。
+
+    throughput と同じく rounds 回に分けて測り、各統計値は一番速かった回の値を使う。
+
+    :return: {"mean": ..., "p50": ..., "p99": ...}
+    """
+    fn(*args_list[0])
+    best = None
+    for _ in _rounds(rounds):
+        samples = []
+        deadline = time.perf_counter() + min_time / rounds
+        i = 0
+        while i < max_calls and (i < len(args_list) or time.perf_counter() < deadline):
+            args = args_list[i % len(args_list)]
+            start = time.perf_counter_ns()
+            fn(*args)
+            samples.append(time.perf_counter_ns() - start)
+            i += 1
+        us = np.array(samples) / 1000
+        stats = {"mean": float(us.mean()), "p50": float(np.percentile(us, 50)), "p99": float(np.percentile(us, 99))}
+        best = stats if best is None else {k: min(best[k], v) for k, v in stats.items()}
+    return best
+
+
+def latency_metrics(prefix, stats):
+    """latency() の結果を p50（回帰判定に使う）と mean, p99（記録のみ）の3つの結果にする"""
+    return {
+        f"{prefix}.p50": metric(stats["p50"], "us", False),
+        f"{prefix}.mean": metric(stats["mean"], "us", False, check=False),
+        f"{prefix}.p99": metric(stats["p99"], "us", False, check=False),
+    }
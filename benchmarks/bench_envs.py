@@ -0,0 +1,60 @@
+import random
+
+import numpy as np
+
+from bench_common import load_module, metric, throughput
+
+# (フォルダ, モジュール, 環境を作る関数) 。どれも ChaseEnv 系の環境
+ENVS = [
+    ("code_ueno", "enemy_env", lambda m: m.ChaseEnv()),
+    ("code_ueno", "oni_env", lambda m: m.ChaseEnv()),
+    ("code_ueno", "oni_double_env", lambda m: m.ChaseEnv()),
+    ("code_tougou", "oni_env", lambda m: m.ChaseEnv()),
+    ("code_double_oni_chasing", "oni_double_env", lambda m: m.ChaseEnv()),
+    ("code_double_oni_chasing", "layout_pool", lambda m: m.PooledChaseEnv()),
+    ("code_double_oni_chasing", "oni_stage_env", lambda m: m.StageChaseEnv()),
+]
+
+
+def bench_env(env, min_time, n_actions=4096):
+    """ランダムな行動で step し続けたときの step/秒 と reset/秒"""
+    env.action_space.seed(0)
+    actions = [env.action_space.sample() for _ in range(n_actions)]
+    env.reset(seed=0)
+    state = {"i": 0}
+
+    def step():
+        i = state["i"] = (state["i"] + 1) % n_actions
+        _, _, terminated, truncated, _ = env.step(actions[i])
+        if terminated or truncated:
+            env.reset()
+
+    return throughput(step, min_time), throughput(env.reset, min_time)
+
+
+def bench_vec_env(min_time, num_envs=1024):
+    vec_env_module = load_module("code_double_oni_chasing", "oni_double_vec_env")
+    env = vec_env_module.ChaseVecEnv(num_envs=num_envs, seed=0)
+    env.reset()
+    actions = np.random.default_rng(0).integers(0, 4, size=(64, num_envs, 2))
+    state = {"i": 0}
+
+    def step():
+        state["i"] = (state["i"] + 1) % len(actions)
+        env.step(actions[state["i"]])
+
+    return throughput(step, min_time, batch=num_envs), throughput(env.reset, min_time, batch=num_envs)
+
+
+def run(quick=False):
+    min_time = 0.2 if quick else 1.0
+    random.seed(0)
+    results = {}
+    for folder, name, make in ENVS:
+        steps, resets = bench_env(make(load_module(folder, name)), min_time)
+        results[f"env.{folder}.{name}.step"] = metric(steps, "steps/s", True)
+        results[f"env.{folder}.{name}.reset"] = metric(resets, "resets/s", True)
+    steps, resets = bench_vec_env(min_time)
+    results["env.code_double_oni_chasing.oni_double_vec_env.step"] = metric(steps, "steps/s", True)
+    results["env.code_double_oni_chasing.oni_double_vec_env.reset"] = metric(resets, "resets/s", True)
+    return results
@@ -0,0 +1,46 @@
+import random
+
+from bench_common import latency, latency_metrics, load_module
+
+GRID_SIZES = [10, 20, 40]
+DENSITIES = [0.0, 0.15, 0.3]  # 岩（'#'）の割合
+PURSUIT_MAX_SIZE = 20  # PathTable は マス数^2 の表を持つので大きいマップでは測らない
+
+
+def make_grid(size, density, rng):
+    """bfs 用の文字列マップ (size x size) をランダムに作る"""
+    return ["".join("#" if rng.random() < density else "." for _ in range(size)) for _ in range(size)]
+
+
+def make_queries(grid, rng, n=200):
+    """通れるマスの (鬼, プレイヤー) の組をランダムに作る（到達できない組も含む）"""
+    free = [(x, y) for y, row in enumerate(grid) for x, c in enumerate(row) if c != "#"]
+    return [(rng.choice(free), rng.choice(free)) for _ in range(n)]
+
+
+def run(quick=False):
+    min_time = 0.1 if quick else 0.5
+    oni = load_module("NipponAlugo_intern", "oni")
+    path_table = load_module("NipponAlugo_intern", "path_table")
+    flow_field = load_module("NipponAlugo_intern", "flow_field")
+
+    results = {}
+    for size in GRID_SIZES:
+        for density in DENSITIES:
+            rng = random.Random(size * 100 + int(density * 100))
+            grid = make_grid(size, density, rng)
+            queries = make_queries(grid, rng)
+            name = f"path.{size}x{size}.rock{int(density * 100)}"
+
+            results.update(latency_metrics(f"{name}.bfs", latency(
+                lambda s, e: oni.bfs(grid, s, e), queries, min_time)))
+            results.update(latency_metrics(f"{name}.get_oni_next_move", latency(
+                lambda s, e: oni.get_oni_next_move(grid, s, e), queries, min_time)))
+            if size <= PURSUIT_MAX_SIZE:
+                table = path_table.PathTable.build(path_table.to_passable(grid))
+                field = flow_field.FlowField(grid)
+                results.update(latency_metrics(f"{name}.get_oni_next_move.path_table", latency(
+                    lambda s, e: oni.get_oni_next_move(grid, s, e, pursuit=table), queries, min_time)))
+                results.update(latency_metrics(f"{name}.get_oni_next_move.flow_field", latency(
+                    lambda s, e: oni.get_oni_next_move(grid, s, e, pursuit=field), queries, min_time)))
+    return results
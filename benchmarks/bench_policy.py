@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+
+from bench_common import ROOT, latency, latency_metrics, load_module, metric
+
+MODEL_DIR = os.path.join(ROOT, "code_double_oni_chasing", "model")
+BATCH_SIZES = [1, 16, 256]
+
+
+def bench_predict(prefix, predict, min_time):
+    """1件ずつと、まとめて predict したときの1回あたりの時間と1秒あたりの件数"""
+    rng = np.random.default_rng(0)
+    results = {}
+    for batch in BATCH_SIZES:
+        shape = (6,) if batch == 1 else (batch, 6)
+        inputs = [(rng.integers(0, 10, size=shape).astype(np.int32),) for _ in range(64)]
+        stats = latency(predict, inputs, min_time)
+        name = f"{prefix}.single" if batch == 1 else f"{prefix}.batch{batch}"
+        results.update(latency_metrics(name, stats))
+        results[f"{name}.throughput"] = metric(batch / stats["mean"] * 1e6, "obs/s", True)
+    return results
+
+
+def run(quick=False):
+    min_time = 0.2 if quick else 1.0
+    results = {}
+
+    from stable_baselines3 import PPO
+    import torch
+    torch.set_num_threads(1)  # 計測がスレッド数で揺れないように揃える
+    model = PPO.load(os.path.join(MODEL_DIR, "oni_double_model.zip"), device="cpu")
+    results.update(bench_predict("policy.ppo", lambda obs: model.predict(obs, deterministic=True), min_time))
+
+    npz_path = os.path.join(MODEL_DIR, "oni_double_model.npz")
+    if os.path.exists(npz_path):
+        numpy_policy = load_module("code_double_oni_chasing", "numpy_policy")
+        policy = numpy_policy.NumpyPolicy(npz_path)
+        results.update(bench_predict("policy.numpy", lambda obs: policy.predict(obs, deterministic=True), min_time))
+
+    table_path = os.path.join(MODEL_DIR, "oni_double_model_table.npz")
+    if os.path.exists(table_path):
+        policy_table = load_module("code_double_oni_chasing", "policy_table")
+        table = policy_table.PolicyTable(table_path)
+        results.update(bench_predict("policy.table", table.predict, min_time))
+        # ゲームが鬼のティックごとに使う、1件ずつの表引き
+        rng = np.random.default_rng(0)
+        inputs = [(rng.integers(0, 10, size=6).astype(np.int32),) for _ in range(64)]
+        results.update(latency_metrics("policy.table.action", latency(table.action, inputs, min_time)))
+    return results
@@ -0,0 +1,140 @@
+"""
+性能ベンチマーク一式。
+
+    python benchmarks/run_benchmarks.py                     # 全部測って baseline.json と比べる
+    python benchmarks/run_benchmarks.py --only env,path     # 一部だけ
+    python benchmarks/run_benchmarks.py --update-baseline   # 今の結果を基準として保存する
+
+結果は JSON (--output) に書き出す。基準より tolerance 以上悪くなった項目があれば、その項目を含むベンチマークを
+もう1回測り直し（たまたま遅かっただけの回を外すため、良いほうの値を使う）、それでも悪ければ終了コード 1 で終わる。
+基準値は測ったマシンに依存するので、マシンを変えたら --update-baseline で取り直すこと。
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+import bench_envs
+import bench_pathfinding
+import bench_policy
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+RESULTS_PATH = os.path.join(BENCH_DIR, "results.json")
+SUITES = {"env": bench_envs, "path": bench_pathfinding, "policy": bench_policy}
+TOLERANCE = 0.5  # 基準より 50% 以上悪ければ回帰とみなす（1コアの共有マシンでは実行ごとに 30% 程度揺れるため。静かなマシンなら --tolerance で狭める）
+
+
+def run_suites(names, quick=False):
+    """:return: {ベンチマーク名: {項目名: 結果}}"""
+    results = {}
+    for name in names:
+        start = time.perf_counter()
+        results[name] = SUITES[name].run(quick=quick)
+        print(f"[{name}] {time.perf_counter() - start:.1f} 秒")
+    return results
+
+
+def merge_best(results, retry):
+    """同じ項目を2回測った結果のうち、良いほうを残す"""
+    for name, current in retry.items():
+        old = results.get(name)
+        if old is None or (current["value"] > old["value"]) == current["higher_is_better"]:
+            results[name] = current
+
+
+def find_regressions(results, baseline, tolerance=TOLERANCE):
+    """
+    基準と比べて悪くなった項目の一覧を返す（check=False の項目と、片方にしかない項目は比べない）
+
+    :return: [(名前, 基準値, 今回の値, 悪化した割合), ...]
+    """
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None or not current["check"] or base["value"] <= 0:
+            continue
+        if current["higher_is_better"]:
+            change = (base["value"] - current["value"]) / base["value"]
+        else:
+            change = (current["value"] - base["value"]) / base["value"]
+        if change > tolerance:
+            regressions.append((name, base["value"], current["value"], change))
+    return regressions
+
+
+def environment_info(quick):
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "quick": quick,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="環境・経路探索・推論の性能ベンチマーク")
+    parser.add_argument("--only", default=",".join(SUITES), help=f"測るもの（カンマ区切り: {', '.join(SUITES)}）")
+    parser.add_argument("--quick", action="store_true", help="計測時間を短くする（値は粗くなる）")
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--update-baseline", action="store_true", help="今回の結果を基準として保存する")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.only.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SUITES]
+    if unknown:
+        parser.error(f"不明なベンチマーク: {', '.join(unknown)}")
+
+    by_suite = run_suites(names, quick=args.quick)
+    results = {k: v for suite in by_suite.values() for k, v in suite.items()}
+    baseline = None
+    if not args.update_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressed = {name for name, *_ in find_regressions(results, baseline, args.tolerance)}
+        retry = [suite for suite in names if regressed & set(by_suite[suite])]
+        if retry:
+            print(f"悪化した項目があるので測り直します: {', '.join(retry)}")
+            for suite_results in run_suites(retry, quick=args.quick).values():
+                merge_best(results, suite_results)
+
+    report = {"meta": environment_info(args.quick), "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"結果を {args.output} に書き出しました ({len(results)} 項目)")
+
+    if args.update_baseline:
+        # 一部だけ測った場合は、測っていない項目の基準値を残す
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)["results"]
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump({"meta": report["meta"], "results": baseline}, f, indent=2, ensure_ascii=False)
+        print(f"基準を {args.baseline} に保存しました")
+        return
+
+    if baseline is None:
+        print("基準がないので比較しません（--update-baseline で作成）")
+        return
+    regressions = find_regressions(results, baseline, args.tolerance)
+    for name, base, current, change in regressions:
+        unit = results[name]["unit"]
+        print(f"回帰: {name}: {base:.4g} → {current:.4g} {unit} ({change:+.0%})")
+    compared = sum(1 for name in results if name in baseline and results[name]["check"])
+    print(f"{compared} 項目を基準と比較し、{len(regressions)} 項目が {args.tolerance:.0%} 以上悪化しました")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+INDEX_FILE = "sprite_atlas.json"
+PIXELS_FILE = "sprite_atlas.rgba"
+ATLAS_WIDTH = 4096
+PADDING = 1  # 隣のスプライトとの間を1px空ける
+FORMAT_VERSION = 1
+
+
+# --- 拡大縮小のルール ---
+# ルールは (元の幅, 元の高さ, ここまでに決まったサイズの辞書) を受け取り、拡大縮小後のサイズを返す。
+# ゲーム内でこれまで書いていた pygame.transform.scale / scale_by の計算とまったく同じ値になるようにしてある
+def scale_to(width, height):
+    return lambda w, h, sizes: (int(width), int(height))
+
+
+def scale_by(factor):
+    return lambda w, h, sizes: (int(w * factor), int(h * factor))
+
+
+def fit_width(width):
+    """縦横比を保って幅を width にする"""
+    return lambda w, h, sizes: (width, int(h * (width / w)))
+
+
+def fit_height(height):
+    """縦横比を保って高さを height にする（height は sizes を受け取る関数でもよい）"""
+    def rule(w, h, sizes):
+        target = height(sizes) if callable(height) else height
+        return (int(w * (target / h)), target)
+    return rule
+
+
+class Sprite:
+    """
+    アトラスに入れる画像1枚分の指定。
+
+    :param name: アトラス内での名前
+    :param file: image フォルダ内のファイル名
+    :param size: 拡大縮小のルール（None ならそのまま）
+    :param alpha: False なら不透明な画像として convert() する（背景など）
+    """
+
+    def __init__(self, name, file, size=None, alpha=True):
+        self.name, self.file, self.size, self.alpha = name, file, size, alpha
+
+
+class SpriteAtlas:
+    """1枚の Surface に詰めた全スプライト。atlas[name] で切り出した Surface を返す"""
+
+    def __init__(self, surface, rects, opaque=()):
+        self.surface = surface
+        self.rects = rects
+        self._sprites = {}
+        for name, rect in rects.items():
+            sprite = surface.subsurface(rect)
+            # 背景のような不透明画像はアルファなしに変換しておく（描画が速い）
+            self._sprites[name] = sprite.convert() if name in opaque else sprite
+
+    def __getitem__(self, name):
+        return self._sprites[name]
+
+
+def _resolve_sizes(specs, source_sizes):
+    """各スプライトの拡大縮小後のサイズを決める"""
+    sizes = {}
+    for spec in specs:
+        w, h = source_sizes[spec.name]
+        sizes[spec.name] = tuple(spec.size(w, h, sizes)) if spec.size else (w, h)
+    return sizes
+
+
+def _pack(sizes):
+    """高さ順に棚詰めする。:return: ({name: (x, y, w, h)}, アトラスの大きさ)"""
+    rects = {}
+    x = y = shelf_height = atlas_width = 0
+    for name, (w, h) in sorted(sizes.items(), key=lambda item: -item[1][1]):
+        if x + w > ATLAS_WIDTH:
+            x, y = 0, y + shelf_height + PADDING
+            shelf_height = 0
+        rects[name] = (x, y, w, h)
+        x += w + PADDING
+        shelf_height = max(shelf_height, h)
+        atlas_width = max(atlas_width, x)
+    return rects, (max(1, atlas_width), max(1, y + shelf_height))
+
+
+def _load_cached(image_dir, specs, cache_dir):
+    """キャッシュが有効なら SpriteAtlas を返す。元画像の更新時刻かサイズ指定が変わっていれば None"""
+    try:
+        with open(os.path.join(cache_dir, INDEX_FILE)) as f:
+            index = json.load(f)
+        if index.get("version") != FORMAT_VERSION or set(index["sprites"]) != {s.name for s in specs}:
+            return None
+        entries = index["sprites"]
+        for spec in specs:
+            entry = entries[spec.name]
+            if entry["file"] != spec.file or entry["mtime_ns"] != os.stat(os.path.join(image_dir, spec.file)).st_mtime_ns:
+                return None
+        # 元画像のサイズは保存済みなので、デコードせずにサイズ指定の変更を確かめられる
+        sizes = _resolve_sizes(specs, {name: tuple(e["source_size"]) for name, e in entries.items()})
+        if any(tuple(entries[name]["rect"][2:]) != size for name, size in sizes.items()):
+            return None
+        with open(os.path.join(cache_dir, PIXELS_FILE), "rb") as f:
+            pixels = f.read()
+        surface = pygame.image.frombytes(pixels, tuple(index["size"]), "RGBA").convert_alpha()
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    rects = {name: pygame.Rect(e["rect"]) for name, e in entries.items()}
+    return SpriteAtlas(surface, rects, opaque={s.name for s in specs if not s.alpha})
+
+
+def _decode(path):
+    # convert() はメインスレッドで行うので、ここではデコードだけ
+    return pygame.image.load(path)
+
+
+def build_atlas(image_dir, specs, cache_dir=CACHE_DIR, workers=4):
+    """全画像をスレッドプールでデコードし、拡大縮小してアトラスに詰め、キャッシュに保存する"""
+    files = sorted({spec.file for spec in specs})
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="asset_decode") as pool:
+        decoded = dict(zip(files, pool.map(_decode, [os.path.join(image_dir, f) for f in files])))
+
+    source_sizes = {spec.name: decoded[spec.file].get_size() for spec in specs}
+    sizes = _resolve_sizes(specs, source_sizes)
+    rects, atlas_size = _pack(sizes)
+    surface = pygame.Surface(atlas_size, pygame.SRCALPHA)
+    for spec in specs:
+        image = decoded[spec.file].convert_alpha()
+        if sizes[spec.name] != image.get_size():
+            image = pygame.transform.scale(image, sizes[spec.name])
+        surface.blit(image, rects[spec.name][:2], special_flags=pygame.BLEND_RGBA_ADD)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    index = {
+        "version": FORMAT_VERSION,
+        "size": list(atlas_size),
+        "sprites": {spec.name: {
+            "file": spec.file,
+            "mtime_ns": os.stat(os.path.join(image_dir, spec.file)).st_mtime_ns,
+            "source_size": list(source_sizes[spec.name]),
+            "rect": list(rects[spec.name]),
+        } for spec in specs},
+    }
+    # 書きかけのファイルを読まないよう、一時ファイルに書いてから置き換える（索引は最後）
+    for name, data, mode in [(PIXELS_FILE, pygame.image.tobytes(surface, "RGBA"), "wb"),
+                             (INDEX_FILE, json.dumps(index), "w")]:
+        path = os.path.join(cache_dir, name)
+        with open(path + ".tmp", mode) as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    surface = surface.convert_alpha()
+    rects = {name: pygame.Rect(rect) for name, rect in rects.items()}
+    return SpriteAtlas(surface, rects, opaque={s.name for s in specs if not s.alpha})
+
+
+def load_atlas(image_dir, specs, cache_dir=CACHE_DIR):
+    """
+    アトラスを読み込む。キャッシュが有効ならファイル1つを読むだけ、無効なら作り直す。
+    pygame.display.set_mode の後に呼ぶこと（convert のため）。
+    """
+    start = time.perf_counter()
+    atlas = _load_cached(image_dir, specs, cache_dir)
+    source = "キャッシュ"
+    if atlas is None:
+        atlas = build_atlas(image_dir, specs, cache_dir)
+        source = "元画像から作成"
+    print(f"スプライトアトラスを読み込みました ({source}, {len(specs)} 枚, {time.perf_counter() - start:.3f} 秒)")
+    return atlas
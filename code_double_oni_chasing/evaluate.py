@@ -0,0 +1,234 @@
+"""
+学習済みモデルをヘッドレスでまとめて対戦させ、成績と推論時間を JSON に書き出す。
+
+    python evaluate.py model/oni_double_model.zip --episodes 5000
+    python evaluate.py ../test_intern/model/enemy_model1.zip --output enemy1.json
+    python evaluate.py model/oni_double_model.zip --env oni_stage_env:StageChaseEnv --compare enemy1.json
+
+エピソード i は種 seed + i で始めるので、ワーカー数を変えても同じ対戦になる。
+推論時間は各ワーカーの中で model.predict 1回ごとに測る（ワーカー数が CPU コア数を超えると遅く出るので、
+推論時間を比べるときは --workers 1 か、コア数以下にすること）。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from game_state import CAUGHT
+from parallel_learn import load_env_class
+from policy_table import PolicyTable, TABLE_SUFFIX
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# 観測の次元 → 既定の環境 (モジュール:クラス, フォルダ)。鬼2体は ChaseEnv、鬼1体は test_intern の ChaseEnv
+DEFAULT_ENVS = {
+    6: ("oni_double_env:ChaseEnv", BASE_DIR),
+    4: ("enemy_env:ChaseEnv", os.path.join(BASE_DIR, "..", "test_intern")),
+}
+STEP_PERCENTILES = [10, 25, 50, 75, 90, 99]
+
+
+def load_model(path):
+    """PPO の zip か、numpy_policy.export_policy で書き出した .npz、policy_table.py の方策表を読む"""
+    if path.endswith(TABLE_SUFFIX):
+        return PolicyTable(path)
+    if path.endswith(".npz"):
+        from numpy_policy import NumpyPolicy
+        return NumpyPolicy(path)
+    import torch
+    from stable_baselines3 import PPO
+    torch.set_num_threads(1)  # ワーカーが何個もあるので、1プロセス1スレッドにする
+    return PPO.load(path, device="cpu")
+
+
+def observation_size(model_path):
+    """モデルの観測の次元（既定の環境を選ぶのに使う）"""
+    model = load_model(model_path)
+    if isinstance(model, PolicyTable):
+        return 2 * model.n_positions
+    if model_path.endswith(".npz"):
+        return model.layers[0][0].shape[0]  # 1層目の重み (入力, 出力)
+    return int(np.prod(model.observation_space.shape))
+
+
+_worker = {}
+
+
+def _init_worker(model_path, env_spec, env_dir, deterministic):
+    _worker["model"] = load_model(model_path)
+    _worker["env"] = load_env_class(env_spec, env_dir)()
+    _worker["deterministic"] = deterministic
+
+
+def _seed_everything(seed):
+    # ChaseEnv 系の環境は組み込みの random / np.random で動く
+    random.seed(seed)
+    np.random.seed(seed)
+    model = _worker["model"]
+    if hasattr(model, "rng"):
+        model.rng = np.random.default_rng(seed)
+    elif not isinstance(model, PolicyTable):  # 方策表は決定的な行動しか持たない
+        import torch
+        torch.manual_seed(seed)
+
+
+def _run_episodes(seeds):
+    """
+    ワーカーで seeds の数だけエピソードを行う
+
+    :return: ([(種, 捕まえたか, ステップ数, 報酬の合計), ...], 1回ごとの推論時間 [ns] の配列)
+    """
+    model, env, deterministic = _worker["model"], _worker["env"], _worker["deterministic"]
+    episodes, latencies = [], []
+    for seed in seeds:
+        _seed_everything(seed)
+        obs, _ = env.reset(seed=seed)
+        total_reward, steps = 0.0, 0
+        while True:
+            start = time.perf_counter_ns()
+            action, _ = model.predict(obs, deterministic=deterministic)
+            latencies.append(time.perf_counter_ns() - start)
+            obs, reward, terminated, truncated, info = env.step(action)
+            total_reward += float(reward)
+            steps += 1
+            if terminated or truncated:
+                break
+        # StageChaseEnv はプレイヤーがステージをクリアしても terminated になるので status で見分ける
+        captured = bool(terminated) and info.get("status", CAUGHT) == CAUGHT
+        episodes.append((seed, captured, steps, total_reward))
+    return episodes, np.array(latencies, dtype=np.int64)
+
+
+def summarize(episodes, latencies_ns):
+    """対戦結果の一覧と推論時間から、JSON に書く成績をまとめる"""
+    captured = np.array([e[1] for e in episodes])
+    steps = np.array([e[2] for e in episodes])
+    rewards = np.array([e[3] for e in episodes])
+    capture_steps = steps[captured]
+    us = latencies_ns / 1000
+    result = {
+        "episodes": len(episodes),
+        "capture_rate": float(captured.mean()),
+        "mean_reward": float(rewards.mean()),
+        "std_reward": float(rewards.std()),
+        "mean_steps": float(steps.mean()),
+        "steps_to_capture": None,
+        "latency_us": {
+            "decisions": int(len(us)),
+            "mean": float(us.mean()),
+            "p50": float(np.percentile(us, 50)),
+            "p99": float(np.percentile(us, 99)),
+        },
+    }
+    if len(capture_steps):
+        values, counts = np.unique(capture_steps, return_counts=True)
+        result["steps_to_capture"] = {
+            "mean": float(capture_steps.mean()),
+            "min": int(capture_steps.min()),
+            "max": int(capture_steps.max()),
+            "percentiles": {f"p{p}": float(np.percentile(capture_steps, p)) for p in STEP_PERCENTILES},
+            "histogram": {str(v): int(c) for v, c in zip(values, counts)},
+        }
+    return result
+
+
+def evaluate(model_path, env_spec=None, env_dir=None, episodes=1000, seed=0, workers=None, deterministic=True):
+    """
+    model_path のモデルを env_spec の環境で episodes 回対戦させる
+
+    :param env_spec: "モジュール:クラス"。省略時はモデルの観測の次元から DEFAULT_ENVS で選ぶ
+    :return: JSON に書く dict（meta と results）
+    """
+    if env_spec is None:
+        env_spec, env_dir = DEFAULT_ENVS[observation_size(model_path)]
+    workers = max(1, min(workers or os.cpu_count(), episodes))
+    seeds = list(range(seed, seed + episodes))
+    # ワーカーあたり4つ程度に分け、早く終わったワーカーが次の分を取れるようにする
+    chunk = max(1, -(-episodes // (workers * 4)))
+    chunks = [seeds[i:i + chunk] for i in range(0, episodes, chunk)]
+
+    start = time.perf_counter()
+    results, latencies = [], []
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(model_path, env_spec, env_dir, deterministic)) as pool:
+        for chunk_results, chunk_latencies in pool.map(_run_episodes, chunks):
+            results.extend(chunk_results)
+            latencies.append(chunk_latencies)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "model": os.path.abspath(model_path),
+            "env": env_spec,
+            "env_dir": os.path.abspath(env_dir) if env_dir else None,
+            "seed": seed,
+            "workers": workers,
+            "deterministic": deterministic,
+            "elapsed_s": elapsed,
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": summarize(results, np.concatenate(latencies)),
+    }
+
+
+def compare(current, other):
+    """2つの評価結果の主な値を並べて表示する"""
+    rows = [("capture_rate", lambda r: r["capture_rate"]),
+            ("mean_reward", lambda r: r["mean_reward"]),
+            ("steps_to_capture.p50", lambda r: r["steps_to_capture"] and r["steps_to_capture"]["percentiles"]["p50"]),
+            ("latency_us.p50", lambda r: r["latency_us"]["p50"]),
+            ("latency_us.p99", lambda r: r["latency_us"]["p99"])]
+    print(f"{'':24} {'比較先':>12} {'今回':>12}")
+    for name, get in rows:
+        a, b = get(other["results"]), get(current["results"])
+        if a is None or b is None:
+            print(f"{name:24} {a!s:>12} {b!s:>12}")
+        else:
+            print(f"{name:24} {a:12.4g} {b:12.4g} ({b - a:+.4g})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="学習済みモデルをヘッドレスで評価する")
+    parser.add_argument("model", help="PPO の zip（または numpy_policy の .npz、policy_table の方策表）")
+    parser.add_argument("--env", default=None,
+                        help="環境 (モジュール:クラス)。省略時は観測の次元から選ぶ"
+                             "（6 → oni_double_env:ChaseEnv, 4 → ../test_intern の enemy_env:ChaseEnv）")
+    parser.add_argument("--env-dir", default=None, help="環境モジュールのあるフォルダ")
+    parser.add_argument("--episodes", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0, help="エピソード i の種は seed + i")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="ワーカープロセス数")
+    parser.add_argument("--stochastic", action="store_true", help="行動を方策の分布から引く（既定は決定的）")
+    parser.add_argument("--output", default=None, help="結果の JSON（省略時は表示のみ）")
+    parser.add_argument("--compare", default=None, help="比べる評価結果の JSON")
+    args = parser.parse_args(argv)
+
+    report = evaluate(args.model, args.env, args.env_dir, args.episodes, args.seed, args.workers,
+                      deterministic=not args.stochastic)
+    meta, results = report["meta"], report["results"]
+    print(f"{meta['env']} で {results['episodes']} エピソード ({meta['workers']} ワーカー, {meta['elapsed_s']:.1f} 秒)")
+    print(f"捕獲率 {results['capture_rate']:.1%}, 平均報酬 {results['mean_reward']:.2f}, "
+          f"平均ステップ数 {results['mean_steps']:.1f}")
+    if results["steps_to_capture"]:
+        p = results["steps_to_capture"]["percentiles"]
+        print(f"捕まえるまでのステップ数: p10 {p['p10']:.0f} / p50 {p['p50']:.0f} / p90 {p['p90']:.0f}")
+    latency = results["latency_us"]
+    print(f"推論時間: p50 {latency['p50']:.1f} us / p99 {latency['p99']:.1f} us ({latency['decisions']} 回)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"結果を {args.output} に書き出しました")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
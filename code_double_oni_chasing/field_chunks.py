@@ -0,0 +1,73 @@
+from collections import OrderedDict
+
+import pygame
+
+
+class ChunkCache:
+    """
+    広いマップの地形を chunk_px 四方のかたまり（チャンク）ごとに描いておき、見えている分だけ画面に貼る。
+
+    チャンクは初めて見えたときに描き、max_chunks を超えたら最も長く見ていないものから捨てる。
+    1フレームに貼るのは画面にかかるチャンクだけなので、描画の手間はマップの広さではなく画面の大きさで決まる。
+
+    :param world_size: マップ全体の大きさ (幅, 高さ) ピクセル
+    :param render: render(surface, origin, area) で、ワールド座標の area にかかる地形を surface に描く関数。
+        surface の左上がワールド座標の origin にあたる
+    """
+
+    def __init__(self, world_size, chunk_px, render, max_chunks=64):
+        self.world_rect = pygame.Rect((0, 0), world_size)
+        self.chunk_px = chunk_px
+        self.render = render
+        self.max_chunks = max_chunks
+        self._chunks = OrderedDict()
+
+    def chunk_rect(self, key):
+        cx, cy = key
+        return pygame.Rect(cx * self.chunk_px, cy * self.chunk_px, self.chunk_px, self.chunk_px).clip(self.world_rect)
+
+    def keys(self, area):
+        """ワールド座標の area にかかるチャンクの (列, 行) の一覧"""
+        area = area.clip(self.world_rect)
+        if not area.width or not area.height:
+            return []
+        c = self.chunk_px
+        return [(cx, cy) for cy in range(area.top // c, (area.bottom - 1) // c + 1)
+                for cx in range(area.left // c, (area.right - 1) // c + 1)]
+
+    def get(self, key):
+        surface = self._chunks.get(key)
+        if surface is not None:
+            self._chunks.move_to_end(key)
+            return surface
+        rect = self.chunk_rect(key)
+        surface = pygame.Surface(rect.size).convert()
+        self.render(surface, rect.topleft, rect)
+        self._chunks[key] = surface
+        if len(self._chunks) > self.max_chunks:
+            self._chunks.popitem(last=False)
+        return surface
+
+    def draw(self, surface, camera, area):
+        """
+        ワールド座標の area を、画面上では camera（画面の左上のワールド座標）だけずらした位置に描く
+        """
+        for key in self.keys(area):
+            rect = self.chunk_rect(key)
+            part = rect.clip(area)
+            surface.blit(self.get(key), (part.x - camera[0], part.y - camera[1]), part.move(-rect.x, -rect.y))
+
+    def redraw(self, area):
+        """地形が変わったとき（コインを取ったときなど）、描いてあるチャンクの area の部分だけ描き直す"""
+        for key in self.keys(area):
+            surface = self._chunks.get(key)
+            if surface is None:
+                continue  # まだ描いていないチャンクは、見えたときに今の地形で描かれる
+            rect = self.chunk_rect(key)
+            part = rect.clip(area)
+            surface.set_clip(part.move(-rect.x, -rect.y))
+            self.render(surface, rect.topleft, part)
+            surface.set_clip(None)
+
+    def __len__(self):
+        return len(self._chunks)
@@ -0,0 +1,69 @@
+import numpy as np
+
+# マスの種類
+GRASS = 0
+ROCK = 1
+WALL = 2  # 盤面の外周（番兵）
+
+
+class FieldGrid:
+    """
+    盤面の地形を、外周1マスを壁で囲んだ uint8 配列として持つ。
+
+    外周が壁なので、盤面の1マス外までは範囲チェックなしで1回の参照で通れるか判定できる。
+    同じメモリを bytearray（1マスずつの参照用）と NumPy 配列 cells（まとめて処理する用）の
+    両方から見られるようにしている。
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.stride = width + 2
+        self._buf = bytearray(self.stride * (height + 2))
+        # 外周込みの地形配列 (height+2, width+2)。cells[y+1, x+1] がマス (x, y)
+        self.cells = np.frombuffer(self._buf, dtype=np.uint8).reshape(height + 2, width + 2)
+        self.rock_count = 0
+        self.clear()
+
+    def clear(self):
+        """全マスを草に戻す"""
+        self.cells[:] = WALL
+        self.cells[1:-1, 1:-1] = GRASS
+        self.rock_count = 0
+
+    def load_layout(self, rock_layout):
+        """ステージの ROCK_LAYOUT 形式（1=岩）から地形を読み込む"""
+        self.clear()
+        self.cells[1:-1, 1:-1] = np.where(np.asarray(rock_layout) == 1, ROCK, GRASS)
+        self.rock_count = int(np.count_nonzero(self.cells == ROCK))
+
+    def load_cells(self, cells, rock_count):
+        """外周込みの地形（_buf と同じ並びのバイト列）をそのまま写す"""
+        self._buf[:] = cells
+        self.rock_count = rock_count
+
+    def index(self, x, y):
+        """マス (x, y) の bytearray 上の位置"""
+        return (y + 1) * self.stride + x + 1
+
+    def set_rock(self, x, y):
+        """岩を置く。新しく置けたら True"""
+        i = (y + 1) * self.stride + x + 1
+        if self._buf[i] == ROCK:
+            return False
+        self._buf[i] = ROCK
+        self.rock_count += 1
+        return True
+
+    def terrain(self, x, y):
+        """マス (x, y) の種類。盤面の1マス外までは WALL を返す"""
+        return self._buf[(y + 1) * self.stride + x + 1]
+
+    def is_passable(self, x, y):
+        """マス (x, y) に移動できるか。盤面の1マス外までは範囲チェック不要"""
+        return self._buf[(y + 1) * self.stride + x + 1] == GRASS
+
+    def rock_positions(self):
+        """岩の座標 (x, y) の集合"""
+        ys, xs = np.nonzero(self.cells == ROCK)
+        return {(int(x) - 1, int(y) - 1) for x, y in zip(xs, ys)}
@@ -0,0 +1,160 @@
+# flow_field.py
+from path_table import DIRECTIONS, STAY, to_passable
+
+
+class FlowField:
+    """
+    プレイヤーから外向きに1回だけ幅優先探索し、各マスに「プレイヤーへ向かう方向」を持たせる。
+
+    鬼は何体いても next_move() で自分のマスの方向を読むだけなので、追跡のコストは鬼の数に依存しない。
+    プレイヤーが隣のマスへ動いたときは作り直さず、距離が変わったマスだけを直す。
+    同じ長さの経路が複数あるときは oni.py の bfs と同じ一歩を選ぶ。
+    """
+
+    def __init__(self, grid):
+        passable = to_passable(grid)
+        self.height, self.width = passable.shape
+        # 外周1マスを壁にした1次元配列で持つ（隣のマスは添字に offset を足すだけ）
+        self.stride = self.width + 2
+        size = self.stride * (self.height + 2)
+        self.passable = [False] * size
+        for y in range(self.height):
+            for x in range(self.width):
+                self.passable[(y + 1) * self.stride + x + 1] = bool(passable[y, x])
+        self.offsets = [dy * self.stride + dx for dx, dy in DIRECTIONS]
+
+        self.INF = size  # どの距離よりも大きい値 = 到達不能
+        self.g = [self.INF] * size      # プレイヤーまでの距離
+        self.direction = [STAY] * size  # プレイヤーへ向かう方向 (DIRECTIONS の添字)
+        self.target = None
+
+        # 探索・修復用のバッファはここで確保して使い回す
+        # （縮む探索と伸びる探索でそれぞれ各マス高々数回しか積まれないので queue は size の数倍で足りる）
+        self._inf_row = [self.INF] * size
+        self._queue = [0] * (size * 5)
+        self._touched = []
+        self._mark = [0] * size  # 方向を更新済みかどうか（世代番号で毎回のクリアを省く）
+        self._generation = 0
+
+    def _index(self, pos):
+        return (pos[1] + 1) * self.stride + pos[0] + 1
+
+    def set_target(self, pos):
+        """プレイヤーの位置を更新する。隣のマスへの移動なら差分だけ直す"""
+        t = self._index(pos)
+        if t == self.target:
+            return
+        if self.target is None or not self.passable[t] or t - self.target not in self.offsets:
+            self._rebuild(t)
+            return
+        old = self.target
+        self.target = t
+        self._repair(old)
+
+    def next_move(self, pos, target):
+        """pos から target へ向かうときの次の座標 (x, y)"""
+        self.set_target(target)
+        k = self.direction[self._index(pos)]
+        if k == STAY:
+            return pos
+        dx, dy = DIRECTIONS[k]
+        return (pos[0] + dx, pos[1] + dy)
+
+    def distance(self, pos):
+        """pos から現在のプレイヤー位置までの歩数（到達できなければ None）"""
+        d = self.g[self._index(pos)]
+        return None if d >= self.INF else d
+
+    # --- 作り直し ---
+    def _rebuild(self, t):
+        g, queue, passable, offsets = self.g, self._queue, self.passable, self.offsets
+        g[:] = self._inf_row
+        self.target = t
+        if passable[t]:
+            g[t] = 0
+            queue[0] = t
+            head, tail = 0, 1
+            while head < tail:
+                u = queue[head]; head += 1
+                d = g[u] + 1
+                for o in offsets:
+                    v = u + o
+                    if passable[v] and g[v] > d:
+                        g[v] = d
+                        queue[tail] = v; tail += 1
+        self._refresh_directions(range(len(g)))
+
+    # --- 差分修復 ---
+    def _repair(self, old):
+        """
+        プレイヤーが old から隣の self.target へ動いたあとの距離を直す。
+
+        隣へ1マス動いただけなので、どのマスの距離も -1, 0, +1 のどれかしか変わらない。
+        1) 新しい位置から、距離が縮むマスだけをたどる幅優先探索で減った距離を確定させる。
+        2) 残りは「正しいか1小さい」ので、1歩近い隣を持たなくなったマスだけを +1 する。
+           最初に支えを失うのは元の位置 old だけで、+1 したマスの隣を順に確かめ直す。
+        """
+        g, queue, passable, offsets = self.g, self._queue, self.passable, self.offsets
+        touched = self._touched
+
+        # 1) 距離が縮むマス
+        t = self.target
+        g[t] = 0
+        touched.append(t)
+        queue[0] = t
+        head, tail = 0, 1
+        while head < tail:
+            u = queue[head]; head += 1
+            d = g[u] + 1
+            for o in offsets:
+                v = u + o
+                if passable[v] and g[v] > d:
+                    g[v] = d
+                    touched.append(v)
+                    queue[tail] = v; tail += 1
+
+        # 2) 距離が伸びるマス
+        queue[0] = old
+        head, tail = 0, 1
+        while head < tail:
+            u = queue[head]; head += 1
+            d = g[u]
+            if u == t:
+                continue
+            supported = False
+            for o in offsets:
+                if g[u + o] < d:
+                    supported = True
+                    break
+            if supported:
+                continue
+            g[u] = d + 1
+            touched.append(u)
+            for o in offsets:
+                v = u + o
+                if passable[v] and g[v] == d + 1:  # u に支えられていたかもしれない隣
+                    queue[tail] = v; tail += 1
+
+        # 距離が変わったマスとその隣だけ方向を更新する
+        self._generation += 1
+        gen, mark = self._generation, self._mark
+        dirty = []
+        for u in touched:
+            for v in (u, u + offsets[0], u + offsets[1], u + offsets[2], u + offsets[3]):
+                if mark[v] != gen:
+                    mark[v] = gen
+                    dirty.append(v)
+        touched.clear()
+        self._refresh_directions(dirty)
+
+    def _refresh_directions(self, cells):
+        """cells の各マスについて、距離が1減る隣のうち探索順で最初の方向を記録する"""
+        g, direction, passable, INF = self.g, self.direction, self.passable, self.INF
+        o0, o1, o2, o3 = self.offsets
+        for v in cells:
+            d = g[v] - 1
+            if not passable[v] or d < 0 or d + 1 >= INF: direction[v] = STAY
+            elif g[v + o0] == d: direction[v] = 0
+            elif g[v + o1] == d: direction[v] = 1
+            elif g[v + o2] == d: direction[v] = 2
+            else: direction[v] = 3
@@ -0,0 +1,170 @@
+import random
+
+import numpy as np
+
+# ゲームのルールの定数（時間はミリ秒）
+MOVE_INTERVAL_NORMAL, MOVE_INTERVAL_SLOW = 150, 600  # プレイヤーの移動間隔（草むらの上では遅くなる）
+ONI_MOVE_INTERVAL = 400
+COINS_FOR_ROPE = 15  # この枚数を集めるとロープが下りてくる
+FRAME_MS = 1000 / 60
+ROPE_SPEED = 8  # ロープが 1フレーム(60FPS) あたりに伸びるピクセル数
+ONI_COUNT = 2
+
+# 移動の向き（鬼の行動番号と同じ: 0=上, 1=下, 2=左, 3=右）
+UP, DOWN, LEFT, RIGHT = 0, 1, 2, 3
+MOVES = [(0, -1), (0, 1), (-1, 0), (1, 0)]
+
+# 状態
+PLAYING, CAUGHT, CLEAR = "playing", "caught", "clear"
+
+
+class GameState:
+    """
+    oikakekko_game.py のプレイ中のルールだけを取り出した、pygame に依存しないゲーム本体。
+
+    step(inputs, dt) で dt ミリ秒だけ時間を進める（pygame 版では1フレームごとに呼ぶ）。
+    描画や入力は呼び出し側が受け持つので、ヘッドレスで実時間より速くシミュレーションできる。
+
+    :param rock_layout, bush_layout, coin_layout: ステージの配置 (1=あり)
+    :param oni_controller: 鬼の番になったときに呼ばれ、鬼の次の位置の一覧を返す関数 (GameState を受け取る)。
+        None なら鬼は動かない
+    :param cell_size: ロープの長さ（ピクセル）を決める1マスの大きさ
+    """
+
+    def __init__(self, rock_layout, bush_layout, coin_layout, oni_controller=None, rope_pos=None,
+                 cell_size=60, seed=None):
+        self.height, self.width = len(rock_layout), len(rock_layout[0])
+        self.rock = [[v == 1 for v in row] for row in rock_layout]
+        self.bush = [[v == 1 for v in row] for row in bush_layout]
+        self.coin_layout = coin_layout
+        self.rope_pos = rope_pos or (self.width // 2 - 1, self.height // 2 - 1)
+        self.rope_target = self.rope_pos[1] * cell_size + cell_size // 2
+        self.oni_controller = oni_controller
+        self.rng = random.Random(seed)
+        self.reset()
+
+    @classmethod
+    def from_stage(cls, stage_module, **kwargs):
+        """stage_info の StageN モジュールから作る"""
+        return cls(stage_module.ROCK_LAYOUT, stage_module.BUSH_LAYOUT, stage_module.COIN_LAYOUT, **kwargs)
+
+    def reset(self):
+        self.player = self.rope_pos
+        self.coins = {(x, y) for y, row in enumerate(self.coin_layout) for x, v in enumerate(row) if v == 1}
+        self.coin_count = 0
+        self.rope_length = None  # ロープが出ていなければ None、出ていれば今の長さ（ピクセル）
+        self.status = PLAYING
+        self.time = 0.0
+        self.last_move_time = self.last_oni_move_time = float("-inf")
+
+        # 鬼: 岩でもプレイヤーの近くでもないマスに重ならないように置く
+        occupied = {self.player} | {(x, y) for y in range(self.height) for x in range(self.width) if self.rock[y][x]}
+        self.onis = []
+        for _ in range(ONI_COUNT):
+            while True:
+                pos = (self.rng.randint(0, self.width - 1), self.rng.randint(0, self.height - 1))
+                if pos not in occupied and abs(pos[0] - self.player[0]) + abs(pos[1] - self.player[1]) >= 3:
+                    self.onis.append(pos); occupied.add(pos); break
+
+    def snapshot(self):
+        """今の状態をまるごと写したもの（restore で戻せる）。リプレイのキーフレームに使う"""
+        return (self.player, frozenset(self.coins), self.coin_count, self.rope_length, self.status, self.time,
+                self.last_move_time, self.last_oni_move_time, tuple(self.onis), self.rng.getstate())
+
+    def restore(self, snapshot):
+        (self.player, coins, self.coin_count, self.rope_length, self.status, self.time,
+         self.last_move_time, self.last_oni_move_time, onis, rng_state) = snapshot
+        self.coins, self.onis = set(coins), list(onis)
+        self.rng.setstate(rng_state)
+
+    # --- ルール ---
+    def is_free(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height and not self.rock[y][x]
+
+    def apply_oni_action(self, pos, action):
+        """鬼の行動番号を次の位置にする（外や岩には動けない）"""
+        dx, dy = MOVES[int(action)]
+        x, y = pos[0] + dx, pos[1] + dy
+        return (x, y) if self.is_free(x, y) else tuple(pos)
+
+    @property
+    def rope_finished(self):
+        return self.rope_length is not None and self.rope_length >= self.rope_target
+
+    def observation(self):
+        """学習済みモデルへの入力 [鬼1x, 鬼1y, 鬼2x, 鬼2y, プレイヤーx, プレイヤーy]"""
+        return np.array([*self.onis[0], *self.onis[1], *self.player])
+
+    def step(self, inputs, dt):
+        """
+        dt ミリ秒だけゲームを進める。
+
+        :param inputs: 押されている移動の向き。優先順に並べた列（pygame 版では W, S, A, D の順）か1つの向き、または None
+        :return: このステップで起きたことの一覧 ("move", "coin", "rope", "clear", "oni_move", "caught")
+        """
+        events = []
+        if self.status != PLAYING:
+            return events
+        self.time += dt
+        now = self.time
+
+        # プレイヤーの移動: 押されている向きのうち盤面の内側に出るものを優先順に選び、岩でなければ動く
+        px, py = self.player
+        interval = MOVE_INTERVAL_SLOW if self.bush[py][px] else MOVE_INTERVAL_NORMAL
+        if inputs is not None and now - self.last_move_time > interval:
+            for move in ((inputs,) if isinstance(inputs, (int, np.integer)) else inputs):
+                dx, dy = MOVES[move]
+                nx, ny = px + dx, py + dy
+                if 0 <= nx < self.width and 0 <= ny < self.height:
+                    if not self.rock[ny][nx]:
+                        self.player = (nx, ny); self.last_move_time = now; events.append("move")
+                    break
+
+        if self.player in self.coins:
+            self.coins.remove(self.player); self.coin_count += 1; events.append("coin")
+            if self.coin_count >= COINS_FOR_ROPE and self.rope_length is None:
+                self.rope_length = 0; events.append("rope")
+        if self.rope_finished and self.player == self.rope_pos:
+            self.status = CLEAR; events.append("clear")
+        if self.rope_length is not None:
+            self.rope_length = min(self.rope_target, self.rope_length + ROPE_SPEED * dt / FRAME_MS)
+
+        if self.oni_controller is not None and now - self.last_oni_move_time > ONI_MOVE_INTERVAL:
+            self.onis = [tuple(pos) for pos in self.oni_controller(self)]
+            self.last_oni_move_time = now; events.append("oni_move")
+        # 元のゲームと同じく、クリアと同じフレームに捕まった場合は捕まった扱い
+        if self.player in self.onis:
+            self.status = CAUGHT; events.append("caught")
+        return events
+
+    def time_to_next_event(self):
+        """
+        次に状態が変わりうるまでの時間（ミリ秒）。
+
+        ヘッドレスで動かすときは step(inputs, time_to_next_event()) とすれば、何も起きないフレームを飛ばせる。
+        """
+        px, py = self.player
+        interval = MOVE_INTERVAL_SLOW if self.bush[py][px] else MOVE_INTERVAL_NORMAL
+        waits = [self.last_move_time + interval - self.time + 1]
+        if self.oni_controller is not None:
+            waits.append(self.last_oni_move_time + ONI_MOVE_INTERVAL - self.time + 1)
+        if self.rope_length is not None and not self.rope_finished:
+            waits.append((self.rope_target - self.rope_length) / ROPE_SPEED * FRAME_MS)
+        return max(1.0, min(waits))
+
+
+# --- 鬼の動かし方 ---
+def policy_controller(predict):
+    """predict(観測) → 2体分の行動番号 を使って鬼を動かす（学習済みモデル用）"""
+    def control(state):
+        actions = predict(state.observation())
+        return [state.apply_oni_action(pos, action) for pos, action in zip(state.onis, actions)]
+    return control
+
+
+def pursuit_controller(get_pursuit):
+    """get_pursuit() が返す PathTable / FlowField の最短経路で鬼を動かす"""
+    def control(state):
+        pursuit = get_pursuit()
+        return [pursuit.next_move(pos, state.player) for pos in state.onis]
+    return control
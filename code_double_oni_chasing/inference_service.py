@@ -0,0 +1,164 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from numpy_policy import NumpyPolicy
+from policy_table import PolicyTable, TABLE_SUFFIX
+
+
+def load_policy(model_path, device="cpu"):
+    """方策表なら PolicyTable、.npz なら NumpyPolicy（torch を読み込まない）、それ以外は PPO.load で読み込む"""
+    if model_path.endswith(TABLE_SUFFIX):
+        return PolicyTable(model_path)
+    if model_path.endswith(".npz"):
+        return NumpyPolicy(model_path)
+    from stable_baselines3 import PPO
+    return PPO.load(model_path, device=device)
+
+
+# 書き出した方策表・.npz の更新時刻が zip よりこれ以上古ければ、書き出した後に学習し直したとみなす
+# （git clone 直後は同じモデルでも数秒ずれることがあるので、少し余裕を持たせる）
+STALE_EXPORT_S = 60
+
+
+def find_model(base_path, exts=(TABLE_SUFFIX, ".npz", ".zip")):
+    """
+    base_path + exts のうち最初にあるものを返す（どれもなければ最後の拡張子のパス）。
+
+    方策表と .npz は zip から書き出したものなので、zip より古いものは使わない
+    （学習し直して zip だけ新しくなったのに、古い方策のまま動くのを防ぐ）。
+    """
+    zip_path = base_path + ".zip"
+    zip_mtime = os.path.getmtime(zip_path) if os.path.exists(zip_path) else None
+    for ext in exts:
+        path = base_path + ext
+        if not os.path.exists(path):
+            continue
+        if ext != ".zip" and zip_mtime is not None and os.path.getmtime(path) < zip_mtime - STALE_EXPORT_S:
+            print(f"{path} は {zip_path} より古いので使いません（書き出し直してください）")
+            continue
+        return path
+    return base_path + exts[-1]
+
+
+class BatchedPolicyService:
+    """
+    1つの方策モデルを共有し、複数の鬼・複数のゲームからの推論要求をまとめて1回で計算する。
+
+    submit() は観測を受け取ってすぐ Future を返す。推論スレッドは最初の要求が来てから
+    max_wait 秒まで（または max_batch 件たまるまで）要求を集め、1回の forward で全員分の行動を返す。
+    """
+
+    def __init__(self, model_path, max_batch=256, max_wait=0.002, device="cpu"):
+        self.model = load_policy(model_path, device)
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._requests = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="oni_inference", daemon=True)
+        self._thread.start()
+
+    def submit(self, obs, deterministic=True):
+        """観測1つ分の推論を依頼する。結果は Future.result() で受け取る"""
+        if self._closed:
+            raise RuntimeError("推論サービスは終了しています")
+        future = Future()
+        self._requests.put((np.asarray(obs), deterministic, future))
+        return future
+
+    def predict(self, obs, deterministic=True, timeout=None):
+        """model.predict と同じ感覚で使える同期版。行動だけを返す"""
+        return self.submit(obs, deterministic).result(timeout)
+
+    def close(self):
+        self._closed = True
+        self._requests.put(None)
+        self._thread.join()
+
+    def _collect(self, first):
+        """first に続く要求を、締め切りか上限件数まで集める"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._requests.put(None)  # 終了は今のバッチを返してから
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._requests.get()
+            if first is None:
+                break
+            batch = self._collect(first)
+            # deterministic の指定ごとに1回ずつ forward する
+            for deterministic in (True, False):
+                group = [item for item in batch if item[1] == deterministic]
+                if not group:
+                    continue
+                try:
+                    obs = np.stack([item[0] for item in group])
+                    actions, _ = self.model.predict(obs, deterministic=deterministic)
+                except Exception as e:
+                    for _, _, future in group:
+                        future.set_exception(e)
+                    continue
+                for (_, _, future), action in zip(group, actions):
+                    future.set_result(action)
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_service(model_path, **kwargs):
+    """モデルパスごとに1つだけ BatchedPolicyService を作って使い回す"""
+    key = os.path.abspath(model_path)
+    with _services_lock:
+        if key not in _services:
+            _services[key] = BatchedPolicyService(model_path, **kwargs)
+        return _services[key]
+
+
+def main():
+    from oni_double_env import ChaseEnv
+
+    print("--- 推論サービスのテスト（ヘッドレスのゲームを複数スレッドで同時に動かす） ---")
+    service = get_service(os.path.join(os.path.dirname(os.path.abspath(__file__)), "model", "oni_double_model.zip"))
+    n_sessions, n_steps = 64, 100
+
+    def run_session(predict):
+        env = ChaseEnv()
+        obs, _ = env.reset()
+        for _ in range(n_steps):
+            obs, _, terminated, truncated, _ = env.step(predict(obs))
+            if terminated or truncated:
+                obs, _ = env.reset()
+
+    for name, predict in [("直接 model.predict", lambda o: service.model.predict(o, deterministic=True)[0]),
+                          ("BatchedPolicyService", service.predict)]:
+        threads = [threading.Thread(target=run_session, args=(predict,)) for _ in range(n_sessions)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {n_sessions * n_steps / elapsed:,.0f} 推論/秒 ({n_sessions} セッション)")
+    service.close()
+
+
+if __name__ == "__main__":
+    main()
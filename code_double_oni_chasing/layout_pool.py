@@ -0,0 +1,262 @@
+import itertools
+import os
+import queue
+import random
+import threading
+import time
+
+import numpy as np
+
+from field_grid import FieldGrid, GRASS, ROCK, WALL
+from oni_double_env import ChaseEnv, GRID_WIDTH, GRID_HEIGHT, rock_range
+from path_table import PathTable, to_passable
+
+
+def rock_count_pmf(width=GRID_WIDTH, height=GRID_HEIGHT):
+    """
+    ChaseEnv._init_field の岩配置ループが生む「岩の個数」の分布を厳密に計算する。
+
+    ループは毎回 random.randint(lo, hi) を引き直すため（10x10 では 5..10）、岩がk個のときに止まる確率は
+    (k-lo+1)/(hi-lo+1)、プレイヤー位置・既存の岩以外のマスを引いて岩が増える確率は (マス数-1-k)/マス数。
+    :return: 岩の個数 lo..hi に対応する確率の配列
+    """
+    n_cells = width * height
+    lo, hi = rock_range(width, height)
+    pmf = np.zeros(hi - lo + 1)
+    reach = 1.0  # 岩がk個の状態に到達する確率
+    for k in range(lo, hi + 1):
+        stop = (k - lo + 1) / (hi - lo + 1)
+        grow = (1 - stop) * (n_cells - 1 - k) / n_cells
+        p_stop = stop / (stop + grow)
+        pmf[k - lo] = reach * p_stop
+        reach *= 1 - p_stop
+    return pmf
+
+
+class LayoutSampler:
+    """
+    ChaseEnv の初期配置（岩と2体の鬼）を NumPy でまとめて引く。分布は ChaseEnv._init_field と同じ。
+
+    岩の個数は rock_count_pmf から引き、プレイヤー初期位置以外のマスから重複なしで選ぶ。
+    鬼は岩でなくプレイヤーから3マス以上離れたマスから、重複しない2マスを一様に選ぶ。
+    """
+
+    def __init__(self, width=GRID_WIDTH, height=GRID_HEIGHT):
+        self.width, self.height = width, height
+        self.rock_min, self.rock_max = rock_range(width, height)
+        self.rock_pmf = rock_count_pmf(width, height)
+        self.player_start = (width // 2, height // 2)
+        # プレイヤー初期位置から3マス以上離れたマス（鬼の出現候補）
+        xs, ys = np.meshgrid(np.arange(width), np.arange(height))
+        far = np.abs(xs - self.player_start[0]) + np.abs(ys - self.player_start[1]) >= 3
+        self._spawn_mask = far.reshape(-1)
+        self._player_cell = self.player_start[1] * width + self.player_start[0]
+
+    def sample(self, rng, k):
+        """
+        :param rng: np.random.Generator
+        :return: (岩のマス (k, 幅*高さ) の bool 配列, 鬼2体のマス番号 y*幅+x (k, 2))
+        """
+        n_cells = self.width * self.height
+        rows = np.arange(k)[:, None]
+
+        # 岩: 個数を分布から引き、プレイヤー位置以外のマスから重複なしで選ぶ
+        counts = rng.choice(len(self.rock_pmf), size=k, p=self.rock_pmf) + self.rock_min
+        keys = rng.random((k, n_cells))
+        keys[:, self._player_cell] = np.inf
+        order = np.argsort(keys, axis=1)[:, :self.rock_max]
+        rocks = np.zeros((k, n_cells), dtype=bool)
+        rocks[rows, order] = np.arange(self.rock_max)[None, :] < counts[:, None]
+
+        # 鬼: 岩でなく3マス以上離れたマスから、重複しない2マスを一様に選ぶ
+        keys = rng.random((k, n_cells))
+        keys[rocks | ~self._spawn_mask] = np.inf
+        # キーの一番小さいマスと2番目に小さいマス（1行100マス程度では argpartition より argmin 2回のほうが速い）
+        first = keys.argmin(axis=1)
+        keys[rows[:, 0], first] = np.inf
+        return rocks, np.stack([first, keys.argmin(axis=1)], axis=1)
+
+
+class LayoutPool:
+    """
+    ChaseEnv の初期配置を batch_size 個ずつ前もって作っておき、reset のたびに1個ずつ渡す。
+
+    reset でやることは地形のバイト列の写しと鬼の座標の代入だけになる。
+    次のまとまりはバックグラウンドのスレッドで prefetch 個先まで作っておく（乱数と並べ替えの間は GIL が外れる）。
+    複数の環境から take してよい。
+
+    :param background: False ならスレッドを使わず、使い切ったときにその場で作る
+    """
+
+    def __init__(self, width=GRID_WIDTH, height=GRID_HEIGHT, batch_size=4096, seed=None, prefetch=2,
+                 background=True):
+        self.sampler = LayoutSampler(width, height)
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._batch, self._next = [], 0
+        self._closed = False
+        self._queue = None
+        if background:
+            self._queue = queue.Queue(maxsize=prefetch)
+            threading.Thread(target=self._produce, daemon=True).start()
+
+    def _make_batch(self):
+        """
+        :return: [(外周込みの地形 bytes, 岩の個数, 鬼の座標 [[x, y], [x, y]], プレイヤー座標 [x, y], 歩数表), ...]
+            歩数表はランダムな岩配置では作らない（None。ChaseEnv はユークリッド距離で報酬を決める）
+        """
+        width, height, k = self.sampler.width, self.sampler.height, self.batch_size
+        rocks, spawns = self.sampler.sample(self.rng, k)
+        # FieldGrid と同じ、外周1マスを壁で囲んだ並び
+        grids = np.full((k, height + 2, width + 2), WALL, dtype=np.uint8)
+        grids[:, 1:-1, 1:-1] = np.where(rocks, ROCK, GRASS).reshape(k, height, width)
+        counts = rocks.sum(axis=1).tolist()
+        enemies = np.stack([spawns % width, spawns // width], axis=2).tolist()
+        player = list(self.sampler.player_start)
+        return [(grids[i].tobytes(), counts[i], enemies[i], player, None) for i in range(k)]
+
+    def _produce(self):
+        while not self._closed:
+            self._queue.put(self._make_batch())
+
+    def take(self):
+        """配置を1つ取り出す。座標のリストは他の環境と共有しているので、写してから使うこと"""
+        with self._lock:
+            if self._next >= len(self._batch):
+                self._batch = self._queue.get() if self._queue is not None else self._make_batch()
+                self._next = 0
+            layout = self._batch[self._next]
+            self._next += 1
+        return layout
+
+    def close(self):
+        """バックグラウンドのスレッドを止める"""
+        self._closed = True
+        if self._queue is not None:
+            try:
+                self._queue.get_nowait()  # put で待っているスレッドを起こす
+            except queue.Empty:
+                pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(width=GRID_WIDTH, height=GRID_HEIGHT):
+    """
+    プロセス内で共有する LayoutPool を返す（盤面の大きさごとに1つ）。
+
+    種は組み込みの random から取るので、random.seed で揃えれば同じ配置の列になる。
+    fork で作った子プロセスは親のスレッドを持たないので、プロセスごとに作り直す。
+    """
+    key = (os.getpid(), width, height)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = LayoutPool(width, height, seed=random.getrandbits(64))
+        return _pools[key]
+
+
+class StageLayouts:
+    """
+    stage_info のステージの岩配置で ChaseEnv の初期配置を作る（LayoutPool と同じく take で1個ずつ渡す）。
+
+    地形のバイト列、全マス間の歩数表（PathTable）、プレイヤーの開始マスごとの鬼を置けるマスは最初に1回だけ作っておき、
+    take ではステージと鬼の2マスを引くだけにする。ステージには壁や通路があるので、ChaseEnv は
+    ユークリッド距離ではなく歩数表で「近づいたか」を判定する（壁の向こうへ寄っても近づいたことにならない）。
+
+    :param stages: StageN モジュールのリスト（大きさはすべて同じであること）
+    :param weights: ステージを選ぶ割合（省略時は同じ割合）
+    :param random_start: True ならプレイヤーの開始マスを岩以外から一様に選ぶ。
+        False ならゲームと同じロープの位置 (幅//2-1, 高さ//2-1) から始める
+    """
+
+    def __init__(self, stages, weights=None, random_start=True, seed=None):
+        sizes = {(len(stage.ROCK_LAYOUT[0]), len(stage.ROCK_LAYOUT)) for stage in stages}
+        if len(sizes) != 1:
+            raise ValueError(f"ステージの大きさがそろっていません: {sorted(sizes)}")
+        (self.width, self.height), = sizes
+        self.stages = list(stages)
+        self.rng = random.Random(seed)
+        self._cum_weights = list(itertools.accumulate(weights or [1] * len(stages)))
+
+        grid = FieldGrid(self.width, self.height)
+        free = [(x, y) for y in range(self.height) for x in range(self.width)]
+        self._layouts = []  # ステージごとの (地形 bytes, 岩の個数, [(プレイヤー座標, 鬼を置けるマス), ...], 歩数表)
+        for stage in stages:
+            grid.load_layout(stage.ROCK_LAYOUT)
+            path_dist = PathTable.build(to_passable(stage.ROCK_LAYOUT)).dist.reshape(-1).tolist()
+            cells = [[x, y] for x, y in free if grid.is_passable(x, y)]
+            starts = cells if random_start else [[self.width // 2 - 1, self.height // 2 - 1]]
+            # 鬼は岩でなくプレイヤーから3マス以上離れたマス（ChaseEnv._init_field と同じ条件）
+            spawns = [(start, [c for c in cells if abs(c[0] - start[0]) + abs(c[1] - start[1]) >= 3])
+                      for start in starts]
+            self._layouts.append((grid.cells.tobytes(), grid.rock_count, spawns, path_dist))
+
+    def take(self):
+        cells, rock_count, spawns, path_dist = self.rng.choices(self._layouts, cum_weights=self._cum_weights)[0]
+        player, candidates = self.rng.choice(spawns)
+        return cells, rock_count, self.rng.sample(candidates, 2), player, path_dist
+
+
+def parse_stage_mix(spec):
+    """
+    "1,2,3" や "1:2,3:1"（ステージ番号:重み）の形の文字列を StageN モジュールと重みのリストにする
+    """
+    from oni_stage_env import STAGES
+    stages, weights = [], []
+    for item in spec.split(","):
+        number, _, weight = item.strip().partition(":")
+        if not number.isdigit() or not 1 <= int(number) <= len(STAGES):
+            raise ValueError(f"ステージ番号は 1〜{len(STAGES)} で指定してください: {item!r}")
+        stages.append(STAGES[int(number) - 1])
+        weights.append(float(weight) if weight else 1.0)
+    return stages, weights
+
+
+class StageLayoutChaseEnv(ChaseEnv):
+    """
+    ゲームのステージの岩配置で学習する ChaseEnv（ルール・観測・報酬は ChaseEnv のまま）。
+    parallel_learn.py なら --stages 1,2,3 で使える。
+
+    :param stages: parse_stage_mix の形の文字列
+    """
+
+    def __init__(self, human_control=False, stages="1,2,3", random_start=True):
+        stage_modules, weights = parse_stage_mix(stages)
+        layouts = StageLayouts(stage_modules, weights, random_start=random_start, seed=random.getrandbits(64))
+        super().__init__(human_control, layouts.width, layouts.height, layout_pool=layouts)
+
+
+class PooledChaseEnv(ChaseEnv):
+    """
+    初期配置を get_pool() から受け取る ChaseEnv。
+    parallel_learn.py なら --env layout_pool:PooledChaseEnv で使える。
+    """
+
+    def __init__(self, human_control=False, width=GRID_WIDTH, height=GRID_HEIGHT):
+        super().__init__(human_control, width, height, layout_pool=get_pool(width, height))
+
+
+def main():
+    print("--- ChaseEnv.reset の速度比較（その場で配置 / LayoutPool） ---")
+    n_resets = 20000
+    for name, env in [("ChaseEnv", ChaseEnv()), ("PooledChaseEnv", PooledChaseEnv())]:
+        env.reset()
+        start = time.perf_counter()
+        for _ in range(n_resets):
+            env.reset()
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {elapsed / n_resets * 1e6:.1f} us/reset")
+
+    # 岩の個数の分布が ChaseEnv のループと同じか
+    pool = LayoutPool(batch_size=n_resets, seed=0, background=False)
+    counts = np.bincount([pool.take()[1] for _ in range(n_resets)], minlength=pool.sampler.rock_max + 1)
+    observed = counts[pool.sampler.rock_min:] / n_resets
+    for k, (p, q) in enumerate(zip(pool.sampler.rock_pmf, observed), start=pool.sampler.rock_min):
+        print(f"岩 {k} 個: 理論 {p:.3f} / 実測 {q:.3f}")
+
+
+if __name__ == "__main__":
+    main()
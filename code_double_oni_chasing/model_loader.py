@@ -0,0 +1,41 @@
+import threading
+import time
+
+
+class BackgroundLoader:
+    """
+    重い読み込み（学習済みモデルなど）を別スレッドで実行し、結果をメインループに渡す。
+
+    作った時点で読み込みが始まる。メインループは ready() で完了を確かめながら描画を続け、
+    結果が本当に必要になったところで result() を呼ぶ（終わっていなければそこでだけ待つ）。
+    """
+
+    def __init__(self, load_fn, *args, name="model_loader"):
+        self.value = None
+        self.error = None
+        self.elapsed = None  # 読み込みにかかった秒数
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(load_fn, args), name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self, load_fn, args):
+        start = time.perf_counter()
+        try:
+            self.value = load_fn(*args)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.elapsed = time.perf_counter() - start
+            self._done.set()
+
+    def ready(self):
+        """読み込みが終わっていれば True（失敗した場合も True）"""
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """読み込みの完了を待って結果を返す。読み込みで例外が出ていればそれを送出する"""
+        if not self._done.wait(timeout):
+            raise TimeoutError("読み込みが時間内に終わりませんでした")
+        if self.error is not None:
+            raise self.error
+        return self.value
@@ -0,0 +1,131 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ACTIVATIONS = {
+    "Tanh": np.tanh,
+    "ReLU": lambda x: np.maximum(x, 0),
+}
+
+
+def export_policy(model_path, out_path=None):
+    """
+    PPO の zip から方策ネット（行動を決める部分）の重みだけを取り出して .npz に保存する。
+
+    書き出しのときだけ stable_baselines3 / torch を使う。価値ネットはゲームでは使わないので含めない。
+    :param model_path: PPO.save で保存したモデル (例 model/oni_double_model.zip)
+    :param out_path: 保存先。省略時は拡張子を .npz にしたパス
+    :return: 保存したパス
+    """
+    from gymnasium import spaces
+    from stable_baselines3 import PPO
+
+    model = PPO.load(model_path, device="cpu")
+    policy = model.policy
+    if not isinstance(model.action_space, spaces.MultiDiscrete):
+        raise ValueError(f"MultiDiscrete 以外の行動空間には対応していません: {model.action_space}")
+
+    state = {k: v.detach().cpu().numpy().astype(np.float32) for k, v in policy.state_dict().items()}
+    arrays = {}
+    # mlp_extractor.policy_net は Linear と活性化関数が交互に並ぶので、Linear の番号順に取り出す
+    layer_ids = sorted(int(k.split(".")[2]) for k in state
+                       if k.startswith("mlp_extractor.policy_net.") and k.endswith(".weight"))
+    for i, layer_id in enumerate(layer_ids):
+        arrays[f"w{i}"] = state[f"mlp_extractor.policy_net.{layer_id}.weight"].T
+        arrays[f"b{i}"] = state[f"mlp_extractor.policy_net.{layer_id}.bias"]
+    arrays["w_out"] = state["action_net.weight"].T
+    arrays["b_out"] = state["action_net.bias"]
+
+    out_path = out_path or os.path.splitext(model_path)[0] + ".npz"
+    np.savez(out_path,
+             n_hidden=len(layer_ids),
+             activation=policy.activation_fn.__name__,
+             nvec=model.action_space.nvec,
+             **arrays)
+    return out_path
+
+
+class NumpyPolicy:
+    """
+    export_policy で書き出した .npz だけで動く方策。torch も stable_baselines3 も読み込まない。
+
+    predict() は PPO.predict と同じく (行動, None) を返し、観測1つでもバッチ (N, 6) でも受け付ける。
+    """
+
+    def __init__(self, path, seed=None):
+        with np.load(path) as data:
+            n_hidden = int(data["n_hidden"])
+            self.layers = [(data[f"w{i}"], data[f"b{i}"]) for i in range(n_hidden)]
+            self.w_out, self.b_out = data["w_out"], data["b_out"]
+            self.activation = ACTIVATIONS[str(data["activation"])]
+            self.nvec = data["nvec"].astype(np.int64)
+        self._splits = np.cumsum(self.nvec)[:-1]
+        self.rng = np.random.default_rng(seed)
+
+    def logits(self, obs):
+        """観測 (N, 6) → 行動ごとのロジット (N, sum(nvec))"""
+        x = np.asarray(obs, dtype=np.float32)
+        for w, b in self.layers:
+            x = self.activation(x @ w + b)
+        return x @ self.w_out + self.b_out
+
+    def predict(self, obs, deterministic=True):
+        obs = np.asarray(obs)
+        single = obs.ndim == 1
+        logits = self.logits(obs.reshape(1, -1) if single else obs)
+        actions = np.empty((len(logits), len(self.nvec)), dtype=np.int64)
+        for i, part in enumerate(np.split(logits, self._splits, axis=1)):
+            if deterministic:
+                actions[:, i] = part.argmax(axis=1)
+            else:
+                # 各鬼の行動をソフトマックス分布から引く（Gumbel-max）
+                gumbel = -np.log(-np.log(self.rng.random(part.shape)))
+                actions[:, i] = (part + gumbel).argmax(axis=1)
+        return (actions[0] if single else actions), None
+
+
+def verify(model_path, npz_path, n_samples=1_000_000, batch_size=65536, seed=0):
+    """PPO.predict と NumpyPolicy.predict の決定的な行動が一致するかをランダムな観測で確かめる"""
+    from stable_baselines3 import PPO
+
+    model = PPO.load(model_path, device="cpu")
+    policy = NumpyPolicy(npz_path)
+    rng = np.random.default_rng(seed)
+    low, high = model.observation_space.low, model.observation_space.high
+    mismatches = 0
+    for start in range(0, n_samples, batch_size):
+        n = min(batch_size, n_samples - start)
+        obs = rng.integers(low, high + 1, size=(n, len(low))).astype(np.int32)
+        expected, _ = model.predict(obs, deterministic=True)
+        actual, _ = policy.predict(obs, deterministic=True)
+        mismatches += int(np.any(expected != actual, axis=1).sum())
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PPO の方策を NumPy だけで動く .npz に書き出す")
+    parser.add_argument("model", nargs="?", default=os.path.join(BASE_DIR, "model", "oni_double_model.zip"))
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--samples", type=int, default=1_000_000, help="PPO.predict と照合する観測の数")
+    args = parser.parse_args()
+
+    out_path = export_policy(args.model, args.out)
+    print(f"{out_path} に書き出しました ({os.path.getsize(out_path) / 1024:.0f} KB)")
+
+    mismatches = verify(args.model, out_path, args.samples)
+    print(f"PPO.predict との照合: {args.samples:,} 件中 {mismatches} 件不一致")
+
+    policy = NumpyPolicy(out_path)
+    obs = np.array([1, 2, 8, 8, 5, 5])
+    start = time.perf_counter()
+    for _ in range(10000):
+        policy.predict(obs)
+    print(f"観測1つの推論: {(time.perf_counter() - start) / 10000 * 1e6:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
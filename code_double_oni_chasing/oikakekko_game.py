@@ -2,26 +2,71 @@ import pygame
 import sys
 import random
 import os
-import numpy as np
 import math
 import json
-from stable_baselines3 import PPO
+import argparse
+from inference_service import find_model, get_service
+from model_loader import BackgroundLoader
+from policy_table import PolicyTable, TABLE_SUFFIX
+from asset_atlas import Sprite, load_atlas, scale_to, scale_by, fit_width, fit_height
+from transform_cache import TransformCache, HudCache
+from particles import LeafParticles
+from game_state import GameState, policy_controller, pursuit_controller, UP, DOWN, LEFT, RIGHT, PLAYING, CAUGHT, CLEAR
+from replay import Replay, ReplayRecorder, ReplayPlayer, TICK_MS, MAX_TICKS_PER_FRAME
+from path_table import PathTableCache, ready_table, to_passable
+from pursuit_solver import solved_path
+from flow_field import FlowField
+from field_chunks import ChunkCache
+from stage_generator import generate_stage
 
 # stage_infoフォルダのパスをシステムパスに追加
 sys.path.append(os.path.join(os.path.dirname(__file__), 'stage_info'))
 from stage_info import Stage1, Stage2, Stage3
 
+# コマンドライン: --replay でリプレイファイルを再生する（--speed で再生速度の倍率）
+# --map-size N を付けると、どのステージを選んでも N x N の自動生成マップで遊ぶ（--map-seed で配置を変える）
+# --optimal-oni を付けると、pursuit_solver.py で解いたステージでは鬼が最適に追いかける
+# --pursuit-oni を付けると、モデルがないとき（とモデルが学習していない大きさのマップ）も鬼が最短経路で追いかける。
+# 付けなければ元のゲームと同じく、その場合の鬼は動かない
+parser = argparse.ArgumentParser()
+parser.add_argument("--replay", default=None)
+parser.add_argument("--speed", type=float, default=1.0)
+parser.add_argument("--map-size", type=int, default=None)
+parser.add_argument("--map-seed", type=int, default=0)
+parser.add_argument("--optimal-oni", action="store_true")
+parser.add_argument("--pursuit-oni", action="store_true")
+args = parser.parse_args()
+
 # 初期化
 pygame.init()
 
-# グリッド設定
+# グリッド設定（GRID_WIDTH, GRID_HEIGHT は画面に映るマス数。マップの大きさはステージごとに game.width, game.height）
 GRID_SIZE = 60
 GRID_WIDTH = 10
 GRID_HEIGHT = 10
 WIDTH = GRID_WIDTH * GRID_SIZE
 HEIGHT = GRID_HEIGHT * GRID_SIZE
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
+screen_rect = screen.get_rect()
+MODEL_GRID = (10, 10)  # 学習済みモデルが学習した盤面の大きさ。これ以外のマップでは最短経路で追いかける
+CAMERA_MARGIN = 3  # 主人公が画面の端からこのマス数より内側にいる間はカメラを動かさない
+CHUNK_CELLS = 8  # 地形を描いておくかたまり（チャンク）の1辺のマス数
 pygame.display.set_caption("Grid Greed with RL Oni")
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# --- 学習済みモデルのロード（バックグラウンド） ---
+# policy_table.py で書き出した方策表があればそれを使う（鬼の行動は表を1回引くだけ）
+# なければ推論は BatchedPolicyService 経由で行う（同じプロセス内の鬼・セッションの要求をまとめて1回で計算する）
+# numpy_policy.py で書き出した .npz があればそれを使い、torch を読み込まずに起動する
+# （どちらも zip より古ければ、学習し直した後に書き出していないので zip を使う）
+# 読み込みはスタート画面を表示している間に別スレッドで進め、PLAYING に入るときにだけ完了を待つ
+MODEL_PATH = find_model(os.path.join(BASE_DIR, "model", "oni_double_model"))
+
+def load_oni_model(path):
+    # 方策表は引くだけなので、推論サービス（まとめて計算するためのスレッド）を通さない
+    return PolicyTable(path) if path.endswith(TABLE_SUFFIX) else get_service(path)
+
+model_loader, model = BackgroundLoader(load_oni_model, MODEL_PATH), None
 
 # 色
 BLACK, WHITE, BG_GREEN, RED, YELLOW = (0,0,0), (255,255,255), (85,107,47), (255,0,0), (255,255,0)
@@ -33,86 +78,73 @@ UI_SCALE_FACTOR = 0.07
 UI_PANEL_SCALE = 0.8
 
 # --- 画像読み込み ---
+# 全画像を今の GRID_SIZE・UIスケールで拡大縮小した状態で1枚のアトラスにまとめ、cache/ に保存しておく。
+# 2回目以降の起動はアトラス1ファイルを読むだけ（元画像の更新時刻かサイズ指定が変わると作り直す）
 try:
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
     IMAGE_DIR = os.path.join(BASE_DIR, "image")
     OVERLAP_SIZE = 90
     OHTERS_SIZE = GRID_SIZE
     OFFSET = (OVERLAP_SIZE - GRID_SIZE) // 2
 
-    grass_tile = pygame.image.load(os.path.join(IMAGE_DIR, "grass_tile.png")).convert_alpha()
-    grass_tile = pygame.transform.scale(grass_tile, (OVERLAP_SIZE, OVERLAP_SIZE))
-    grass_bush = pygame.image.load(os.path.join(IMAGE_DIR, "grass_bush.png")).convert_alpha()
-    grass_bush = pygame.transform.scale(grass_bush, (OVERLAP_SIZE, OVERLAP_SIZE))
-    hero_img = pygame.image.load(os.path.join(IMAGE_DIR, "hero.png")).convert_alpha()
-    hero_img = pygame.transform.scale(hero_img, (OHTERS_SIZE, OHTERS_SIZE))
-    rock_img = pygame.image.load(os.path.join(IMAGE_DIR, "rock.png")).convert_alpha()
-    rock_img = pygame.transform.scale(rock_img, (OHTERS_SIZE, OHTERS_SIZE))
-    oni_img = pygame.image.load(os.path.join(IMAGE_DIR, "oni.png")).convert_alpha()
-    oni_img = pygame.transform.scale(oni_img, (OHTERS_SIZE, OHTERS_SIZE))
-    start_bg_img = pygame.image.load(os.path.join(IMAGE_DIR, "GAMESTART_SCREEN.png")).convert()
-    start_bg_img = pygame.transform.scale(start_bg_img, (WIDTH, HEIGHT))
-    copyright_img_original = pygame.image.load(os.path.join(IMAGE_DIR, "copyright.png")).convert_alpha()
-    copyright_width = 150
-    copyright_height = int(copyright_img_original.get_height() * (copyright_width / copyright_img_original.get_width()))
-    copyright_img = pygame.transform.scale(copyright_img_original, (copyright_width, copyright_height))
-    press_enter_img_original = pygame.image.load(os.path.join(IMAGE_DIR, "PRESS_ENTER.png")).convert_alpha()
-    press_enter_width = 250
-    press_enter_height = int(press_enter_img_original.get_height() * (press_enter_width / press_enter_img_original.get_width()))
-    press_enter_img = pygame.transform.scale(press_enter_img_original, (press_enter_width, press_enter_height))
-    leaf_img_original = pygame.image.load(os.path.join(IMAGE_DIR, "leaf.png")).convert_alpha()
-    leaf_img = pygame.transform.scale(leaf_img_original, (50, 50))
-    coin_img = pygame.image.load(os.path.join(IMAGE_DIR, "coin.png")).convert_alpha()
-    coin_img = pygame.transform.scale(coin_img, (GRID_SIZE * 0.9, GRID_SIZE * 0.9))
-    rope_img = pygame.image.load(os.path.join(IMAGE_DIR, "rope.png")).convert_alpha()
-    coin_display_img = pygame.image.load(os.path.join(IMAGE_DIR, "coin_display.png")).convert_alpha()
-    coin_display_img = pygame.transform.scale_by(coin_display_img, UI_SCALE_FACTOR_DISPLAY)
-    number_images = []
-    for i in range(21):
-        img = pygame.image.load(os.path.join(IMAGE_DIR, f"number_{i}.png")).convert_alpha()
-        img = pygame.transform.scale_by(img, UI_SCALE_FACTOR)
-        number_images.append(img)
-    slash_img = pygame.image.load(os.path.join(IMAGE_DIR, "slash.png")).convert_alpha()
-    slash_img = pygame.transform.scale_by(slash_img, UI_SCALE_FACTOR)
-
-    game_over_img = pygame.image.load(os.path.join(IMAGE_DIR, "game_over.png")).convert_alpha()
+    SPRITES = [
+        Sprite("grass_tile", "grass_tile.png", scale_to(OVERLAP_SIZE, OVERLAP_SIZE)),
+        Sprite("grass_bush", "grass_bush.png", scale_to(OVERLAP_SIZE, OVERLAP_SIZE)),
+        Sprite("hero", "hero.png", scale_to(OHTERS_SIZE, OHTERS_SIZE)),
+        Sprite("rock", "rock.png", scale_to(OHTERS_SIZE, OHTERS_SIZE)),
+        Sprite("oni", "oni.png", scale_to(OHTERS_SIZE, OHTERS_SIZE)),
+        Sprite("start_bg", "GAMESTART_SCREEN.png", scale_to(WIDTH, HEIGHT), alpha=False),
+        Sprite("copyright", "copyright.png", fit_width(150)),
+        Sprite("press_enter", "PRESS_ENTER.png", fit_width(250)),
+        Sprite("leaf", "leaf.png", scale_to(50, 50)),
+        Sprite("coin", "coin.png", scale_to(GRID_SIZE * 0.9, GRID_SIZE * 0.9)),
+        Sprite("rope", "rope.png"),
+        Sprite("coin_display", "coin_display.png", scale_by(UI_SCALE_FACTOR_DISPLAY)),
+        *[Sprite(f"number_{i}", f"number_{i}.png", scale_by(UI_SCALE_FACTOR)) for i in range(21)],
+        Sprite("slash", "slash.png", scale_by(UI_SCALE_FACTOR)),
+        Sprite("game_over", "game_over.png"),
+        Sprite("stage_clear", "stage_clear.png"),
+        Sprite("restart_button", "restart_button.png"),
+        Sprite("stage_panel", "stage_panel.png", scale_by(UI_PANEL_SCALE)),
+        Sprite("lock_icon", "lock_icon.png", scale_by(UI_PANEL_SCALE)),
+        Sprite("stage_select_str", "stage_select_str.png", fit_width(int(WIDTH * 0.8))),
+        Sprite("stage_select_background", "stage_select_background.png", scale_to(WIDTH, HEIGHT), alpha=False),
+        # ステージ名はパネルの高さの半分に合わせる
+        *[Sprite(f"stage_title_{i}", f"STAGE{i}.png", fit_height(lambda sizes: int(sizes["stage_panel"][1] * 0.5)))
+          for i in range(1, 6)],
+    ]
+    atlas = load_atlas(IMAGE_DIR, SPRITES)
+
+    grass_tile, grass_bush = atlas["grass_tile"], atlas["grass_bush"]
+    hero_img, rock_img, oni_img = atlas["hero"], atlas["rock"], atlas["oni"]
+    start_bg_img = atlas["start_bg"]
+    copyright_img = atlas["copyright"]
+    press_enter_img = atlas["press_enter"]
+    leaf_img = atlas["leaf"]
+    coin_img = atlas["coin"]
+    rope_img = atlas["rope"]
+    coin_display_img = atlas["coin_display"]
+    number_images = [atlas[f"number_{i}"] for i in range(21)]
+    slash_img = atlas["slash"]
+
+    game_over_img = atlas["game_over"]
     game_over_rect = game_over_img.get_rect(center=(WIDTH // 2, HEIGHT // 2))
-    stage_clear_img = pygame.image.load(os.path.join(IMAGE_DIR, "stage_clear.png")).convert_alpha()
+    stage_clear_img = atlas["stage_clear"]
     stage_clear_rect = stage_clear_img.get_rect(center=(WIDTH // 2, HEIGHT // 2))
-    restart_button_img = pygame.image.load(os.path.join(IMAGE_DIR, "restart_button.png")).convert_alpha()
+    restart_button_img = atlas["restart_button"]
     restart_rect = restart_button_img.get_rect(center=(WIDTH // 2, HEIGHT // 2 + 120)) # 位置を調整
-    
-    stage_panel_img = pygame.image.load(os.path.join(IMAGE_DIR, "stage_panel.png")).convert_alpha()
-    stage_panel_img = pygame.transform.scale_by(stage_panel_img, UI_PANEL_SCALE)
-    lock_icon_img = pygame.image.load(os.path.join(IMAGE_DIR, "lock_icon.png")).convert_alpha()
-    lock_icon_img = pygame.transform.scale_by(lock_icon_img, UI_PANEL_SCALE)
-    stage_select_str_img_original = pygame.image.load(os.path.join(IMAGE_DIR, "stage_select_str.png")).convert_alpha()
-    stage_select_str_width = int(WIDTH * 0.8)
-    stage_select_str_height = int(stage_select_str_img_original.get_height() * (stage_select_str_width / stage_select_str_img_original.get_width()))
-    stage_select_str_img = pygame.transform.scale(stage_select_str_img_original, (stage_select_str_width, stage_select_str_height))
+
+    stage_panel_img = atlas["stage_panel"]
+    lock_icon_img = atlas["lock_icon"]
+    stage_select_str_img = atlas["stage_select_str"]
     stage_select_str_rect = stage_select_str_img.get_rect(center=(WIDTH // 2, 80))
-    stage_select_background_img = pygame.image.load(os.path.join(IMAGE_DIR, "stage_select_background.png")).convert()
-    stage_select_background_img = pygame.transform.scale(stage_select_background_img, (WIDTH, HEIGHT))
-    stage_title_images = []
-    for i in range(1, 6):
-        img_path = os.path.join(IMAGE_DIR, f"STAGE{i}.png")
-        img_original = pygame.image.load(img_path).convert_alpha()
-        panel_height_for_title = int(stage_panel_img.get_height() * 0.5)
-        img_scaled_height = panel_height_for_title
-        img_scaled_width = int(img_original.get_width() * (img_scaled_height / img_original.get_height()))
-        img_scaled = pygame.transform.scale(img_original, (img_scaled_width, img_scaled_height))
-        stage_title_images.append(img_scaled)
+    stage_select_background_img = atlas["stage_select_background"]
+    stage_title_images = [atlas[f"stage_title_{i}"] for i in range(1, 6)]
 
 except pygame.error as e:
     print(f"画像の読み込みに失敗しました: {e}"); sys.exit()
 
-# --- 学習済みモデルのロード ---
-MODEL_PATH = os.path.join(BASE_DIR, "model", "oni_double_model.zip")
-try:
-    model = PPO.load(MODEL_PATH)
-    print(f"学習済みモデル {MODEL_PATH} をロードしました。")
-except Exception as e:
-    print(f"モデルのロードに失敗しました: {e}\nモデルなしでゲームを開始します。"); model = None
+# 毎フレームの拡大縮小・回転の結果を使い回す（ロープの長さごとの画像など）
+transforms = TransformCache()
 
 # --- フォント・テキスト準備 ---
 title_font, info_font = pygame.font.Font(None, 120), pygame.font.Font(None, 50)
@@ -121,6 +153,8 @@ title_text = title_font.render("Grid Greed", True, WHITE)
 title_rect = title_text.get_rect(center=(WIDTH // 2, HEIGHT // 3))
 start_text = info_font.render("Press SPACE to Start", True, WHITE)
 start_rect = start_text.get_rect(center=(WIDTH // 2, HEIGHT // 2))
+loading_text = pygame.font.Font(None, 30).render("Loading AI...", True, WHITE)
+loading_rect = loading_text.get_rect(topright=(WIDTH - 10, 10))
 game_over_text = game_over_font.render("GAME OVER", True, RED)
 game_over_rect = game_over_text.get_rect(center=(WIDTH // 2, HEIGHT // 2))
 restart_text = info_font.render("Press SPACE to Select Stage", True, WHITE)
@@ -129,11 +163,13 @@ stage_clear_text = game_over_font.render("STAGE CLEAR!", True, YELLOW)
 stage_clear_rect = stage_clear_text.get_rect(center=(WIDTH // 2, HEIGHT // 2))
 
 # --- グローバル変数 ---
-player_x, player_y = 0, 0
-field, last_move_time, coin_count = [], 0, 0
-rope_pos = (GRID_WIDTH // 2 - 1, GRID_HEIGHT // 2 - 1)
-rope = None
-oni_positions = []
+# プレイ中のルール（移動・コイン・ロープ・クリア・捕獲）は game_state.GameState が持ち、ここでは描画と入力だけを扱う
+game = None
+# 画面の左上に映すワールド座標（ピクセル）と、地形のチャンク
+camera, field_chunks = (0, 0), None
+# プレイは固定タイムステップ（TICK_MS ごと）で進め、入力と鬼の移動を replays/ に記録する
+recorder, replay_player, tick_accum = None, None, 0
+path_tables, path_future, flow_field = PathTableCache(), None, None
 scroll_y, is_scrolling = 0, False
 unlocked_stage = 1
 current_stage_id = 0
@@ -177,89 +213,220 @@ STAGE_Y_START = 220
 STAGE_Y_SPACING = 250
 stages = [Stage(1, STAGE_Y_START + STAGE_Y_SPACING * 0, Stage1), Stage(2, STAGE_Y_START + STAGE_Y_SPACING * 1, Stage2), Stage(3, STAGE_Y_START + STAGE_Y_SPACING * 2, Stage3), Stage(4, STAGE_Y_START + STAGE_Y_SPACING * 3, Stage3), Stage(5, STAGE_Y_START + STAGE_Y_SPACING * 4, Stage3)]
 
-def apply_oni_action(oni_pos, action):
-    next_pos = oni_pos.copy()
-    if action == 0: next_pos[1] -= 1
-    elif action == 1: next_pos[1] += 1
-    elif action == 2: next_pos[0] -= 1
-    elif action == 3: next_pos[0] += 1
-    if 0 <= next_pos[0] < GRID_WIDTH and 0 <= next_pos[1] < GRID_HEIGHT and field[next_pos[1]][next_pos[0]]["type"] != "rock":
-        return next_pos
-    return oni_pos
-
-class Rope:
-    def __init__(self, x_pixel, target_y_pixel):
-        self.x, self.target_y, self.end_y = x_pixel, target_y_pixel, 0
-        self.speed, self.finished = 8, False
-        self.image = rope_img
-    def update(self):
-        if not self.finished: self.end_y = min(self.target_y, self.end_y + self.speed)
-        if self.end_y == self.target_y: self.finished = True
-    def draw(self, surface):
-        if self.end_y > 0:
-            scaled_rope = pygame.transform.scale(self.image, (self.image.get_width(), self.end_y))
-            surface.blit(scaled_rope, scaled_rope.get_rect(midbottom=(self.x, self.end_y)))
+# ロープ: 長さは game.rope_length（ピクセル）で、マップの上端から rope_pos のマスの中心まで伸びる
+def rope_rect():
+    """ロープの画面上の矩形（画面に映っていなければ None）"""
+    if game.rope_length is None or int(game.rope_length) <= 0: return None
+    rect = pygame.Rect(0, 0, rope_img.get_width(), int(game.rope_length))
+    rect.midbottom = (game.rope_pos[0] * GRID_SIZE + GRID_SIZE // 2 - camera[0], int(game.rope_length) - camera[1])
+    return rect if rect.colliderect(screen_rect) else None
+
+def draw_rope(surface):
+    rect = rope_rect()
+    if rect is None: return
+    # 伸ばした画像は transforms に残るので、毎フレーム作り直さない。
+    # 広いマップではロープが画面より長くなるので、映っている部分だけを area で切り出して描く（ChunkCache.draw と同じ）
+    visible = rect.clip(screen_rect)
+    surface.blit(transforms.scaled(rope_img, rect.size), visible, visible.move(-rect.x, -rect.y))
+
+def make_oni_controller(stage_module):
+    layout = stage_module.ROCK_LAYOUT
+    # 解いた表（配置ごと）があれば、それを引くだけで最悪のプレイヤー相手にも最短で捕まえる
+    solved = solved_path(to_passable(layout))
+    if args.optimal_oni and os.path.exists(solved):
+        return policy_controller(PolicyTable(solved).action)
+    if model is not None and (len(layout[0]), len(layout)) == MODEL_GRID:
+        if isinstance(model, PolicyTable):
+            return policy_controller(model.action)
+        return policy_controller(lambda obs: model.predict(obs, deterministic=True))
+    if args.pursuit_oni:
+        # モデルがない場合（とモデルが学習していない大きさのマップ）は最短経路で追いかける
+        # （表の準備ができるまでと、表を作らない大きいマップではフローフィールドを読む）
+        return pursuit_controller(lambda: ready_table(path_future) or flow_field)
+    # 元のゲームと同じく鬼は動かない（リプレイに鬼の番を記録するため、None ではなくその場に留まる関数にする）
+    return lambda state: list(state.onis)
 
 def reset_game(stage_data):
-    global player_x, player_y, field, last_move_time, coin_count, rope, oni_positions, current_stage_id
+    global game, current_stage_id, path_future, flow_field, recorder, tick_accum
     current_stage_id = stage_data.id
-    player_x, player_y = rope_pos; coin_count = 0; rope = None; oni_positions = []
-    field = [[{"type": "grass", "bush": False, "coin": False} for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
-    for y in range(GRID_HEIGHT):
-        for x in range(GRID_WIDTH):
-            if stage_data.module.ROCK_LAYOUT[y][x] == 1: field[y][x]["type"] = "rock"
-            if stage_data.module.BUSH_LAYOUT[y][x] == 1: field[y][x]["bush"] = True
-            if stage_data.module.COIN_LAYOUT[y][x] == 1: field[y][x]["coin"] = True
-    occupied_positions = {(player_x, player_y)}
-    for y in range(GRID_HEIGHT):
-        for x in range(GRID_WIDTH):
-            if field[y][x]["type"] == "rock": occupied_positions.add((x,y))
-    for _ in range(2):
-        while True:
-            ox, oy = random.randint(0, GRID_WIDTH - 1), random.randint(0, GRID_HEIGHT - 1)
-            distance = abs(ox - player_x) + abs(oy - player_y)
-            if (ox, oy) not in occupied_positions and distance >= 3:
-                oni_positions.append(np.array([ox, oy])); occupied_positions.add((ox, oy)); break
-    last_move_time = 0
-
-class Leaf:
-    def __init__(self):
-        self.x, self.y = random.randint(WIDTH // 2, WIDTH + 50), random.randint(-50, 0)
-        self.speed_x, self.speed_y = random.uniform(-1.5, 0.5), random.uniform(0.5, 2.0)
-        self.rotation, self.rotation_speed = random.uniform(0, 360), random.uniform(-3, 3)
-    def update(self):
-        self.x += self.speed_x; self.y += self.speed_y; self.rotation += self.rotation_speed
-        if self.rotation > 360: self.rotation -= 360
-        elif self.rotation < 0: self.rotation += 360
-    def draw(self, surface):
-        rotated_leaf = pygame.transform.rotate(leaf_img, self.rotation)
-        surface.blit(rotated_leaf, rotated_leaf.get_rect(center=(int(self.x), int(self.y))))
+    module = generate_stage(args.map_size, args.map_size, args.map_seed) if args.map_size else stage_data.module
+    if args.pursuit_oni:
+        # ステージの最短経路表をバックグラウンドで用意しておく（ディスクキャッシュがあれば読むだけ）
+        path_future = path_tables.request(module.ROCK_LAYOUT)
+        flow_field = FlowField(module.ROCK_LAYOUT)
+    seed = random.getrandbits(32)
+    recorder = ReplayRecorder(module, seed, cell_size=GRID_SIZE)
+    game = GameState.from_stage(module, oni_controller=recorder.wrap(make_oni_controller(module)),
+                                cell_size=GRID_SIZE, seed=seed)
+    tick_accum = 0
+    reset_field_view()
 
-def draw_coin_counter(surface, count):
-    start_x = 10; surface.blit(coin_display_img, (start_x, 10))
-    current_x = start_x + coin_display_img.get_width() + 5
+def start_replay(path):
+    global game, replay_player, tick_accum
+    replay_player = ReplayPlayer(Replay.load(path))
+    game, tick_accum = replay_player.state, 0
+    reset_field_view()
+    print(f"リプレイ {path} を再生します（←→ で5秒戻る・進む）")
+
+def seek_replay(ticks):
+    """リプレイを ticks ティックだけ戻す・進める（近いキーフレームから計算し直す）"""
+    replay_player.seek(replay_player.tick + ticks)
+    reset_field_view()
+
+def save_replay():
+    global recorder
+    if recorder is not None:
+        print(f"リプレイを保存しました: {recorder.save()}")
+        recorder = None
+
+# --- プレイ画面の描画 ---
+# 地形・草むら・岩・コインはチャンク（CHUNK_CELLS マス四方）ごとに初めて映ったときに1回だけ描き、
+# コインを取ったときだけ部分的に描き直す。毎フレーム貼るのは画面にかかるチャンクだけなので、マップが広くても重くならない。
+# カメラが動かないフレームは動いたもの（主人公・鬼・ロープ・コイン表示）の矩形だけを描き直して display.update に渡す
+def draw_field_cells(surface, ys, xs, origin=(0, 0)):
+    ox, oy = origin
+    for y in ys:
+        for x in xs:
+            if not game.rock[y][x]:
+                surface.blit(grass_tile, (x * GRID_SIZE - OFFSET - ox, y * GRID_SIZE - OFFSET - oy))
+                if game.bush[y][x]: surface.blit(grass_bush, (x * GRID_SIZE - OFFSET - ox, y * GRID_SIZE - OFFSET - oy))
+            else: surface.blit(rock_img, (x * GRID_SIZE - ox, y * GRID_SIZE - oy))
+            if (x, y) in game.coins:
+                coin_rect = coin_img.get_rect(center=(x * GRID_SIZE + GRID_SIZE // 2 - ox, y * GRID_SIZE + GRID_SIZE // 2 - oy))
+                surface.blit(coin_img, coin_rect)
+
+def render_field(surface, origin, area):
+    """ワールド座標の area にかかる地形を描く（ChunkCache から呼ばれる）。surface の左上がワールド座標の origin"""
+    surface.fill(BG_GREEN, area.move(-origin[0], -origin[1]))
+    # 草の画像は隣のマスにはみ出しているので、周囲のマスも元と同じ順番で描く
+    xs = range(max(0, area.left // GRID_SIZE - 1), min(game.width, (area.right - 1) // GRID_SIZE + 2))
+    ys = range(max(0, area.top // GRID_SIZE - 1), min(game.height, (area.bottom - 1) // GRID_SIZE + 2))
+    draw_field_cells(surface, ys, xs, origin)
+
+def reset_field_view():
+    """ステージが変わったとき（や状態が飛んだとき）に地形のチャンクを捨て、カメラを主人公に合わせる"""
+    global field_chunks, camera
+    field_chunks = ChunkCache((game.width * GRID_SIZE, game.height * GRID_SIZE), CHUNK_CELLS * GRID_SIZE, render_field)
+    camera = (camera_axis(game.player[0], game.width, GRID_WIDTH) * GRID_SIZE,
+              camera_axis(game.player[1], game.height, GRID_HEIGHT) * GRID_SIZE)
+
+def camera_axis(pos, size, view, current=None):
+    """
+    カメラの左端（上端）のマスを1軸分決める。
+
+    :param current: 今のカメラの位置（マス）。None なら pos を画面の中央にする。
+        それ以外は主人公が端から CAMERA_MARGIN マスより内側にいる限り動かさない
+    """
+    if size <= view: return 0
+    if current is None: start = pos - view // 2
+    else: start = min(max(current, pos - (view - 1 - CAMERA_MARGIN)), pos - CAMERA_MARGIN)
+    return max(0, min(start, size - view))
+
+def follow_camera():
+    """主人公に合わせてカメラを動かす。動いたら True"""
+    global camera
+    new = (camera_axis(game.player[0], game.width, GRID_WIDTH, camera[0] // GRID_SIZE) * GRID_SIZE,
+           camera_axis(game.player[1], game.height, GRID_HEIGHT, camera[1] // GRID_SIZE) * GRID_SIZE)
+    moved, camera = new != camera, new
+    return moved
+
+def remove_coin_from_layer(x, y):
+    """コインを取ったマスを描き直して、画面上で変わった矩形を返す"""
+    coin_rect = coin_img.get_rect(center=(x * GRID_SIZE + GRID_SIZE // 2, y * GRID_SIZE + GRID_SIZE // 2))
+    field_chunks.redraw(coin_rect)
+    return coin_rect.move(-camera[0], -camera[1]).clip(screen_rect)
+
+def cell_rect(image, pos):
+    """マス pos に置いた画像の画面上の矩形"""
+    return image.get_rect(topleft=(pos[0] * GRID_SIZE - camera[0], pos[1] * GRID_SIZE - camera[1]))
+
+def coin_counter_rect(count):
+    """draw_coin_counter が描く範囲"""
+    return coin_counter.get(count).get_rect(topleft=(10, 10))
+
+def play_sprites():
+    """今のフレームで動くものの (矩形, 種類) の集合。前のフレームと違うものだけ描き直す"""
+    sprites = {(tuple(cell_rect(hero_img, game.player)), "hero"),
+               (tuple(coin_counter_rect(game.coin_count)), f"coins:{game.coin_count}")}
+    # 鬼は1体ずつ区別する（2体が同じマスに重なると半透明の縁が濃くなるので、重なり方が変わったら描き直す）
+    for i, oni_pos in enumerate(game.onis):
+        rect = cell_rect(oni_img, oni_pos)
+        if rect.colliderect(screen_rect): sprites.add((tuple(rect), f"oni{i}"))
+    rect = rope_rect()
+    if rect: sprites.add((tuple(rect.clip(screen_rect)), "rope"))
+    return sprites
+
+def draw_play_field(surface, area=None):
+    """プレイ画面を描く。area を渡すとその範囲だけ描き直す"""
+    surface.set_clip(area)
+    view = area or screen_rect
+    if game.width < GRID_WIDTH or game.height < GRID_HEIGHT: surface.fill(BG_GREEN, view)  # マップの外
+    field_chunks.draw(surface, camera, view.move(camera))
+    rect = rope_rect()
+    if rect and view.colliderect(rect): draw_rope(surface)
+    for x in range(0, WIDTH, GRID_SIZE): pygame.draw.line(surface, BLACK, (x, 0), (x, HEIGHT))
+    for y in range(0, HEIGHT, GRID_SIZE): pygame.draw.line(surface, BLACK, (0, y), (WIDTH, y))
+    surface.blit(hero_img, cell_rect(hero_img, game.player))
+    for oni_pos in game.onis:
+        rect = cell_rect(oni_img, oni_pos)
+        if rect.colliderect(view): surface.blit(oni_img, rect)
+    draw_coin_counter(surface, game.coin_count)
+    surface.set_clip(None)
+
+def coin_counter_parts(count):
+    """コイン表示の部品と位置（表示の左上 (10, 10) からの相対位置）"""
+    parts = [(coin_display_img, (0, 0))]
+    current_x = coin_display_img.get_width() + 5
     count_str = str(count) if count > 0 else "0"
-    for digit in count_str:
-        num_img = number_images[int(digit)]; surface.blit(num_img, (current_x, 23)); current_x += num_img.get_width() + 2
-    surface.blit(slash_img, (current_x, 23)); current_x += slash_img.get_width() + 2
-    total_str = "20"
-    for digit in total_str:
-        num_img = number_images[int(digit)]; surface.blit(num_img, (current_x, 23)); current_x += num_img.get_width() + 2
+    for ch in count_str + "/" + "20":
+        img = slash_img if ch == "/" else number_images[int(ch)]
+        parts.append((img, (current_x, 13))); current_x += img.get_width() + 2
+    return parts
+
+# コイン表示は1枚の Surface にまとめておき、枚数が変わったときだけ作り直す
+coin_counter = HudCache(coin_counter_parts)
+
+def draw_coin_counter(surface, count):
+    surface.blit(coin_counter.get(count), (10, 10))
 
 # --- メインループ ---
 clock = pygame.time.Clock()
-MOVE_INTERVAL_NORMAL, MOVE_INTERVAL_SLOW = 150, 600
-ONI_MOVE_INTERVAL = 400
-last_oni_move_time = 0
+frame_ms = 0  # 前のフレームからの経過時間（この分だけティックを進める）
+# 移動キー（上から優先）
+MOVE_KEYS = [(pygame.K_w, UP), (pygame.K_s, DOWN), (pygame.K_a, LEFT), (pygame.K_d, RIGHT)]
 blink_interval, leaf_spawn_interval = 500, 600
+def wait_for_model():
+    """PLAYING に入る直前に呼ぶ。モデルの読み込みが終わっていなければここで待つ"""
+    global model_loader, model
+    if model_loader is None:
+        return
+    try:
+        model = model_loader.result()
+        print(f"学習済みモデル {MODEL_PATH} をロードしました。({model_loader.elapsed:.2f} 秒)")
+    except Exception as e:
+        print(f"モデルのロードに失敗しました: {e}\nモデルなしでゲームを開始します。"); model = None
+    model_loader = None
+
 last_blink_time, last_leaf_spawn_time = 0, 0
-show_press_enter, leaves = True, []
+# タイトル画面の落ち葉（位置・速度・回転を配列でまとめて動かし、回転画像は量子化した表から選ぶ）
+show_press_enter, leaves = True, LeafParticles(leaf_img, WIDTH, HEIGHT)
+drawn_sprites, drawn_mode = set(), None
 
 load_progress()
+if args.replay:
+    start_replay(args.replay); MODE = "PLAYING"
 
 while True:
+    dirty_rects = []
     for event in pygame.event.get():
-        if event.type == pygame.QUIT: pygame.quit(); sys.exit()
+        if event.type == pygame.QUIT:
+            if MODE == "PLAYING": save_replay()
+            pygame.quit(); sys.exit()
+        if event.type == pygame.VIDEOEXPOSE: drawn_mode = None  # 画面全体を描き直す
+        if replay_player is not None and MODE != "STAGE_SELECT" and event.type == pygame.KEYDOWN:
+            if event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+                seek_replay(int(5000 / TICK_MS) * (1 if event.key == pygame.K_RIGHT else -1))
+                MODE, drawn_mode = "PLAYING", None
         
         if MODE == "START_SCREEN":
             if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
@@ -277,14 +444,14 @@ while True:
                 if not is_scrolling:
                     for stage in stages:
                         if stage.is_clicked(event.pos, scroll_y):
-                            reset_game(stage); MODE = "PLAYING"; break
+                            wait_for_model(); reset_game(stage); MODE = "PLAYING"; break
                 is_scrolling = False
             if event.type == pygame.MOUSEBUTTONDOWN:
                 is_scrolling = False
 
         elif MODE == "GAME_OVER" or MODE == "STAGE_CLEAR":
             if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
-                MODE = "STAGE_SELECT"
+                MODE, replay_player = "STAGE_SELECT", None
     
     # --- モード別の描画・ロジック処理 ---
     if MODE == "START_SCREEN":
@@ -292,17 +459,17 @@ while True:
         if current_time - last_blink_time > blink_interval:
             show_press_enter = not show_press_enter; last_blink_time = current_time
         if current_time - last_leaf_spawn_time > leaf_spawn_interval:
-            leaves.append(Leaf()); last_leaf_spawn_time = current_time
-        for leaf in leaves[:]:
-            leaf.update()
-            if not (-50 < leaf.x < WIDTH + 50 and -50 < leaf.y < HEIGHT + 50): leaves.remove(leaf)
+            leaves.spawn(); last_leaf_spawn_time = current_time
+        leaves.update()
         screen.blit(start_bg_img, (0, 0))
-        for leaf in leaves: leaf.draw(screen)
+        leaves.draw(screen)
         copyright_rect = copyright_img.get_rect(centerx=WIDTH // 2, bottom=HEIGHT - 10)
         screen.blit(copyright_img, copyright_rect)
         if show_press_enter:
             press_enter_rect = press_enter_img.get_rect(centerx=WIDTH // 2, bottom=copyright_rect.top - 10)
             screen.blit(press_enter_img, press_enter_rect)
+        if model_loader is not None and not model_loader.ready():
+            screen.blit(loading_text, loading_rect)
     
     elif MODE == "STAGE_SELECT":
         screen.blit(stage_select_background_img, (0,0))
@@ -313,82 +480,56 @@ while True:
         unlocked_stage = min(unlocked_stage, len(stages) + 1)
 
     elif MODE == "PLAYING":
-        current_time = pygame.time.get_ticks()
-        keys = pygame.key.get_pressed()
-        current_move_interval = MOVE_INTERVAL_SLOW if field[player_y][player_x]["bush"] else MOVE_INTERVAL_NORMAL
-        if current_time - last_move_time > current_move_interval:
-            new_x, new_y = player_x, player_y
-            if keys[pygame.K_w] and player_y > 0: new_y -= 1
-            elif keys[pygame.K_s] and player_y < GRID_HEIGHT - 1: new_y += 1
-            elif keys[pygame.K_a] and player_x > 0: new_x -= 1
-            elif keys[pygame.K_d] and player_x < GRID_WIDTH - 1: new_x += 1
-            if (new_x, new_y) != (player_x, player_y) and field[new_y][new_x]["type"] != "rock":
-                player_x, player_y = new_x, new_y; last_move_time = current_time
-        if field[player_y][player_x]["coin"]:
-            field[player_y][player_x]["coin"] = False; coin_count += 1
-            if coin_count >= 15 and rope is None:
-                rope = Rope(rope_pos[0] * GRID_SIZE + GRID_SIZE // 2, rope_pos[1] * GRID_SIZE + GRID_SIZE // 2)
-        if rope and rope.finished and (player_x, player_y) == rope_pos:
+        # 経過時間を TICK_MS ずつに分けて進める（フレームの長さが違っても、同じ入力なら同じ結果になる）
+        coins_before = set(game.coins)
+        if replay_player is None:
+            keys = pygame.key.get_pressed()
+            held = [move for key, move in MOVE_KEYS if keys[key]]
+            tick_accum = min(tick_accum + frame_ms, TICK_MS * MAX_TICKS_PER_FRAME)
+            while tick_accum >= TICK_MS and game.status == PLAYING:
+                tick_accum -= TICK_MS
+                recorder.record_tick(held)
+                game.step(held, TICK_MS)
+        else:
+            tick_accum += frame_ms * args.speed
+            while tick_accum >= TICK_MS and not replay_player.finished:
+                tick_accum -= TICK_MS
+                replay_player.step()
+        for coin in coins_before - game.coins:
+            dirty_rects.append(remove_coin_from_layer(*coin))
+        if follow_camera(): drawn_mode = None  # カメラが動いたら画面全体を描き直す
+        if game.status == CLEAR:
             MODE = "STAGE_CLEAR"
-            if current_stage_id >= unlocked_stage:
+            if replay_player is None and not args.map_size and current_stage_id >= unlocked_stage:
                 unlocked_stage = current_stage_id + 1
                 save_progress()
-        if rope: rope.update()
-        if model is not None and current_time - last_oni_move_time > ONI_MOVE_INTERVAL:
-            obs = np.concatenate([oni_positions[0], oni_positions[1], np.array([player_x, player_y])])
-            actions, _states = model.predict(obs, deterministic=True)
-            oni_positions[0] = apply_oni_action(oni_positions[0], actions[0])
-            oni_positions[1] = apply_oni_action(oni_positions[1], actions[1])
-            last_oni_move_time = current_time
-        for oni_pos in oni_positions:
-            if np.array_equal(oni_pos, np.array([player_x, player_y])):
-                MODE = "GAME_OVER"; break
-        
-        # 描画 (プレイ中)
-        screen.fill(BG_GREEN) 
-        for y in range(GRID_HEIGHT):
-            for x in range(GRID_WIDTH):
-                cell = field[y][x]
-                if cell["type"] == "grass":
-                    screen.blit(grass_tile, (x * GRID_SIZE - OFFSET, y * GRID_SIZE - OFFSET))
-                    if cell["bush"]: screen.blit(grass_bush, (x * GRID_SIZE - OFFSET, y * GRID_SIZE - OFFSET))
-                elif cell["type"] == "rock": screen.blit(rock_img, (x * GRID_SIZE, y * GRID_SIZE))
-                if cell["coin"]:
-                    coin_rect = coin_img.get_rect(center=(x * GRID_SIZE + GRID_SIZE // 2, y * GRID_SIZE + GRID_SIZE // 2))
-                    screen.blit(coin_img, coin_rect)
-        if rope: rope.draw(screen)
-        for x in range(0, WIDTH, GRID_SIZE): pygame.draw.line(screen, BLACK, (x, 0), (x, HEIGHT))
-        for y in range(0, HEIGHT, GRID_SIZE): pygame.draw.line(screen, BLACK, (0, y), (WIDTH, y))
-        screen.blit(hero_img, (player_x * GRID_SIZE, player_y * GRID_SIZE))
-        for oni_pos_array in oni_positions:
-            screen.blit(oni_img, (oni_pos_array[0] * GRID_SIZE, oni_pos_array[1] * GRID_SIZE))
-        draw_coin_counter(screen, coin_count)
+        if game.status == CAUGHT:
+            MODE = "GAME_OVER"
+        if MODE != "PLAYING": save_replay()
+
+        # 描画 (プレイ中): 前のフレームから変わった部分だけ
+        sprites = play_sprites()
+        if drawn_mode != "PLAYING":
+            draw_play_field(screen); pygame.display.flip()
+        else:
+            dirty_rects += [pygame.Rect(rect) for rect, _ in sprites ^ drawn_sprites]
+            for rect in dirty_rects: draw_play_field(screen, rect)
+            pygame.display.update(dirty_rects)
+        drawn_sprites, drawn_mode = sprites, "PLAYING"
 
     elif MODE == "GAME_OVER" or MODE == "STAGE_CLEAR":
-        screen.fill(BG_GREEN) 
-        for y in range(GRID_HEIGHT):
-            for x in range(GRID_WIDTH):
-                cell = field[y][x]
-                if cell["type"] == "grass":
-                    screen.blit(grass_tile, (x * GRID_SIZE - OFFSET, y * GRID_SIZE - OFFSET))
-                    if cell["bush"]: screen.blit(grass_bush, (x * GRID_SIZE - OFFSET, y * GRID_SIZE - OFFSET))
-                elif cell["type"] == "rock": screen.blit(rock_img, (x * GRID_SIZE, y * GRID_SIZE))
-                if cell["coin"]:
-                    coin_rect = coin_img.get_rect(center=(x * GRID_SIZE + GRID_SIZE // 2, y * GRID_SIZE + GRID_SIZE // 2))
-                    screen.blit(coin_img, coin_rect)
-        if rope: rope.draw(screen)
-        for x in range(0, WIDTH, GRID_SIZE): pygame.draw.line(screen, BLACK, (x, 0), (x, HEIGHT))
-        for y in range(0, HEIGHT, GRID_SIZE): pygame.draw.line(screen, BLACK, (0, y), (WIDTH, y))
-        screen.blit(hero_img, (player_x * GRID_SIZE, player_y * GRID_SIZE))
-        for oni_pos_array in oni_positions:
-            screen.blit(oni_img, (oni_pos_array[0] * GRID_SIZE, oni_pos_array[1] * GRID_SIZE))
-        draw_coin_counter(screen, coin_count)
-        
-        if MODE == "GAME_OVER":
-            screen.blit(game_over_text, game_over_rect)
-        else: # STAGE_CLEAR
-            screen.blit(stage_clear_text, stage_clear_rect)
-        screen.blit(restart_text, restart_rect)
-
-    pygame.display.flip()
-    clock.tick(60)
\ No newline at end of file
+        # 画面は止まっているので、このモードに入ったときに1回だけ描く
+        if drawn_mode != MODE:
+            draw_play_field(screen)
+            if MODE == "GAME_OVER":
+                screen.blit(game_over_text, game_over_rect)
+            else: # STAGE_CLEAR
+                screen.blit(stage_clear_text, stage_clear_rect)
+            screen.blit(restart_text, restart_rect)
+            pygame.display.flip()
+            drawn_mode = MODE
+
+    if MODE == "START_SCREEN" or MODE == "STAGE_SELECT":
+        pygame.display.flip()
+        drawn_mode = MODE
+    frame_ms = clock.tick(60)
\ No newline at end of file
@@ -1,13 +1,14 @@
 # oni_rl.py (新しいファイル名として推奨)
 import gymnasium as gym
-from stable_baselines3 import PPO
 import numpy as np
 from oni_double_env import ChaseEnv # 自作環境をインポート
+from inference_service import find_model, get_service
 
-# 学習済みモデルをロード
-MODEL_PATH = "model/oni_double_model"
+# 学習済みモデルをロード（推論は他の鬼・セッションとまとめて行う BatchedPolicyService 経由）
+# .npz は zip より古ければ使わない（学習し直した後に書き出していない）
+MODEL_PATH = find_model("model/oni_double_model", exts=(".npz", ".zip"))
 try:
-    model = PPO.load(MODEL_PATH)
+    model = get_service(MODEL_PATH)
     print(f"学習済みモデル {MODEL_PATH} をロードしました。")
 except Exception as e:
     print(f"モデルのロードに失敗しました: {e}")
@@ -62,7 +63,7 @@ def get_oni_next_move(env, oni_pos, player_pos):
     # この関数の役割を、単一の鬼の行動決定から
     # 「環境状態をモデルに渡し、2体の鬼の行動を取得する」に変更する
     obs = np.concatenate([env.enemy_positions[0], env.enemy_positions[1], env.player_pos])
-    actions, _states = model.predict(obs)
+    actions = model.predict(obs, deterministic=False)
 
     # 2体の鬼の行動を返す
     return actions
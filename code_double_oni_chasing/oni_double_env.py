@@ -3,6 +3,8 @@ from gymnasium import spaces
 import numpy as np
 import random
 
+from field_grid import FieldGrid, GRASS
+
 # グリッド設定
 GRID_SIZE = 50
 GRID_WIDTH = 10
@@ -10,15 +12,38 @@ GRID_HEIGHT = 10
 WIDTH = GRID_WIDTH * GRID_SIZE
 HEIGHT = GRID_HEIGHT * GRID_SIZE
 
+
+# 鬼の行動 0=上,1=下,2=左,3=右 の移動量
+ACTION_DELTAS = ((0, -1), (0, 1), (-1, 0), (1, 0))
+RANDOM_MOVES = [(-1,0),(1,0),(0,-1),(0,1),(0,0)]
+
+
+def rock_range(width, height):
+    """岩の個数の範囲。10x10 で 5〜10 個（盤面の 5〜10%）になるよう面積に比例させる"""
+    n_cells = width * height
+    return 5 * n_cells // 100, 10 * n_cells // 100
+
+
 class ChaseEnv(gym.Env):
-    def __init__(self, human_control=False):
+    """
+    2体の鬼がプレイヤー（逃げる簡易AI）を追いかける学習環境。
+
+    座標は Python の int で持ち、観測は毎回作り直さず _obs に書き込んでからその写しを返す
+    （1ステップあたりの NumPy 配列の生成は観測の1個だけ）。
+    player_pos, enemy_positions は従来どおり NumPy 配列で読み書きできる。
+    """
+
+    def __init__(self, human_control=False, width=GRID_WIDTH, height=GRID_HEIGHT, layout_pool=None):
         super().__init__()
+        # 盤面の大きさ（学習済みモデルは 10x10 用）
+        self.width, self.height = width, height
+        self.rock_min, self.rock_max = rock_range(width, height)
         # 観測空間：(鬼1座標 + 鬼2座標 + プレイヤー座標)
         self.observation_space = spaces.Box(
             low=np.array([0,0,0,0,0,0]),
-            high=np.array([GRID_WIDTH-1, GRID_HEIGHT-1,
-                           GRID_WIDTH-1, GRID_HEIGHT-1,
-                           GRID_WIDTH-1, GRID_HEIGHT-1]),
+            high=np.array([width-1, height-1,
+                           width-1, height-1,
+                           width-1, height-1]),
             dtype=np.int32
         )
         
@@ -28,93 +53,126 @@ class ChaseEnv(gym.Env):
         self.max_steps = 100
         self.current_step = 0
 
-        # 岩座標
-        self.rocks = set()
+        # フィールド（岩の配置もここで管理する）
+        self.grid = FieldGrid(width, height)
 
-        # フィールド
-        self.field = None
-
-        # プレイヤー & 敵座標
-        self.player_pos = None
-        self.enemy_positions = []  # 2体の鬼を格納
+        # プレイヤー & 敵座標（[x, y] の int のリスト）
+        self._player = [0, 0]
+        self._enemies = []  # 2体の鬼を格納
+        self._obs = np.zeros(6, dtype=np.int32)
 
         # 人間操作モード
         self.human_control = human_control
 
+        # 初期配置を渡す LayoutPool / StageLayouts（layout_pool.py）。None なら reset のたびにその場で作る
+        self.layout_pool = layout_pool
+        # 距離の報酬に使う盤面の歩数表（マス番号 y*幅+x の組 → 歩数。None ならユークリッド距離で比べる）
+        self._path_dist = None
+
     def _init_field(self):
         """フィールドと岩・鬼・プレイヤーの初期配置を行う"""
+        if self.layout_pool is not None:
+            cells, rock_count, enemies, player, self._path_dist = self.layout_pool.take()
+            self.grid.load_cells(cells, rock_count)
+            self._enemies = [enemy[:] for enemy in enemies]
+            self._player = player[:]
+            return
+        self._path_dist = None
+
         # プレイヤー初期位置
-        self.player_pos = np.array([GRID_WIDTH // 2, GRID_HEIGHT // 2])
-        
+        px, py = self.width // 2, self.height // 2
+        self._player = [px, py]
+
         # フィールド初期化
-        self.field = [[{"type": "grass"} for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
-        self.rocks.clear()
+        self.grid.clear()
 
         # ランダムに岩を配置
-        while len(self.rocks) < random.randint(5, 10):
-            rx, ry = random.randint(0, GRID_WIDTH - 1), random.randint(0, GRID_HEIGHT - 1)
-            if (rx, ry) != tuple(self.player_pos):
-                self.field[ry][rx]["type"] = "rock"
-                self.rocks.add((rx, ry))
+        while self.grid.rock_count < random.randint(self.rock_min, self.rock_max):
+            rx, ry = random.randint(0, self.width - 1), random.randint(0, self.height - 1)
+            if (rx, ry) != (px, py):
+                self.grid.set_rock(rx, ry)
 
         # 鬼の初期位置を2体決定（被らないように）
-        self.enemy_positions = []
-        while len(self.enemy_positions) < 2:
-            ex, ey = random.randint(0, GRID_WIDTH - 1), random.randint(0, GRID_HEIGHT - 1)
-            distance = abs(ex - self.player_pos[0]) + abs(ey - self.player_pos[1])
-            pos = (ex, ey)
+        self._enemies = []
+        while len(self._enemies) < 2:
+            ex, ey = random.randint(0, self.width - 1), random.randint(0, self.height - 1)
+            distance = abs(ex - px) + abs(ey - py)
             if (
-                pos != tuple(self.player_pos)
-                and pos not in self.rocks
-                and pos not in [tuple(p) for p in self.enemy_positions]
+                (ex, ey) != (px, py)
+                and self.grid.is_passable(ex, ey)
+                and [ex, ey] not in self._enemies
                 and distance >= 3
             ):
-                self.enemy_positions.append(np.array([ex, ey]))
+                self._enemies.append([ex, ey])
+
+    @property
+    def rocks(self):
+        """岩座標の集合（描画・人間操作用）"""
+        return self.grid.rock_positions()
+
+    @property
+    def player_pos(self):
+        """プレイヤー座標 (x, y)。返す配列は写しなので、動かすときは代入する"""
+        return np.array(self._player)
+
+    @player_pos.setter
+    def player_pos(self, pos):
+        self._player = [int(pos[0]), int(pos[1])]
+
+    @property
+    def enemy_positions(self):
+        """2体の鬼の座標 [(x, y), (x, y)]（写し）"""
+        return [np.array(e) for e in self._enemies]
+
+    @enemy_positions.setter
+    def enemy_positions(self, positions):
+        self._enemies = [[int(p[0]), int(p[1])] for p in positions]
+
+    def _get_obs(self):
+        """観測 (鬼1座標, 鬼2座標, プレイヤー座標) を _obs に書き込み、その写しを返す"""
+        (e0x, e0y), (e1x, e1y) = self._enemies
+        self._obs[:] = (e0x, e0y, e1x, e1y, self._player[0], self._player[1])
+        # _obs そのものを返すと次の step/reset で書き換わる（DummyVecEnv の terminal_observation などが壊れる）
+        return self._obs.copy()
 
     def reset(self, seed=None, options=None):
         super().reset(seed=seed)
         self._init_field()
         self.current_step = 0
 
-        obs = np.concatenate([self.enemy_positions[0],
-                              self.enemy_positions[1],
-                              self.player_pos])
-        return obs, {}
-
-    def applyAction(self, pos, action):
-        """鬼の移動処理（岩や壁チェック込み）"""
-        new_pos = pos.copy()
-        if action == 0: new_pos[1] -= 1  # 上
-        if action == 1: new_pos[1] += 1  # 下
-        if action == 2: new_pos[0] -= 1  # 左
-        if action == 3: new_pos[0] += 1  # 右
-
-        # 無効な場合 → その場に留まる
-        if (
-            0 <= new_pos[0] < GRID_WIDTH
-            and 0 <= new_pos[1] < GRID_HEIGHT
-            and self.field[new_pos[1]][new_pos[0]]["type"] != "rock"
-        ):
-            return new_pos, False  # 有効移動
-        else:
-            return pos, True  # 岩などにぶつかった
+        return self._get_obs(), {}
 
     def step(self, actions):
         self.current_step += 1
         reward = 0
+        cells, stride = self.grid._buf, self.grid.stride  # 外周が壁なので範囲チェックなしで参照できる
+        px, py = self._player
+        path_dist, width = self._path_dist, self.width
+        if path_dist is not None:
+            path_dist_row = (py * width + px) * width * self.height  # プレイヤーのマスまでの歩数の並び
 
         # --- 鬼の移動 ---
-        for i, action in enumerate(actions):
-            old_dist = np.linalg.norm(self.enemy_positions[i] - self.player_pos)
-            next_pos, hit_rock = self.applyAction(self.enemy_positions[i], action)
-            self.enemy_positions[i] = next_pos
-
-            # 岩にぶつかったら軽いペナルティ
-            if hit_rock:
-                reward -= 0.1
+        # 距離は2乗のまま比べる（平方根は単調なので、np.linalg.norm で比べた結果と同じ）。
+        # 歩数表があれば、岩を回り込む歩数で比べる
+        for enemy, action in zip(self._enemies, actions):
+            ex, ey = enemy
+            if path_dist is None:
+                old_dist = (ex - px) ** 2 + (ey - py) ** 2
+            else:
+                old_dist = path_dist[path_dist_row + ey * width + ex]
+            dx, dy = ACTION_DELTAS[action]
+            if cells[(ey + dy + 1) * stride + ex + dx + 1] == GRASS:
+                ex += dx
+                ey += dy
+                enemy[0], enemy[1] = ex, ey
+            else:
+                reward -= 0.1  # 岩などにぶつかったら軽いペナルティ（その場に留まる）
 
             # プレイヤーとの距離変化で shaping
-            new_dist = np.linalg.norm(self.enemy_positions[i] - self.player_pos)
+            if path_dist is None:
+                new_dist = (ex - px) ** 2 + (ey - py) ** 2
+            else:
+                new_dist = path_dist[path_dist_row + ey * width + ex]
             if new_dist < old_dist:
                 reward += 0.05  # 近づいたら加点
             else:
@@ -122,44 +180,30 @@ class ChaseEnv(gym.Env):
 
         # --- プレイヤーキャラ（簡易AI） ---
         if not self.human_control:
-            player_dx, player_dy = 0, 0
-            # 鬼の平均位置に基づいて逃げる
-            avg_enemy = np.mean(self.enemy_positions, axis=0)
-            if avg_enemy[1] < self.player_pos[1]:
-                player_dy = 1
-            elif avg_enemy[1] > self.player_pos[1]:
-                player_dy = -1
-            if avg_enemy[0] < self.player_pos[0]:
-                player_dx = 1
-            elif avg_enemy[0] > self.player_pos[0]:
-                player_dx = -1
-
-            next_player_pos = self.player_pos + np.array([player_dx, player_dy])
-            if (
-                0 <= next_player_pos[0] < GRID_WIDTH
-                and 0 <= next_player_pos[1] < GRID_HEIGHT
-                and self.field[next_player_pos[1]][next_player_pos[0]]["type"] != "rock"
-            ):
-                self.player_pos = next_player_pos
-
-            # 10%の確率でランダム移動
+            # 鬼の平均位置に基づいて逃げる（平均との比較は2倍した座標和で行う）
+            (e0x, e0y), (e1x, e1y) = self._enemies
+            sx, sy = e0x + e1x, e0y + e1y
+            player_dx = 1 if sx < 2 * px else -1 if sx > 2 * px else 0
+            player_dy = 1 if sy < 2 * py else -1 if sy > 2 * py else 0
+            if cells[(py + player_dy + 1) * stride + px + player_dx + 1] == GRASS:
+                px += player_dx
+                py += player_dy
+
+            # 10%の確率でランダム移動（岩チェックなし）
             if random.random() < 0.1:
-                rand_move = random.choice([(-1,0),(1,0),(0,-1),(0,1),(0,0)])
-                self.player_pos[0] = max(0, min(GRID_WIDTH-1, self.player_pos[0] + rand_move[0]))
-                self.player_pos[1] = max(0, min(GRID_HEIGHT-1, self.player_pos[1] + rand_move[1]))
+                rand_move = random.choice(RANDOM_MOVES)
+                px = max(0, min(self.width-1, px + rand_move[0]))
+                py = max(0, min(self.height-1, py + rand_move[1]))
+            self._player = [px, py]
 
         # --- 終了判定 ---
-        terminated = any(np.array_equal(enemy, self.player_pos) for enemy in self.enemy_positions)
+        terminated = [px, py] in self._enemies
         truncated = self.current_step >= self.max_steps
 
         if terminated:
             reward += 100  # 捕まえた
 
-        obs = np.concatenate([self.enemy_positions[0],
-                              self.enemy_positions[1],
-                              self.player_pos])
-        info = {}
-        return obs, reward, terminated, truncated, info
+        return self._get_obs(), reward, terminated, truncated, {}
 
 def main():
     print("--- 2体の鬼テスト ---")
@@ -1,31 +1,23 @@
+import argparse
+
 import gymnasium as gym
-from stable_baselines3 import PPO
 from oni_double_env import ChaseEnv  # 自作環境をインポート
+from training import add_training_args, load_config, make_ppo, train
 
-def main():
-    # 環境作成
-    env = ChaseEnv()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="鬼2体の PPO を学習する")
+    args = add_training_args(parser).parse_args(argv)
 
-    # PPO モデル作成
-    # "MlpPolicy" は多層パーセプトロン（全結合NN）を使用
-    model = PPO(
-        "MlpPolicy",
-        env,
-        learning_rate=3e-4,  # 学習率
-        n_steps=2048,         # 1回の rollout に使用するステップ数
-        batch_size=64,
-        gamma=0.9,           # 割引率
-        gae_lambda=0.95,
-        clip_range=0.2,
-        verbose=1,
-        policy_kwargs=dict(net_arch=[128,128])
-    )
+    # 環境作成（評価用は学習用とは別に作る）
+    env = ChaseEnv()
+    eval_env = ChaseEnv()
 
-    # 学習（例: 10,000ステップ）
-    model.learn(total_timesteps=50000)
+    def make_model():
+        # PPO モデル作成（ハイパーパラメータは training.PPO_CONFIG、--config で差し替えられる）
+        return make_ppo(env, load_config(args.config), verbose=1)
 
-    # 学習済みモデルを保存
-    model.save("model/oni_double_model") #code_ueno内のmodelフォルダに入れることを想定
+    # 学習（例: 50,000ステップ。途中経過は checkpoints/oni_double_model に保存）し、学習済みモデルを保存
+    train(make_model, env, eval_env, "model/oni_double_model", args) #code_ueno内のmodelフォルダに入れることを想定
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,177 @@
+import time
+
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import VecEnv
+
+from field_grid import GRASS, ROCK, WALL
+from layout_pool import LayoutSampler
+from oni_double_env import GRID_WIDTH, GRID_HEIGHT
+
+# 行動 → 移動量 (0=上, 1=下, 2=左, 3=右)
+ACTION_DELTAS = np.array([[0, -1], [0, 1], [-1, 0], [1, 0]])
+# プレイヤーの10%ランダム移動の候補（ChaseEnv と同じ並び）
+RANDOM_MOVES = np.array([(-1, 0), (1, 0), (0, -1), (0, 1), (0, 0)])
+
+
+class ChaseVecEnv(VecEnv):
+    """
+    oni_double_env.ChaseEnv をN面まとめて (N, ...) 配列で進めるベクトル化環境。
+
+    ルール（鬼の移動・岩判定・逃げるプレイヤーの簡易AI・報酬・終了判定）は ChaseEnv と同じ。
+    SB3 の VecEnv としてそのまま PPO に渡せる（DummyVecEnv と同様に終了した面は自動リセット）。
+    """
+
+    def __init__(self, num_envs=1024, seed=None, max_steps=100, width=GRID_WIDTH, height=GRID_HEIGHT):
+        self.width, self.height = width, height
+        observation_space = spaces.Box(
+            low=np.array([0, 0, 0, 0, 0, 0]),
+            high=np.array([width-1, height-1,
+                           width-1, height-1,
+                           width-1, height-1]),
+            dtype=np.int32
+        )
+        action_space = spaces.MultiDiscrete([4, 4])
+        self.render_mode = None
+        super().__init__(num_envs, observation_space, action_space)
+
+        self.max_steps = max_steps
+        self.rng = np.random.default_rng(seed)
+        self._sampler = LayoutSampler(width, height)
+
+        # 全面の状態。地形は FieldGrid と同じ外周壁付きの uint8 配列を面の数だけ並べる
+        self.grids = np.full((num_envs, height + 2, width + 2), WALL, dtype=np.uint8)
+        self.enemy_positions = np.zeros((num_envs, 2, 2), dtype=np.int64)  # [面, 鬼, (x, y)]
+        self.player_pos = np.zeros((num_envs, 2), dtype=np.int64)
+        self.current_step = np.zeros(num_envs, dtype=np.int64)
+        self.actions = np.zeros((num_envs, 2), dtype=np.int64)
+
+    # --- 初期配置 ---
+    def _reset_envs(self, idx):
+        """idx で指定した面のフィールド・鬼・プレイヤーを初期化する"""
+        k = len(idx)
+        if k == 0:
+            return
+        self.player_pos[idx] = self._sampler.player_start
+        self.current_step[idx] = 0
+
+        # 岩と鬼の配置は LayoutPool と同じ LayoutSampler で引く
+        rocks, pair = self._sampler.sample(self.rng, k)
+        self.grids[idx, 1:-1, 1:-1] = np.where(rocks, ROCK, GRASS).reshape(k, self.height, self.width)
+        self.enemy_positions[idx, :, 0] = pair % self.width
+        self.enemy_positions[idx, :, 1] = pair // self.width
+
+    def _get_obs(self, idx=slice(None)):
+        obs = np.concatenate([self.enemy_positions[idx].reshape(-1, 4),
+                              self.player_pos[idx]], axis=1)
+        return obs.astype(np.int32)
+
+    def _is_free(self, env_idx, pos):
+        """pos (N, 2) に移動できるか。外周が壁なので範囲チェックは不要"""
+        return self.grids[env_idx, pos[:, 1] + 1, pos[:, 0] + 1] == GRASS
+
+    # --- VecEnv API ---
+    def reset(self):
+        if self._seeds[0] is not None:
+            self.rng = np.random.default_rng(self._seeds[0])
+        self._reset_envs(np.arange(self.num_envs))
+        self._reset_seeds()
+        self._reset_options()
+        return self._get_obs()
+
+    def step_async(self, actions):
+        self.actions = np.asarray(actions).reshape(self.num_envs, 2)
+
+    def step_wait(self):
+        n = self.num_envs
+        env_idx = np.arange(n)
+        self.current_step += 1
+        reward = np.zeros(n)
+
+        # --- 鬼の移動 ---
+        # 報酬の浮動小数点の足し順を ChaseEnv と揃えるため鬼ごとに加算する
+        for i in range(2):
+            pos = self.enemy_positions[:, i]
+            old_dist = np.sum((pos - self.player_pos) ** 2, axis=1)
+            next_pos = pos + ACTION_DELTAS[self.actions[:, i]]
+            moved = self._is_free(env_idx, next_pos)
+            pos[moved] = next_pos[moved]
+
+            reward[~moved] -= 0.1  # 岩・壁にぶつかった
+            new_dist = np.sum((pos - self.player_pos) ** 2, axis=1)
+            reward += np.where(new_dist < old_dist, 0.05, -0.02)
+
+        # --- プレイヤーキャラ（簡易AI） ---
+        # 鬼の平均位置に基づいて逃げる（平均との比較は2倍した座標和で行う）
+        enemy_sum = self.enemy_positions.sum(axis=1)
+        step_dir = np.sign(2 * self.player_pos - enemy_sum)
+        next_player_pos = self.player_pos + step_dir
+        moved = self._is_free(env_idx, next_player_pos)
+        self.player_pos[moved] = next_player_pos[moved]
+
+        # 10%の確率でランダム移動（ChaseEnv と同じく岩チェックなし）
+        rand = self.rng.random(n) < 0.1
+        rand_move = RANDOM_MOVES[self.rng.integers(0, 5, size=n)]
+        self.player_pos[rand] = np.clip(self.player_pos[rand] + rand_move[rand],
+                                        0, [self.width-1, self.height-1])
+
+        # --- 終了判定 ---
+        caught = np.all(self.enemy_positions == self.player_pos[:, None, :], axis=2)
+        terminated = caught.any(axis=1)
+        truncated = self.current_step >= self.max_steps
+        reward[terminated] += 100
+
+        dones = terminated | truncated
+        obs = self._get_obs()
+        infos = [{} for _ in range(n)]
+        done_idx = np.flatnonzero(dones)
+        for j in done_idx:
+            infos[j]["TimeLimit.truncated"] = bool(truncated[j] and not terminated[j])
+            infos[j]["terminal_observation"] = obs[j].copy()
+        if len(done_idx):
+            self._reset_envs(done_idx)
+            obs[done_idx] = self._get_obs(done_idx)
+        return obs, reward.astype(np.float32), dones, infos
+
+    def close(self):
+        pass
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        # 属性は全環境で1つなので、一部の環境だけに設定することはできない
+        if set(self._get_indices(indices)) != set(range(self.num_envs)):
+            raise ValueError("ChaseVecEnv の属性は全ての環境で共通なので、indices で一部だけには設定できません")
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        # メソッドは全環境をまとめて扱うので、set_attr と同じく全ての環境を指定したときだけ1回呼ぶ
+        if set(self._get_indices(indices)) != set(range(self.num_envs)):
+            raise ValueError("ChaseVecEnv のメソッドは全ての環境をまとめて扱うので、indices で一部だけには呼べません")
+        return [getattr(self, method_name)(*method_args, **method_kwargs)] * self.num_envs
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
+
+
+def main():
+    from stable_baselines3.common.vec_env import DummyVecEnv
+    from oni_double_env import ChaseEnv
+
+    print("--- ChaseVecEnv と DummyVecEnv の速度比較 ---")
+    n_steps = 200
+    for name, env in [("DummyVecEnv(64)", DummyVecEnv([ChaseEnv for _ in range(64)])),
+                      ("ChaseVecEnv(64)", ChaseVecEnv(64, seed=0)),
+                      ("ChaseVecEnv(4096)", ChaseVecEnv(4096, seed=0))]:
+        env.reset()
+        actions = np.random.randint(0, 4, size=(n_steps, env.num_envs, 2))
+        start = time.perf_counter()
+        for t in range(n_steps):
+            env.step(actions[t])
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {n_steps * env.num_envs / elapsed:,.0f} steps/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import os
+import sys
+import time
+
+import gymnasium as gym
+import numpy as np
+from gymnasium import spaces
+
+from game_state import GameState, MOVES, PLAYING, CAUGHT, CLEAR
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "stage_info"))
+from stage_info import Stage1, Stage2, Stage3
+
+STAGES = [Stage1, Stage2, Stage3]
+UNREACHABLE = 1 << 30
+
+
+class ScriptedPlayer:
+    """
+    学習相手の簡易プレイヤー。近いコイン（ロープが下りきったらロープ）へ最短経路で向かい、
+    鬼が隣まで来ているマスには入らない。
+    """
+
+    def __init__(self):
+        self._neighbors = {}
+        self._field_key = self._field = None
+
+    def neighbors(self, state):
+        """各マスから1歩で行けるマスの番号 (y * 幅 + x) の一覧。ステージごとに1回だけ作る"""
+        key = id(state.rock)
+        if key not in self._neighbors:
+            width = state.width
+            self._neighbors[key] = [[(y + dy) * width + x + dx for dx, dy in MOVES if state.is_free(x + dx, y + dy)]
+                                    for y in range(state.height) for x in range(width)]
+        return self._neighbors[key]
+
+    def target_field(self, state):
+        """
+        各マスから一番近い目標までの歩数。全目標から同時に幅優先探索して作る
+        （コインが取られるかロープが下りきったときだけ作り直す。盤面の大きさに比例した時間で済む）
+        """
+        key = (id(state), frozenset(state.coins), state.rope_finished)
+        if key != self._field_key:
+            targets = [state.rope_pos] if state.rope_finished or not state.coins else state.coins
+            neighbors = self.neighbors(state)
+            field = [UNREACHABLE] * len(neighbors)
+            queue = [y * state.width + x for x, y in targets]
+            for cell in queue:
+                field[cell] = 0
+            for cell in queue:  # queue は後ろに足しながら先頭から読む（幅優先）
+                d = field[cell] + 1
+                for nxt in neighbors[cell]:
+                    if field[nxt] > d:
+                        field[nxt] = d
+                        queue.append(nxt)
+            self._field, self._field_key = field, key
+        return self._field
+
+    def __call__(self, state):
+        field = self.target_field(state)
+        px, py = state.player
+        best, best_score = None, None
+        for move, (dx, dy) in enumerate(MOVES):
+            x, y = px + dx, py + dy
+            if not state.is_free(x, y):
+                continue
+            danger = min(abs(x - ox) + abs(y - oy) for ox, oy in state.onis) <= 1
+            score = (danger, field[y * state.width + x])
+            if best_score is None or score < best_score:
+                best, best_score = move, score
+        return best
+
+
+class StageChaseEnv(gym.Env):
+    """
+    本物のステージのルール（草むら・コイン・ロープ・クリア）で2体の鬼を学習させる環境。
+
+    GameState をヘッドレスで動かし、鬼の番が来るたびに1ステップとする。観測と行動は ChaseEnv と同じ。
+    報酬も ChaseEnv と同じ形で、捕まえたら +100、プレイヤーに逃げ切られたら（ステージクリア） -100。
+
+    :param stages: 使うステージ（stage_info の StageN モジュール）の一覧。reset ごとにランダムに選ぶ
+    :param player_policy: GameState を受け取りプレイヤーの移動の向き（または None）を返す関数
+    :param max_turns: 鬼が動く回数の上限
+    """
+
+    def __init__(self, stages=None, player_policy=None, max_turns=300):
+        super().__init__()
+        self.stages = stages or STAGES
+        # 観測の上限は一番大きいステージに合わせる（標準のステージはどれも 10x10）
+        width = max(len(stage.ROCK_LAYOUT[0]) for stage in self.stages)
+        height = max(len(stage.ROCK_LAYOUT) for stage in self.stages)
+        self.observation_space = spaces.Box(low=0, high=np.array([width - 1, height - 1] * 3), dtype=np.int32)
+        self.action_space = spaces.MultiDiscrete([4, 4])
+        self.player_policy = player_policy or ScriptedPlayer()
+        self.max_turns = max_turns
+        self.current_step = 0
+        self.state = None
+        self._states = {}
+        self._actions = None
+        self._reward = 0.0
+
+    def _control_onis(self, state):
+        """GameState から鬼の番に呼ばれ、step() で受け取った行動で鬼を動かす"""
+        px, py = state.player
+        onis = []
+        for pos, action in zip(state.onis, self._actions):
+            next_pos = state.apply_oni_action(pos, action)
+            if next_pos == pos:
+                self._reward -= 0.1  # 岩や壁にぶつかった
+            # 距離の大小だけ見ればよいので2乗のまま比べる
+            if (next_pos[0] - px) ** 2 + (next_pos[1] - py) ** 2 < (pos[0] - px) ** 2 + (pos[1] - py) ** 2:
+                self._reward += 0.05
+            else:
+                self._reward -= 0.02
+            onis.append(next_pos)
+        return onis
+
+    def _obs(self):
+        return self.state.observation().astype(np.int32)
+
+    def reset(self, seed=None, options=None):
+        super().reset(seed=seed)
+        stage = self.stages[self.np_random.integers(len(self.stages))]
+        # ステージごとに GameState を使い回す（毎回作り直さない）
+        if stage not in self._states:
+            self._states[stage] = GameState.from_stage(stage, oni_controller=self._control_onis)
+        self.state = self._states[stage]
+        self.state.rng.seed(int(self.np_random.integers(2 ** 32)))
+        self.state.reset()
+        self.current_step = 0
+        return self._obs(), {"stage": stage.__name__}
+
+    def step(self, actions):
+        self.current_step += 1
+        self._actions = actions
+        self._reward = 0.0
+        state = self.state
+        # 鬼が1回動くまで、何も起きない時間は飛ばしながらゲームを進める
+        while state.status == PLAYING:
+            if "oni_move" in state.step(self.player_policy(state), state.time_to_next_event()):
+                break
+
+        reward = self._reward
+        if state.status == CAUGHT:
+            reward += 100
+        elif state.status == CLEAR:
+            reward -= 100
+        terminated = state.status != PLAYING
+        truncated = not terminated and self.current_step >= self.max_turns
+        return self._obs(), reward, terminated, truncated, {"status": state.status, "coins": state.coin_count}
+
+
+def main():
+    print("--- 本物のステージでのヘッドレス対戦（鬼はランダム） ---")
+    env = StageChaseEnv()
+    env.reset(seed=0)
+    results = {PLAYING: 0, CAUGHT: 0, CLEAR: 0}
+    n_games, n_steps = 2000, 0
+    # action_space.sample() は1回ごとが遅いので、鬼の行動はまとめて作っておく
+    actions = env.np_random.integers(0, 4, size=(n_games * env.max_turns, 2)).tolist()
+    start = time.perf_counter()
+    for _ in range(n_games):
+        env.reset()
+        while True:
+            _, _, terminated, truncated, info = env.step(actions[n_steps])
+            n_steps += 1
+            if terminated or truncated:
+                results[info["status"]] += 1
+                break
+    elapsed = time.perf_counter() - start
+    print(f"{n_games} ゲーム ({n_steps} ステップ) を {elapsed:.2f} 秒: {n_games / elapsed:.0f} ゲーム/秒, {n_steps / elapsed:.0f} ステップ/秒")
+    print("結果:", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+import argparse
+import importlib
+import multiprocessing as mp
+import os
+import random
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.vec_env import DummyVecEnv, VecEnv, VecMonitor
+
+from training import add_training_args, load_config, make_ppo, train
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_env_class(env_spec, env_dir=None):
+    """
+    "モジュール名:クラス名" の形式で環境クラスを読み込む。
+
+    :param env_spec: 例 "oni_double_env:ChaseEnv", "oni_double_vec_env:ChaseVecEnv"
+    :param env_dir: 環境モジュールのあるフォルダ（例 ../code_ueno）。省略時はこのフォルダ
+    """
+    env_dir = os.path.abspath(env_dir or BASE_DIR)
+    if env_dir not in sys.path:
+        sys.path.insert(0, env_dir)
+    module_name, class_name = env_spec.split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def make_worker_vec_env(env_spec, env_dir, n_envs, seed, env_kwargs=None):
+    """ワーカー1つ分の環境をまとめた VecEnv を作る（ベクトル化環境ならそのまま使う）"""
+    # ChaseEnv は組み込みの random / np.random で動くので、ワーカーごとに別の種を入れる
+    random.seed(seed)
+    np.random.seed(seed)
+    env_cls = load_env_class(env_spec, env_dir)
+    env_kwargs = env_kwargs or {}
+    if issubclass(env_cls, VecEnv):
+        return env_cls(n_envs, seed=seed, **env_kwargs)
+    venv = DummyVecEnv([lambda: env_cls(**env_kwargs) for _ in range(n_envs)])
+    venv.seed(seed)
+    return venv
+
+
+def _worker(remote, parent_remote, env_spec, env_dir, env_kwargs, start, n_envs, seed, buffer_specs):
+    parent_remote.close()
+    venv = make_worker_vec_env(env_spec, env_dir, n_envs, seed, env_kwargs)
+    # 共有メモリ上のバッファのうち、このワーカーの担当部分だけを見る
+    shms, buffers = [], {}
+    for name, (shm_name, shape, dtype) in buffer_specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        shms.append(shm)
+        buffers[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)[start:start + n_envs]
+    try:
+        while True:
+            cmd, data, local = remote.recv()  # local: このワーカーの中での環境の番号（属性・メソッド用）
+            if cmd == "step":
+                obs, rewards, dones, infos = venv.step(buffers["actions"])
+                buffers["obs"][:] = obs
+                buffers["rewards"][:] = rewards
+                buffers["dones"][:] = dones
+                # info はほとんど空なので、中身のあるものだけを送り返す
+                remote.send({i: info for i, info in enumerate(infos) if info})
+            elif cmd == "reset":
+                if data is not None:
+                    venv.seed(data)
+                buffers["obs"][:] = venv.reset()
+                remote.send(None)
+            elif cmd in ("get_attr", "set_attr", "env_method", "env_is_wrapped"):
+                # 例外はワーカーを止めずに親へ送り返し、親で送出する
+                try:
+                    if cmd == "get_attr":
+                        result = venv.get_attr(data, local)
+                    elif cmd == "set_attr":
+                        result = venv.set_attr(*data, indices=local)
+                    elif cmd == "env_method":
+                        name, args, kwargs = data
+                        result = venv.env_method(name, *args, indices=local, **kwargs)
+                    else:
+                        result = venv.env_is_wrapped(data, local)
+                except Exception as e:
+                    result = e
+                remote.send(result)
+            elif cmd == "close":
+                venv.close()
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for shm in shms:
+            shm.close()
+        remote.close()
+
+
+class SharedMemoryVecEnv(VecEnv):
+    """
+    ワーカープロセスごとに複数の環境を持たせる VecEnv。
+
+    観測・行動・報酬・終了フラグは共有メモリに直接読み書きし、パイプで送るのは
+    コマンドと中身のある info だけにする（SubprocVecEnv は毎ステップ観測を pickle して送る）。
+    """
+
+    def __init__(self, env_spec, n_workers, envs_per_worker, seeds, env_dir=None, start_method="forkserver",
+                 env_kwargs=None):
+        self.n_workers = n_workers
+        self.envs_per_worker = envs_per_worker
+        num_envs = n_workers * envs_per_worker
+
+        # 観測・行動空間は親プロセスで1つ作って調べる
+        probe = make_worker_vec_env(env_spec, env_dir, 1, seeds[0], env_kwargs)
+        observation_space, action_space = probe.observation_space, probe.action_space
+        probe.close()
+
+        action_shape = action_space.shape or ()
+        specs = {
+            "obs": ((num_envs, *observation_space.shape), observation_space.dtype),
+            "actions": ((num_envs, *action_shape), action_space.dtype),
+            "rewards": ((num_envs,), np.float32),
+            "dones": ((num_envs,), np.bool_),
+        }
+        self._shms, self._buffers, buffer_specs = [], {}, {}
+        for name, (shape, dtype) in specs.items():
+            size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            shm = shared_memory.SharedMemory(create=True, size=size)
+            self._shms.append(shm)
+            self._buffers[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            buffer_specs[name] = (shm.name, shape, np.dtype(dtype).str)
+
+        ctx = mp.get_context(start_method)
+        self.remotes, self.processes = [], []
+        for w in range(n_workers):
+            remote, work_remote = ctx.Pipe()
+            args = (work_remote, remote, env_spec, env_dir, env_kwargs, w * envs_per_worker,
+                    envs_per_worker, seeds[w], buffer_specs)
+            process = ctx.Process(target=_worker, args=args, daemon=True)
+            process.start()
+            work_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+        self.closed = False
+        super().__init__(num_envs, observation_space, action_space)
+
+    def reset(self):
+        for w, remote in enumerate(self.remotes):
+            seed = self._seeds[w * self.envs_per_worker]
+            remote.send(("reset", seed, None))
+        for remote in self.remotes:
+            remote.recv()
+        self._reset_seeds()
+        self._reset_options()
+        return self._buffers["obs"].copy()
+
+    def step_async(self, actions):
+        self._buffers["actions"][:] = np.asarray(actions).reshape(self._buffers["actions"].shape)
+        for remote in self.remotes:
+            remote.send(("step", None, None))
+
+    def step_wait(self):
+        infos = [{} for _ in range(self.num_envs)]
+        for w, remote in enumerate(self.remotes):
+            for i, info in remote.recv().items():
+                infos[w * self.envs_per_worker + i] = info
+        return (self._buffers["obs"].copy(), self._buffers["rewards"].copy(),
+                self._buffers["dones"].copy(), infos)
+
+    def close(self):
+        if self.closed:
+            return
+        for remote in self.remotes:
+            remote.send(("close", None, None))
+        for process in self.processes:
+            process.join()
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+        self.closed = True
+
+    def _per_worker(self, cmd, data, indices):
+        """
+        indices をワーカーごとのワーカー内の番号に分け、各ワーカーに1回だけコマンドを送る。
+
+        :return: indices の順に並べた結果
+        """
+        indices = list(self._get_indices(indices))
+        local = {}  # ワーカー → そのワーカー内の番号の一覧（同じ番号が重なってもよい）
+        for i in indices:
+            local.setdefault(i // self.envs_per_worker, []).append(i % self.envs_per_worker)
+        for w, local_indices in local.items():
+            self.remotes[w].send((cmd, data, local_indices))
+        # 例外があっても全ワーカーの返事を受け取ってから送出する（パイプに返事を残さない）
+        replies = {w: self.remotes[w].recv() for w in local}
+        for result in replies.values():
+            if isinstance(result, Exception):
+                raise result
+        results = {w: iter(result if result is not None else [None] * len(local[w])) for w, result in replies.items()}
+        return [next(results[i // self.envs_per_worker]) for i in indices]
+
+    def get_attr(self, attr_name, indices=None):
+        return self._per_worker("get_attr", attr_name, indices)
+
+    def set_attr(self, attr_name, value, indices=None):
+        self._per_worker("set_attr", (attr_name, value), indices)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return self._per_worker("env_method", (method_name, method_args, method_kwargs), indices)
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return self._per_worker("env_is_wrapped", wrapper_class, indices)
+
+
+class ThroughputCallback(BaseCallback):
+    """ロールアウトごとの環境ステップ数/秒と PPO 更新時間を記録する（最初の1回はウォームアップとして除く）"""
+
+    def __init__(self, verbose=0):
+        super().__init__(verbose)
+        self.rollout_start = None
+        self.rollout_end = None
+        self.rollouts = []  # (env_steps/sec, 更新時間[秒])
+
+    def _on_rollout_start(self):
+        now = time.perf_counter()
+        if self.rollout_end is not None:
+            update_time = now - self.rollout_end
+            self.rollouts[-1] = (self.rollouts[-1][0], update_time)
+            self.logger.record("perf/update_time_s", update_time)
+        self.rollout_start = now
+
+    def _on_rollout_end(self):
+        self.rollout_end = time.perf_counter()
+        steps = self.model.n_steps * self.training_env.num_envs
+        steps_per_sec = steps / (self.rollout_end - self.rollout_start)
+        self.rollouts.append((steps_per_sec, None))
+        self.logger.record("perf/env_steps_per_sec", steps_per_sec)
+
+    def _on_step(self):
+        return True
+
+    def summary(self):
+        steady = [r for r in self.rollouts[1:] if r[1] is not None]
+        if not steady:
+            return None
+        return (float(np.mean([r[0] for r in steady])), float(np.mean([r[1] for r in steady])))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="複数プロセスで鬼の PPO を学習する")
+    parser.add_argument("--env", default="oni_double_env:ChaseEnv",
+                        help="環境クラス (モジュール:クラス)。oni_double_vec_env:ChaseVecEnv も指定できる")
+    parser.add_argument("--env-dir", default=None,
+                        help="環境モジュールのあるフォルダ（例: ../code_ueno で enemy_env:ChaseEnv など）")
+    parser.add_argument("--stages", default=None,
+                        help="ゲームのステージの岩配置で学習する（例: 1,2,3 や 1:2,3:1 でステージ番号:重み）。"
+                             "--env は layout_pool:StageLayoutChaseEnv になる")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="ワーカープロセス数")
+    parser.add_argument("--envs-per-worker", type=int, default=8, help="1ワーカーあたりの環境数")
+    parser.add_argument("--seed", type=int, default=0, help="ワーカー i の種は seed + i")
+    parser.add_argument("--seeds", type=str, default=None, help="ワーカーごとの種をカンマ区切りで指定")
+    parser.add_argument("--n-steps", type=int, default=None,
+                        help="環境1つあたりのロールアウト長（省略時は1回のロールアウトが設定の n_steps ステップになる値）")
+    parser.add_argument("--batch-size", type=int, default=None, help="省略時は設定の batch_size")
+    parser.add_argument("--start-method", default="forkserver", choices=["fork", "forkserver", "spawn"])
+    parser.add_argument("--save", default=os.path.join("model", "oni_double_model"))
+    add_training_args(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.seeds:
+        seeds = [int(s) for s in args.seeds.split(",")]
+        if len(seeds) != args.workers:
+            raise SystemExit(f"--seeds の数 ({len(seeds)}) が --workers ({args.workers}) と一致しません")
+    else:
+        seeds = [args.seed + i for i in range(args.workers)]
+
+    env_spec, env_kwargs = args.env, None
+    if args.stages:
+        env_spec, env_kwargs = "layout_pool:StageLayoutChaseEnv", {"stages": args.stages}
+    env = SharedMemoryVecEnv(env_spec, args.workers, args.envs_per_worker, seeds,
+                             env_dir=args.env_dir, start_method=args.start_method, env_kwargs=env_kwargs)
+    env = VecMonitor(env)
+    config = load_config(args.config)
+    # 設定の n_steps は1回のロールアウトの合計として、環境の数で割る
+    config["n_steps"] = args.n_steps or max(16, config["n_steps"] // env.num_envs)
+    config["batch_size"] = args.batch_size or config["batch_size"]
+    print(f"ワーカー {args.workers} x 環境 {args.envs_per_worker} = {env.num_envs} 環境, n_steps={config['n_steps']}")
+
+    # 評価は1面ずつの環境で行う（ベクトル化環境で学習するときは同じルールの ChaseEnv）
+    env_cls = load_env_class(env_spec, args.env_dir)
+    if issubclass(env_cls, VecEnv):
+        from oni_double_env import ChaseEnv
+        eval_env = ChaseEnv()
+    else:
+        eval_env = env_cls(**(env_kwargs or {}))
+
+    def make_model():
+        # ハイパーパラメータは oni_double_learn.py と同じ training.PPO_CONFIG
+        return make_ppo(env, config, verbose=1, seed=args.seed)
+
+    throughput = ThroughputCallback()
+    start = time.perf_counter()
+    try:
+        train(make_model, env, eval_env, args.save, args, callbacks=[throughput])
+    finally:
+        env.close()
+    elapsed = time.perf_counter() - start
+
+    summary = throughput.summary()
+    print(f"学習時間: {elapsed:.1f} 秒")
+    if summary:
+        print(f"定常状態: {summary[0]:,.0f} env steps/sec, 更新 {summary[1]:.2f} 秒/回")
+
+
+if __name__ == "__main__":
+    main()
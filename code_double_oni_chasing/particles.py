@@ -0,0 +1,107 @@
+import os
+import time
+
+import numpy as np
+import pygame
+
+
+class LeafParticles:
+    """
+    タイトル画面の落ち葉を NumPy 配列でまとめて動かすパーティクル。
+
+    位置・速度・回転角は1枚ずつのオブジェクトではなく配列に持ち、update() は配列演算1回で全部動かす。
+    画面外に出たものはマスクでまとめて消す。回転した画像は rotation_steps 段階に量子化して
+    最初に全部作っておくので、毎フレーム pygame.transform.rotate を呼ばない。
+    """
+
+    def __init__(self, image, width, height, capacity=4096, rotation_steps=120, margin=50, seed=None):
+        self.width, self.height, self.margin = width, height, margin
+        self.capacity = capacity
+        self.count = 0
+        self.rng = np.random.default_rng(seed)
+        # [x, y, vx, vy, 回転角, 回転速度] を1行に持つ
+        self.state = np.zeros((capacity, 6))
+
+        self.step_angle = 360 / rotation_steps
+        self.frames = [pygame.transform.rotate(image, k * self.step_angle) for k in range(rotation_steps)]
+        for frame in self.frames:
+            frame.set_alpha(255, pygame.RLEACCEL)  # 透明な部分を飛ばして描けるよう RLE 圧縮しておく
+        # 中心 (x, y) に置くときの左上までのずれ（get_rect(center=...) と同じ丸め方）
+        self.half_sizes = np.array([(f.get_width() // 2, f.get_height() // 2) for f in self.frames])
+
+    def spawn(self, n=1):
+        """画面の右上から n 枚追加する（分布は元の Leaf クラスと同じ）"""
+        n = min(n, self.capacity - self.count)
+        if n <= 0:
+            return
+        new = self.state[self.count:self.count + n]
+        new[:, 0] = self.rng.integers(self.width // 2, self.width + self.margin, endpoint=True, size=n)
+        new[:, 1] = self.rng.integers(-self.margin, 0, endpoint=True, size=n)
+        new[:, 2] = self.rng.uniform(-1.5, 0.5, size=n)
+        new[:, 3] = self.rng.uniform(0.5, 2.0, size=n)
+        new[:, 4] = self.rng.uniform(0, 360, size=n)
+        new[:, 5] = self.rng.uniform(-3, 3, size=n)
+        self.count += n
+
+    def update(self):
+        s = self.state[:self.count]
+        s[:, 0:2] += s[:, 2:4]
+        s[:, 4] += s[:, 5]
+        np.mod(s[:, 4], 360, out=s[:, 4])
+        # 画面の外（余白 margin より外）に出たものを詰めて消す
+        m = self.margin
+        inside = (-m < s[:, 0]) & (s[:, 0] < self.width + m) & (-m < s[:, 1]) & (s[:, 1] < self.height + m)
+        if not inside.all():
+            kept = s[inside]
+            self.count = len(kept)
+            self.state[:self.count] = kept
+
+    def draw(self, surface):
+        if self.count == 0:
+            return
+        s = self.state[:self.count]
+        frame_ids = np.rint(s[:, 4] / self.step_angle).astype(np.intp) % len(self.frames)
+        topleft = s[:, 0:2].astype(np.intp) - self.half_sizes[frame_ids]
+        frames = self.frames
+        surface.blits([(frames[k], (x, y)) for k, (x, y) in zip(frame_ids.tolist(), topleft.tolist())], doreturn=False)
+
+    def __len__(self):
+        return self.count
+
+
+def main():
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.init()
+    width = height = 600
+    screen = pygame.display.set_mode((width, height))
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    leaf_img = pygame.transform.scale(pygame.image.load(os.path.join(base_dir, "image", "leaf.png")).convert_alpha(), (50, 50))
+
+    print("--- 落ち葉パーティクルの速度（1フレームの update + draw） ---")
+    n_frames = 120
+    for n in (100, 1000, 4000):
+        # 従来の方式: 1枚ずつ Python で動かし、毎フレーム回転した画像を作る
+        leaves = [[np.random.uniform(0, width), np.random.uniform(0, height), np.random.uniform(-1.5, 0.5),
+                   np.random.uniform(0.5, 2.0), np.random.uniform(0, 360), np.random.uniform(-3, 3)] for _ in range(n)]
+        start = time.perf_counter()
+        for _ in range(n_frames):
+            for leaf in leaves:
+                leaf[0] += leaf[2]; leaf[1] += leaf[3]; leaf[4] = (leaf[4] + leaf[5]) % 360
+                rotated = pygame.transform.rotate(leaf_img, leaf[4])
+                screen.blit(rotated, rotated.get_rect(center=(int(leaf[0]), int(leaf[1]))))
+        old = (time.perf_counter() - start) / n_frames
+
+        particles = LeafParticles(leaf_img, width, height, capacity=n, seed=0)
+        particles.spawn(n)
+        particles.state[:n, 0] = particles.rng.uniform(0, width, size=n)
+        particles.state[:n, 1] = particles.rng.uniform(0, height, size=n)
+        start = time.perf_counter()
+        for _ in range(n_frames):
+            particles.update()
+            particles.draw(screen)
+        new = (time.perf_counter() - start) / n_frames
+        print(f"{n:5d} 枚: 従来 {old * 1000:7.2f} ms, LeafParticles {new * 1000:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+学習済みの方策を、全ての状態について決定的な行動を引く表（方策表）に蒸留する。
+
+    python policy_table.py                              # model/oni_double_model → model/oni_double_model_table.npz
+    python policy_table.py model/oni_model.zip          # 鬼1体のモデル（100^2 状態）
+
+観測は座標だけで地形を含まないので、10x10 で作った表はどのステージでもそのまま使える。
+鬼2体なら 100^3 = 100万状態 x 4ビット = 約500KB。ゲームは PolicyTable.action(観測) で
+表を1回引くだけになり、実行時に torch も NumPy の行列計算も使わない。
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TABLE_SUFFIX = "_table.npz"
+
+
+def action_bits(nvec):
+    """1状態の行動をまとめて詰めるビット数（1バイトに収まるよう 1, 2, 4, 8 のどれかに切り上げる）"""
+    bits = sum(max(1, int(n - 1).bit_length()) for n in nvec)
+    for size in (1, 2, 4, 8):
+        if bits <= size:
+            return size
+    raise ValueError(f"行動が1バイトに収まりません: nvec={list(nvec)}")
+
+
+def encode_actions(actions, nvec):
+    """行動 (N, len(nvec)) → 表に入れる番号 (N,)。鬼ごとの行動を下位ビットから並べる"""
+    codes = np.zeros(len(actions), dtype=np.uint8)
+    shift = 0
+    for i, n in enumerate(nvec):
+        codes |= (actions[:, i].astype(np.uint8) << shift)
+        shift += max(1, int(n - 1).bit_length())
+    return codes
+
+
+def pack_codes(codes, bits):
+    """行動番号 (N,) → ビット詰めした uint8 の配列。状態 i は packed[i // per_byte] の (i % per_byte) * bits ビット目から"""
+    per_byte = 8 // bits
+    padded = np.zeros(-(-len(codes) // per_byte) * per_byte, dtype=np.uint8)
+    padded[:len(codes)] = codes
+    shifts = (np.arange(per_byte) * bits).astype(np.uint8)
+    return np.bitwise_or.reduce(padded.reshape(-1, per_byte) << shifts, axis=1).astype(np.uint8)
+
+
+def unpack_table(packed, bits, n_states):
+    """pack_codes の逆。ビット詰めした表 → 行動番号 (n_states,)"""
+    per_byte = 8 // bits
+    shifts = (np.arange(per_byte) * bits).astype(np.uint8)
+    return ((packed[:, None] >> shifts) & ((1 << bits) - 1)).reshape(-1)[:n_states]
+
+
+def decode_states(start, stop, width, height, n_positions):
+    """状態番号 start..stop-1 → 観測 (N, 2 * n_positions)。状態番号は各座標のマス番号 y*width+x を並べた数"""
+    cells = width * height
+    index = np.arange(start, stop, dtype=np.int64)
+    obs = np.empty((stop - start, 2 * n_positions), dtype=np.int32)
+    for k in reversed(range(n_positions)):
+        index, cell = np.divmod(index, cells)
+        obs[:, 2 * k] = cell % width
+        obs[:, 2 * k + 1] = cell // width
+    return obs
+
+
+def state_index(obs, width, height):
+    """観測 (N, 2 * n_positions) → 状態番号 (N,)"""
+    obs = np.asarray(obs, dtype=np.int64).reshape(len(obs), -1)
+    index = np.zeros(len(obs), dtype=np.int64)
+    for k in range(0, obs.shape[1], 2):
+        index = index * (width * height) + obs[:, k + 1] * width + obs[:, k]
+    return index
+
+
+def build_table(model, width, height, n_positions, nvec, batch_size=65536):
+    """
+    全状態について model.predict(deterministic=True) を batch_size ずつ計算し、ビット詰めした表を返す
+
+    :return: uint8 の配列。状態 i の行動番号は packed[i // per_byte] の (i % per_byte) * bits ビット目から
+    """
+    n_states = (width * height) ** n_positions
+    codes = np.empty(n_states, dtype=np.uint8)
+    for start in range(0, n_states, batch_size):
+        stop = min(start + batch_size, n_states)
+        actions, _ = model.predict(decode_states(start, stop, width, height, n_positions), deterministic=True)
+        codes[start:stop] = encode_actions(np.asarray(actions).reshape(stop - start, -1), nvec)
+    return pack_codes(codes, action_bits(nvec))
+
+
+def export_table(model_path, out_path=None, width=10, height=10, batch_size=65536):
+    """
+    PPO の zip か numpy_policy の .npz から方策表を作って保存する
+
+    :param width, height: 学習した盤面の大きさ（PPO の zip なら観測空間から読む）
+    :return: 保存したパス
+    """
+    from inference_service import load_policy
+
+    model = load_policy(model_path)
+    if hasattr(model, "observation_space"):
+        high = model.observation_space.high
+        width, height, obs_size = int(high[0]) + 1, int(high[1]) + 1, len(high)
+        space = model.action_space
+        discrete = not hasattr(space, "nvec")
+        nvec = [int(space.n)] if discrete else [int(n) for n in space.nvec]
+    else:
+        # NumpyPolicy（行動は MultiDiscrete だけ）
+        obs_size, nvec, discrete = model.layers[0][0].shape[0], [int(n) for n in model.nvec], False
+
+    packed = build_table(model, width, height, obs_size // 2, nvec, batch_size)
+    out_path = out_path or os.path.splitext(model_path)[0] + TABLE_SUFFIX
+    np.savez_compressed(out_path, packed=packed, width=width, height=height, n_positions=obs_size // 2,
+                        nvec=nvec, bits=action_bits(nvec), discrete=discrete)
+    return out_path
+
+
+class PolicyTable:
+    """
+    export_table で書き出した方策表。predict() は PPO.predict と同じく (行動, None) を返し、
+    観測1つでもバッチ (N, 観測の次元) でも受け付ける。ゲームからは速い action() を使う。
+    """
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.packed = data["packed"]
+            self.width, self.height = int(data["width"]), int(data["height"])
+            self.n_positions = int(data["n_positions"])
+            self.nvec = [int(n) for n in data["nvec"]]
+            self.bits = int(data["bits"])
+            self.discrete = bool(data["discrete"])
+        self.cells = self.width * self.height
+        self.per_byte = 8 // self.bits
+        self.mask = (1 << self.bits) - 1
+        # 行動番号 → 行動。鬼2体なら (鬼1, 鬼2) のタプル、Discrete なら整数
+        codes = np.arange(1 << self.bits, dtype=np.uint8)
+        decoded = np.zeros((len(codes), len(self.nvec)), dtype=np.int64)
+        shift = 0
+        for i, n in enumerate(self.nvec):
+            decoded[:, i] = (codes >> shift) & ((1 << max(1, (n - 1).bit_length())) - 1)
+            shift += max(1, (n - 1).bit_length())
+        self._decoded = decoded[:, 0] if self.discrete else decoded
+        self._actions = [int(a[0]) if self.discrete else tuple(int(x) for x in a) for a in decoded]
+        # 1状態ずつ引くときは NumPy の配列より bytes の添字の方が速い
+        self._bytes = self.packed.tobytes()
+
+    def action(self, obs):
+        """観測1つ → 行動。Python の整数演算と bytes の添字だけで引く"""
+        xy = obs.tolist() if hasattr(obs, "tolist") else obs
+        width, cells = self.width, self.cells
+        index = 0
+        for k in range(0, len(xy), 2):
+            index = index * cells + xy[k + 1] * width + xy[k]
+        byte, slot = divmod(index, self.per_byte)
+        return self._actions[(self._bytes[byte] >> (slot * self.bits)) & self.mask]
+
+    def predict(self, obs, deterministic=True):
+        obs = np.asarray(obs)
+        single = obs.ndim == 1
+        index = state_index(obs.reshape(1, -1) if single else obs, self.width, self.height)
+        byte, slot = np.divmod(index, self.per_byte)
+        codes = (self.packed[byte] >> (slot * self.bits).astype(np.uint8)) & self.mask
+        actions = self._decoded[codes]
+        return (actions[0] if single else actions), None
+
+
+def verify(model_path, table_path, n_samples=1_000_000, batch_size=65536, seed=0):
+    """元のモデルと方策表の決定的な行動が一致するかをランダムな観測で確かめる（不一致の数を返す）"""
+    from inference_service import load_policy
+
+    model = load_policy(model_path)
+    table = PolicyTable(table_path)
+    rng = np.random.default_rng(seed)
+    size = 2 * table.n_positions
+    high = np.tile([table.width, table.height], table.n_positions)
+    mismatches = 0
+    for start in range(0, n_samples, batch_size):
+        n = min(batch_size, n_samples - start)
+        obs = rng.integers(0, high, size=(n, size)).astype(np.int32)
+        expected, _ = model.predict(obs, deterministic=True)
+        actual, _ = table.predict(obs)
+        mismatches += int(np.any(np.asarray(expected).reshape(n, -1) != actual.reshape(n, -1), axis=1).sum())
+    return mismatches
+
+
+def main():
+    default_model = os.path.join(BASE_DIR, "model", "oni_double_model.npz")
+    if not os.path.exists(default_model):
+        default_model = os.path.join(BASE_DIR, "model", "oni_double_model.zip")
+    parser = argparse.ArgumentParser(description="学習済みの方策を全状態の行動表に蒸留する")
+    parser.add_argument("model", nargs="?", default=default_model, help="PPO の zip か numpy_policy の .npz")
+    parser.add_argument("--out", default=None, help=f"省略時はモデルと同じ名前で末尾が {TABLE_SUFFIX}")
+    parser.add_argument("--width", type=int, default=10, help=".npz のときの盤面の幅")
+    parser.add_argument("--height", type=int, default=10, help=".npz のときの盤面の高さ")
+    parser.add_argument("--batch-size", type=int, default=65536)
+    parser.add_argument("--samples", type=int, default=1_000_000, help="元のモデルと照合する観測の数")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    out_path = export_table(args.model, args.out, args.width, args.height, args.batch_size)
+    table = PolicyTable(out_path)
+    print(f"{out_path} に書き出しました（{table.cells ** table.n_positions:,} 状態, "
+          f"{table.packed.nbytes / 1024:.0f} KB, {time.perf_counter() - start:.1f} 秒）")
+
+    mismatches = verify(args.model, out_path, args.samples)
+    print(f"元のモデルとの照合: {args.samples:,} 件中 {mismatches} 件不一致")
+
+    obs = decode_states(12345, 12346, table.width, table.height, table.n_positions)[0]
+    n = 100000
+    start = time.perf_counter()
+    for _ in range(n):
+        table.action(obs)
+    print(f"観測1つの表引き: {(time.perf_counter() - start) / n * 1e6:.2f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+ステージの配置ごとに、鬼2体の追いかけっこを (鬼1, 鬼2, プレイヤー) の全状態について厳密に解く。
+
+    python pursuit_solver.py                                              # stage_info の全ステージを解いて model/ に書き出す
+    python pursuit_solver.py --compare model/oni_double_model_table.npz   # 学習済みモデルが最適からどれだけ遠いか
+
+1ターンは「鬼2体が1歩ずつ動く → プレイヤーが1歩動く（動かなくてもよい）」で、鬼が動いた後にプレイヤーと
+同じマスにいれば捕獲。プレイヤーはいつも捕まるのが一番遅くなる手を選ぶ（最悪の相手）とする。
+動き方は game_state と同じ（鬼は 上下左右の4つで、外や岩に向かうとその場に留まる。プレイヤーは上下左右か留まる）。
+
+全状態の「捕まえるまでのターン数」を、捕獲済みの状態 (0) から1ターンずつ後ろ向きに NumPy でまとめて更新して求め
+（最悪のプレイヤーが逃げ切れる状態は UNREACHABLE のまま）、最短になる鬼の行動を policy_table と同じ形式の
+方策表にする。ゲームは PolicyTable.action(観測) で表を引くだけで最適に追いかけられる。
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from game_state import MOVES
+from path_table import PathTable, UNREACHABLE, layout_key, to_passable
+from policy_table import PolicyTable, TABLE_SUFFIX, action_bits, build_table, encode_actions, pack_codes, unpack_table
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "stage_info"))
+from stage_info import Stage1, Stage2, Stage3
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STAGES = [Stage1, Stage2, Stage3]
+NVEC = [len(MOVES), len(MOVES)]
+# プレイヤーの動き（留まる + 上下左右）
+EVADER_MOVES = [(0, 0)] + MOVES
+
+
+def solved_path(passable, model_dir=os.path.join(BASE_DIR, "model")):
+    """配置の解を保存するパス（配置のハッシュで引くので、ステージを編集すると別のファイルになる）"""
+    return os.path.join(model_dir, f"pursuit_{layout_key(passable)}{TABLE_SUFFIX}")
+
+
+def neighbor_tables(passable):
+    """
+    :return: (鬼の行動ごとの移動先 (マス数, 4), プレイヤーの移動先 (マス数, 5))。外や岩に向かう場合は元のマス
+    """
+    height, width = passable.shape
+    n = width * height
+    free = passable.reshape(-1)
+    cells = np.arange(n)
+    xs, ys = cells % width, cells // width
+
+    def targets(moves):
+        table = np.empty((n, len(moves)), dtype=np.int64)
+        for k, (dx, dy) in enumerate(moves):
+            nx, ny = xs + dx, ys + dy
+            inside = (0 <= nx) & (nx < width) & (0 <= ny) & (ny < height)
+            target = np.where(inside, ny * width + nx, cells)
+            table[:, k] = np.where(free[target], target, cells)
+        return table
+
+    return targets(MOVES), targets(EVADER_MOVES)
+
+
+def state_masks(passable):
+    """:return: (3つとも通れるマスにいる状態, 捕獲済みの状態)。どちらも bool (マス数, マス数, マス数) で添字は [鬼1, 鬼2, プレイヤー]"""
+    free = passable.reshape(-1)
+    n = len(free)
+    cells = np.arange(n)
+    valid = free[:, None, None] & free[None, :, None] & free[None, None, :]
+    captured = (cells[:, None, None] == cells[None, None, :]) | (cells[None, :, None] == cells[None, None, :])
+    return valid, captured & valid
+
+
+def _evader_best(value, evader_next, captured):
+    """鬼が動いた直後の状態の値: 捕獲なら 0、そうでなければプレイヤーが一番遅くなる移動先の値"""
+    after = value[:, :, evader_next[:, 0]]
+    for k in range(1, evader_next.shape[1]):
+        np.maximum(after, value[:, :, evader_next[:, k]], out=after)
+    after[captured] = 0
+    return after
+
+
+def solve(passable):
+    """
+    配置 passable (height, width) を解く
+
+    :return: (捕まえるまでのターン数 uint8 (マス数,)*3, 最短になる行動番号 uint8 (マス数,)*3)。
+        ターン数は逃げ切られるか通れないマスを含む状態では UNREACHABLE。
+        行動番号は policy_table.encode_actions と同じく鬼1の行動が下位2ビット
+    """
+    oni_next, evader_next = neighbor_tables(passable)
+    valid, captured = state_masks(passable)
+    n = len(oni_next)
+    n_actions = oni_next.shape[1]
+
+    value = np.full((n, n, n), UNREACHABLE, dtype=np.uint8)
+    value[captured] = 0
+    for turn in range(1, UNREACHABLE):
+        after = _evader_best(value, evader_next, captured)
+        # 鬼2体の 16 通りの行動のうち一番早く捕まえられるもの
+        best = np.full((n, n, n), UNREACHABLE, dtype=np.uint8)
+        for a1 in range(n_actions):
+            moved1 = after[oni_next[:, a1]]
+            for a2 in range(n_actions):
+                np.minimum(best, moved1[:, oni_next[:, a2]], out=best)
+        # ちょうど turn ターンで捕まえられるようになった状態だけ値が決まる
+        reached = valid & (value == UNREACHABLE) & (best == turn - 1)
+        if not reached.any():
+            break
+        value[reached] = turn
+
+    # 最短になる行動のうち、最短経路の歩数の和が小さい（プレイヤーに近づく）ものを選ぶ。
+    # 逃げ切られる状態でも、これで最短経路で追いかける動きになる
+    dist = PathTable.build(passable).dist
+    after = _evader_best(value, evader_next, captured)
+    best_key = np.full((n, n, n), np.iinfo(np.int32).max, dtype=np.int32)
+    actions = np.zeros((n, n, n), dtype=np.uint8)
+    for a1 in range(n_actions):
+        moved1 = after[oni_next[:, a1]]
+        dist1 = dist[:, oni_next[:, a1]].T.astype(np.int32)  # [鬼1, プレイヤー]
+        for a2 in range(n_actions):
+            dist2 = dist[:, oni_next[:, a2]].T.astype(np.int32)  # [鬼2, プレイヤー]
+            key = moved1[:, oni_next[:, a2]].astype(np.int32) * 1024 + dist1[:, None, :] + dist2[None, :, :]
+            better = key < best_key
+            best_key[better] = key[better]
+            actions[better] = encode_actions(np.array([[a1, a2]]), NVEC)[0]
+    actions[~valid | captured] = 0
+    return value, actions
+
+
+def policy_value(passable, codes):
+    """
+    決まった行動の表 codes（行動番号 (マス数^3,)）で追いかけたとき、最悪のプレイヤーを捕まえるまでのターン数
+
+    :return: uint8 (マス数,)*3。逃げ切られる状態は UNREACHABLE
+    """
+    oni_next, evader_next = neighbor_tables(passable)
+    valid, captured = state_masks(passable)
+    n = len(oni_next)
+    codes = codes.reshape(n, n, n)
+    o1, o2, p = np.indices((n, n, n), sparse=True)
+    moved = (oni_next[o1, codes & 3] * n + oni_next[o2, codes >> 2]) * n + p  # 鬼が動いた後の状態番号
+
+    value = np.full((n, n, n), UNREACHABLE, dtype=np.uint8)
+    value[captured] = 0
+    for turn in range(1, UNREACHABLE):
+        after = _evader_best(value, evader_next, captured).reshape(-1)[moved]
+        reached = valid & (value == UNREACHABLE) & (after == turn - 1)
+        if not reached.any():
+            break
+        value[reached] = turn
+    return value
+
+
+def start_states(passable):
+    """ゲーム開始時にありうる状態（プレイヤーはロープの下、鬼は重ならずプレイヤーからマンハッタン距離 3 以上）"""
+    height, width = passable.shape
+    n = width * height
+    free = passable.reshape(-1)
+    cells = np.arange(n)
+    px, py = width // 2 - 1, height // 2 - 1
+    far = free & (np.abs(cells % width - px) + np.abs(cells // width - py) >= 3)
+    mask = np.zeros((n, n, n), dtype=bool)
+    mask[:, :, py * width + px] = far[:, None] & far[None, :] & (cells[:, None] != cells[None, :])
+    return mask
+
+
+def export_solution(stage_module, out_path=None):
+    """
+    ステージを解いて、PolicyTable で読める方策表（捕まえるまでのターン数 time_to_capture 付き）を保存する
+
+    :return: (保存したパス, ターン数, 行動番号)
+    """
+    passable = to_passable(stage_module.ROCK_LAYOUT)
+    height, width = passable.shape
+    value, actions = solve(passable)
+    bits = action_bits(NVEC)
+    packed = pack_codes(actions.reshape(-1), bits)
+    out_path = out_path or solved_path(passable)
+    np.savez_compressed(out_path, packed=packed, width=width, height=height, n_positions=3,
+                        nvec=NVEC, bits=bits, discrete=False, time_to_capture=value)
+    return out_path, value, actions
+
+
+def policy_codes(model_path, width, height):
+    """モデル（方策表、PPO の zip、numpy_policy の .npz）の全状態の行動番号 (マス数^3,)"""
+    if model_path.endswith(TABLE_SUFFIX):
+        table = PolicyTable(model_path)
+        packed, bits = table.packed, table.bits
+    else:
+        from evaluate import load_model
+        packed, bits = build_table(load_model(model_path), width, height, 3, NVEC), action_bits(NVEC)
+    return unpack_table(packed, bits, (width * height) ** 3)
+
+
+def compare(passable, optimal, codes):
+    """
+    最適な追いかけ方と codes の追いかけ方を、最悪のプレイヤー相手のターン数で比べる
+
+    :return: 表示用の dict
+    """
+    valid, captured = state_masks(passable)
+    value = policy_value(passable, codes)
+    states = valid & ~captured
+    start = start_states(passable)
+    solvable = states & (optimal != UNREACHABLE)
+    both = solvable & (value != UNREACHABLE)
+    gap = value[both].astype(np.int64) - optimal[both]
+    return {
+        "states": int(states.sum()),
+        "optimal_capture_rate": float(solvable.sum() / states.sum()),
+        "capture_rate": float((states & (value != UNREACHABLE)).sum() / states.sum()),
+        "optimal_mean_turns": float(optimal[solvable].mean()),
+        "mean_gap_turns": float(gap.mean()) if len(gap) else None,
+        "optimal_turns_rate": float((gap == 0).sum() / solvable.sum()),
+        "start_optimal_capture_rate": float((optimal[start] != UNREACHABLE).mean()),
+        "start_capture_rate": float((value[start] != UNREACHABLE).mean()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ステージごとに鬼2体の最適な追いかけ方を厳密に解く")
+    parser.add_argument("--out-dir", default=os.path.join(BASE_DIR, "model"), help="解を書き出すフォルダ")
+    parser.add_argument("--compare", default=None,
+                        help="最悪のプレイヤー相手の成績を最適と比べるモデル（方策表、PPO の zip、numpy_policy の .npz）")
+    args = parser.parse_args()
+
+    for stage in STAGES:
+        name = stage.__name__.rsplit(".", 1)[-1]
+        passable = to_passable(stage.ROCK_LAYOUT)
+        start = time.perf_counter()
+        out_path, value, actions = export_solution(stage, solved_path(passable, args.out_dir))
+        valid, captured = state_masks(passable)
+        states = valid & ~captured
+        solvable = value[states] != UNREACHABLE
+        print(f"{name}: {out_path} に書き出しました（{time.perf_counter() - start:.1f} 秒）。"
+              f"捕まえられる状態 {solvable.mean():.1%}, 最長 {value[states][solvable].max()} ターン")
+
+        if args.compare:
+            height, width = passable.shape
+            result = compare(passable, value, policy_codes(args.compare, width, height))
+            print(f"  {os.path.basename(args.compare)}: 捕まえられる状態 {result['capture_rate']:.1%}"
+                  f"（最適 {result['optimal_capture_rate']:.1%}）, 最適と同じターン数 {result['optimal_turns_rate']:.1%}, "
+                  f"捕まえられる状態での平均の差 {result['mean_gap_turns']:+.2f} ターン"
+                  f"（最適の平均 {result['optimal_mean_turns']:.2f}）")
+            print(f"  開始状態から捕まえられる割合: {result['start_capture_rate']:.1%}"
+                  f"（最適 {result['start_optimal_capture_rate']:.1%}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import argparse
+import importlib
+import os
+import struct
+import sys
+import time
+import zlib
+
+from game_state import GameState, MOVES, PLAYING
+from stage_generator import is_generated, load_generated
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "stage_info"))
+
+# 固定タイムステップ: 記録・再生ともに1ティック = 60FPS の1フレーム分だけ GameState.step を進める
+TICK_MS = 1000 / 60
+MAX_TICKS_PER_FRAME = 5  # 描画が遅れたときに1フレームでまとめて進めるティック数の上限
+KEYFRAME_INTERVAL = 300  # 再生中にこのティック数ごとに状態を覚えておく（5秒ごと）
+
+REPLAY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "replays")
+MAX_REPLAY_FILES = 50
+
+# ファイル形式:
+#   ヘッダ  MAGIC, 版, シード, 1ティックのミリ秒, マスの大きさ, ティック数, 鬼の移動回数, 配置の CRC, ステージ名の長さ
+#   ステージ名 (ASCII)
+#   本体（zlib 圧縮）: ティックごとの入力 1バイト × ティック数、鬼の移動 1バイト × 移動回数
+# 入力は押されている向きのビット (1 << 向き)。鬼の移動は1体3ビットで、0-3 が向き、STAY はその場に留まる
+MAGIC = b"ONIR"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sBIdHIIIB")
+STAY = len(MOVES)
+ONI_BITS = 3
+
+
+def encode_keys(moves):
+    mask = 0
+    for move in moves or ():
+        mask |= 1 << move
+    return mask
+
+
+def decode_keys(mask):
+    """入力のビットを優先順（上, 下, 左, 右）の向きの列に戻す"""
+    return [move for move in range(len(MOVES)) if mask >> move & 1]
+
+
+def encode_oni_moves(before, after):
+    """鬼の移動前と移動後の位置から1バイトの記録を作る"""
+    code = 0
+    for i, ((x0, y0), (x1, y1)) in enumerate(zip(before, after)):
+        delta = (x1 - x0, y1 - y0)
+        code |= (MOVES.index(delta) if delta in MOVES else STAY) << (ONI_BITS * i)
+    return code
+
+
+def layout_crc(stage_module):
+    """ステージの配置が記録したときと同じか確かめるためのチェックサム"""
+    layout = (stage_module.ROCK_LAYOUT, stage_module.BUSH_LAYOUT, stage_module.COIN_LAYOUT)
+    return zlib.crc32(repr(layout).encode())
+
+
+def load_stage(name):
+    """記録したステージ名からステージを読み込む（stage_generator で作ったマップは作り直す）"""
+    if is_generated(name):
+        return load_generated(name)
+    return importlib.import_module(name)
+
+
+class Replay:
+    """
+    1回のプレイの記録。シードとティックごとの入力、鬼の移動だけを持ち、
+    途中の状態は再生時に GameState を同じ順に動かして作り直す。
+    """
+
+    def __init__(self, stage_name, seed, keys=b"", oni_moves=b"", tick_ms=TICK_MS, cell_size=60, crc=0):
+        self.stage_name, self.seed, self.tick_ms, self.cell_size, self.crc = stage_name, seed, tick_ms, cell_size, crc
+        self.keys, self.oni_moves = bytes(keys), bytes(oni_moves)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def to_bytes(self):
+        name = self.stage_name.encode("ascii")
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, self.seed, self.tick_ms, self.cell_size,
+                             len(self.keys), len(self.oni_moves), self.crc, len(name))
+        return header + name + zlib.compress(self.keys + self.oni_moves, 9)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if len(data) < HEADER.size:
+            raise ValueError("リプレイファイルが短すぎます")
+        magic, version, seed, tick_ms, cell_size, n_ticks, n_oni, crc, name_len = HEADER.unpack_from(data)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("リプレイファイルの形式が違います")
+        name = data[HEADER.size:HEADER.size + name_len].decode("ascii")
+        body = zlib.decompress(data[HEADER.size + name_len:])
+        if len(body) != n_ticks + n_oni:
+            raise ValueError("リプレイファイルが壊れています")
+        return cls(name, seed, body[:n_ticks], body[n_ticks:], tick_ms, cell_size, crc)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            f.write(self.to_bytes())
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+class ReplayRecorder:
+    """
+    プレイ中の入力と鬼の移動を記録する。
+
+    GameState の oni_controller を wrap() で包み、毎ティック record_tick() を呼んでから step する。
+    """
+
+    def __init__(self, stage_module, seed, tick_ms=TICK_MS, cell_size=60):
+        self.stage_name, self.seed, self.tick_ms, self.cell_size = stage_module.__name__, seed, tick_ms, cell_size
+        self.crc = layout_crc(stage_module)
+        self.keys, self.oni_moves = bytearray(), bytearray()
+
+    def wrap(self, controller):
+        def control(state):
+            onis = [tuple(pos) for pos in controller(state)]
+            self.oni_moves.append(encode_oni_moves(state.onis, onis))
+            return onis
+        return control
+
+    def record_tick(self, moves):
+        self.keys.append(encode_keys(moves))
+
+    def replay(self):
+        return Replay(self.stage_name, self.seed, self.keys, self.oni_moves, self.tick_ms, self.cell_size, self.crc)
+
+    def save(self, replay_dir=REPLAY_DIR):
+        """replays/ に日時つきの名前で保存してパスを返す（古いものは消す）"""
+        name = f"{time.strftime('%Y%m%d_%H%M%S')}_{self.stage_name.replace(':', '_')}_{self.seed:08x}.onireplay"
+        path = os.path.join(replay_dir, name)
+        self.replay().save(path)
+        files = sorted(f for f in os.listdir(replay_dir) if f.endswith(".onireplay"))
+        for f in files[:-MAX_REPLAY_FILES]:
+            os.remove(os.path.join(replay_dir, f))
+        return path
+
+
+class ReplayPlayer:
+    """
+    記録を GameState で再生する。
+
+    step() で1ティック進め、KEYFRAME_INTERVAL ティックごとに状態を覚えておく。
+    seek(tick) は目的のティック以前で一番近いキーフレームに戻してから進めるので、最初から計算し直さない。
+    """
+
+    def __init__(self, replay, stage_module=None, keyframe_interval=KEYFRAME_INTERVAL):
+        stage_module = stage_module or load_stage(replay.stage_name)
+        if replay.crc and layout_crc(stage_module) != replay.crc:
+            raise ValueError(f"{replay.stage_name} の配置が記録したときと変わっています")
+        self.replay = replay
+        self.keyframe_interval = keyframe_interval
+        self.state = GameState.from_stage(stage_module, oni_controller=self._replay_onis,
+                                          cell_size=replay.cell_size, seed=replay.seed)
+        self.tick = 0
+        self._oni_cursor = 0
+        self.keyframes = {0: (self.state.snapshot(), 0)}
+
+    def _replay_onis(self, state):
+        if self._oni_cursor >= len(self.replay.oni_moves):
+            raise ValueError("リプレイの鬼の移動が足りません")
+        code = self.replay.oni_moves[self._oni_cursor]
+        self._oni_cursor += 1
+        onis = []
+        for i, (x, y) in enumerate(state.onis):
+            move = code >> (ONI_BITS * i) & ((1 << ONI_BITS) - 1)
+            if move == STAY:
+                onis.append((x, y))
+            else:
+                dx, dy = MOVES[move]
+                onis.append((x + dx, y + dy))
+        return onis
+
+    @property
+    def finished(self):
+        return self.tick >= len(self.replay) or self.state.status != PLAYING
+
+    def step(self):
+        """1ティック進めて GameState.step のイベントを返す"""
+        if self.finished:
+            return []
+        events = self.state.step(decode_keys(self.replay.keys[self.tick]), self.replay.tick_ms)
+        self.tick += 1
+        if self.tick % self.keyframe_interval == 0 and self.tick not in self.keyframes:
+            self.keyframes[self.tick] = (self.state.snapshot(), self._oni_cursor)
+        return events
+
+    def seek(self, tick):
+        """tick ティック目の状態にする（範囲外は端に丸める）"""
+        tick = max(0, min(tick, len(self.replay)))
+        start = max(t for t in self.keyframes if t <= tick)
+        # 今の位置から進めるほうが近ければキーフレームに戻らない
+        if not start <= self.tick <= tick:
+            snapshot, self._oni_cursor = self.keyframes[start]
+            self.state.restore(snapshot)
+            self.tick = start
+        while self.tick < tick and not self.finished:
+            self.step()
+
+    def run(self, speed=1.0, on_tick=None):
+        """
+        最後まで再生する。
+
+        :param speed: 再生速度の倍率。0 なら待たずに最大速度で進める
+        :param on_tick: 1ティックごとに (ReplayPlayer, イベント) を受け取る関数
+        """
+        start, start_tick = time.perf_counter(), self.tick
+        while not self.finished:
+            events = self.step()
+            if on_tick is not None:
+                on_tick(self, events)
+            if speed:
+                wait = start + (self.tick - start_tick) * self.replay.tick_ms / 1000 / speed - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+        return self.state.status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="リプレイファイルをヘッドレスで再生する")
+    parser.add_argument("path")
+    parser.add_argument("--speed", type=float, default=0, help="再生速度の倍率（0 = 待たずに最大速度）")
+    parser.add_argument("--seek", type=int, default=None, help="このティックの状態を表示する")
+    args = parser.parse_args()
+
+    replay = Replay.load(args.path)
+    print(f"{replay.stage_name}, シード {replay.seed:08x}, {len(replay)} ティック "
+          f"({len(replay) * replay.tick_ms / 1000:.1f} 秒), 鬼の移動 {len(replay.oni_moves)} 回")
+    player = ReplayPlayer(replay)
+    if args.seek is not None:
+        start = time.perf_counter()
+        player.seek(args.seek)
+        state = player.state
+        print(f"ティック {player.tick}: プレイヤー {state.player}, 鬼 {state.onis}, コイン {state.coin_count} "
+              f"({(time.perf_counter() - start) * 1000:.2f} ms)")
+    start = time.perf_counter()
+    status = player.run(args.speed)
+    elapsed = time.perf_counter() - start
+    print(f"結果: {status} (ティック {player.tick}, コイン {player.state.coin_count}), 再生 {elapsed:.3f} 秒")
+
+
+if __name__ == "__main__":
+    main()
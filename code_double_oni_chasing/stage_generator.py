@@ -0,0 +1,50 @@
+import random
+import types
+
+# 作ったステージのモジュール名。"stage_generator:幅x高さ:シード" の形で、名前から同じステージを作り直せる
+NAME_PREFIX = "stage_generator:"
+COIN_COUNT = 20  # 画面のコイン表示（x/20）と同じ枚数
+
+
+def generate_stage(width, height, seed=0, rock_density=0.12, bush_density=0.15, coin_count=COIN_COUNT):
+    """
+    stage_info の StageN と同じ形（ROCK_LAYOUT, BUSH_LAYOUT, COIN_LAYOUT）の大きいマップを作る。
+
+    ロープの位置（スタート地点）とその周りには岩を置かず、コインはスタート地点から歩いて行けるマスにだけ置く。
+    :return: StageN モジュールの代わりに GameState.from_stage などへ渡せるモジュール
+    """
+    rng = random.Random(f"{width}x{height}:{seed}")
+    start = (width // 2 - 1, height // 2 - 1)  # GameState の rope_pos と同じ
+    rock = [[0] * width for _ in range(height)]
+    bush = [[0] * width for _ in range(height)]
+    for y in range(height):
+        for x in range(width):
+            if abs(x - start[0]) + abs(y - start[1]) > 1 and rng.random() < rock_density:
+                rock[y][x] = 1
+            elif rng.random() < bush_density:
+                bush[y][x] = 1
+
+    # スタート地点から行けるマス（岩で囲まれたところにはコインを置かない）
+    reachable, queue = {start}, [start]
+    for x, y in queue:
+        for nx, ny in ((x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y)):
+            if 0 <= nx < width and 0 <= ny < height and not rock[ny][nx] and (nx, ny) not in reachable:
+                reachable.add((nx, ny)); queue.append((nx, ny))
+    coin = [[0] * width for _ in range(height)]
+    for x, y in rng.sample(sorted(reachable - {start}), min(coin_count, len(reachable) - 1)):
+        coin[y][x] = 1
+
+    module = types.ModuleType(f"{NAME_PREFIX}{width}x{height}:{seed}")
+    module.ROCK_LAYOUT, module.BUSH_LAYOUT, module.COIN_LAYOUT = rock, bush, coin
+    return module
+
+
+def is_generated(name):
+    return name.startswith(NAME_PREFIX)
+
+
+def load_generated(name):
+    """generate_stage で作ったステージをモジュール名から作り直す（リプレイの再生用）"""
+    size, seed = name[len(NAME_PREFIX):].split(":")
+    width, height = map(int, size.split("x"))
+    return generate_stage(width, height, int(seed))
@@ -0,0 +1,353 @@
+"""
+鬼の PPO のハイパーパラメータ（training.PPO_CONFIG）をプロセスプールで並列に探す。
+
+    python sweep.py run --trials 20 --cores-per-trial 1 --timesteps 50000
+    python sweep.py run --space space.json --study gamma --env enemy_env:ChaseEnv --env-dir ../code_ueno
+    python sweep.py show
+    python sweep.py export --output sweeps/best_config.json --model model/oni_double_model_sweep
+    python oni_double_learn.py --config sweeps/best_config.json
+
+探索はランダム探索で、探索範囲は JSON で渡す（省略時は DEFAULT_SPACE）。値の書き方は
+{"uniform": [下限, 上限]}, {"log_uniform": [下限, 上限]}, {"int": [下限, 上限]}, {"choice": [候補, ...]}、
+またはそのままの値（固定）。範囲にないキーは PPO_CONFIG の値を使う。
+
+各試行は eval_freq ステップごとに捕獲率を測り、同じステップでの完了した試行の捕獲率の中央値を下回ったら
+打ち切る（中央値による枝刈り）。結果は sqlite の trials 表、途中の評価は reports 表に入る。
+"""
+import argparse
+import json
+import math
+import multiprocessing as mp
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+
+from parallel_learn import load_env_class
+from training import EVAL_SEED, PPO_CONFIG, evaluate_capture_rate, make_ppo
+
+DEFAULT_DB = os.path.join("sweeps", "sweep.db")
+DEFAULT_SPACE = {
+    "learning_rate": {"log_uniform": [1e-4, 3e-3]},
+    "n_steps": {"choice": [256, 512, 1024, 2048]},
+    "batch_size": {"choice": [32, 64, 128, 256]},
+    "gamma": {"uniform": [0.85, 0.995]},
+    "gae_lambda": {"uniform": [0.8, 1.0]},
+    "clip_range": {"choice": [0.1, 0.2, 0.3]},
+    "net_arch": {"choice": [[64, 64], [128, 128], [256, 256], [128, 128, 128]]},
+}
+FINAL_SEED = EVAL_SEED + 10_000  # 最後の評価は途中の評価とは別の対戦で行う
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    study TEXT NOT NULL,
+    status TEXT NOT NULL,          -- queued / running / complete / pruned / failed
+    params TEXT NOT NULL,          -- PPO の設定 (JSON)
+    env TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    timesteps INTEGER,             -- 学習したステップ数（打ち切りならそこまで）
+    capture_rate REAL,             -- 完了なら最後の評価、打ち切りなら最後の途中評価
+    mean_reward REAL,
+    elapsed_s REAL,
+    model_path TEXT,
+    error TEXT,
+    created TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reports (
+    trial_id INTEGER NOT NULL,
+    step INTEGER NOT NULL,
+    capture_rate REAL NOT NULL,
+    PRIMARY KEY (trial_id, step)
+);
+"""
+
+
+def connect(path):
+    # 試行のプロセスから同時に書き込むので、ロックが空くまで待つ
+    db = sqlite3.connect(path, timeout=60)
+    db.executescript(SCHEMA)
+    return db
+
+
+def sample_params(space, rng):
+    """探索範囲 space から設定を1つ引く（batch_size は n_steps 以下になるまで引き直す）"""
+    for _ in range(100):
+        params = {}
+        for key, spec in space.items():
+            if not isinstance(spec, dict):
+                params[key] = spec
+            elif "uniform" in spec:
+                params[key] = rng.uniform(*spec["uniform"])
+            elif "log_uniform" in spec:
+                low, high = spec["log_uniform"]
+                params[key] = math.exp(rng.uniform(math.log(low), math.log(high)))
+            elif "int" in spec:
+                params[key] = rng.randint(*spec["int"])
+            elif "choice" in spec:
+                params[key] = rng.choice(spec["choice"])
+            else:
+                raise ValueError(f"{key} の探索範囲の書き方が分かりません: {spec}")
+        config = {**PPO_CONFIG, **params}
+        if config["batch_size"] <= config["n_steps"]:
+            return config
+    raise ValueError("batch_size <= n_steps を満たす設定を引けませんでした")
+
+
+class MedianPruner:
+    """
+    途中の捕獲率が、同じステップでの完了した試行の捕獲率の中央値を下回ったら打ち切る。
+
+    :param n_startup_trials: 完了した試行がこの数に満たないうちは打ち切らない
+    :param n_warmup_steps: このステップ数より前の評価では打ち切らない
+    """
+
+    def __init__(self, n_startup_trials=4, n_warmup_steps=0):
+        self.n_startup_trials = n_startup_trials
+        self.n_warmup_steps = n_warmup_steps
+
+    def should_prune(self, db, study, step, value):
+        if step < self.n_warmup_steps:
+            return False
+        rows = db.execute(
+            "SELECT r.capture_rate FROM reports r JOIN trials t ON r.trial_id = t.id "
+            "WHERE t.study = ? AND t.status = 'complete' AND r.step = ?", (study, step)).fetchall()
+        if len(rows) < self.n_startup_trials:
+            return False
+        return value < statistics.median(r[0] for r in rows)
+
+
+class PruningCallback(BaseCallback):
+    """eval_freq ステップごとに捕獲率を reports 表に書き、MedianPruner が打ち切りと言えば学習を止める"""
+
+    def __init__(self, db, study, trial_id, eval_env, eval_freq, n_episodes, pruner):
+        super().__init__()
+        self.db = db
+        self.study = study
+        self.trial_id = trial_id
+        self.eval_env = eval_env
+        self.eval_freq = eval_freq
+        self.n_episodes = n_episodes
+        self.pruner = pruner
+        self.last = None  # (ステップ, 捕獲率, 平均報酬)
+        self.pruned = False
+
+    def _on_step(self):
+        # n_steps は試行ごとに違うので、ロールアウトの区切りではなく eval_freq ちょうどで測って揃える
+        if self.model.num_timesteps % self.eval_freq:
+            return True
+        step = self.model.num_timesteps
+        rate, mean_reward = evaluate_capture_rate(self.model, self.eval_env, self.n_episodes)
+        self.last = (step, rate, mean_reward)
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO reports VALUES (?, ?, ?)", (self.trial_id, step, rate))
+        self.pruned = self.pruner.should_prune(self.db, self.study, step, rate)
+        return not self.pruned
+
+
+def _init_worker(core_groups, cores_per_trial):
+    """ワーカーを担当のコアに固定し、PyTorch のスレッド数をコア数に合わせる"""
+    import torch
+    cores = core_groups.get()
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(cores_per_trial)
+
+
+def run_trial(trial_id, settings):
+    """
+    試行を1つ学習・評価して trials 表を更新する（ワーカープロセスで動く）
+
+    :return: (試行番号, 状態, 捕獲率)
+    """
+    db = connect(settings["db"])
+    params, seed = db.execute("SELECT params, seed FROM trials WHERE id = ?", (trial_id,)).fetchone()
+    params = json.loads(params)
+    with db:
+        db.execute("UPDATE trials SET status = 'running' WHERE id = ?", (trial_id,))
+    start = time.perf_counter()
+    try:
+        # 自作環境は組み込みの random / np.random で動く
+        random.seed(seed)
+        np.random.seed(seed)
+        env_cls = load_env_class(settings["env"], settings["env_dir"])
+        env, eval_env = env_cls(), env_cls()
+        model = make_ppo(env, params, seed=seed, device="cpu")
+        pruner = MedianPruner(settings["n_startup_trials"], settings["n_warmup_steps"])
+        callback = PruningCallback(db, settings["study"], trial_id, eval_env, settings["eval_freq"],
+                                   settings["eval_episodes"], pruner)
+        model.learn(total_timesteps=settings["timesteps"], callback=callback)
+
+        if callback.pruned:
+            status, model_path = "pruned", None
+            _, rate, mean_reward = callback.last
+        else:
+            status = "complete"
+            rate, mean_reward = evaluate_capture_rate(model, eval_env, settings["final_episodes"], seed=FINAL_SEED)
+            model_path = os.path.join(settings["model_dir"], f"trial_{trial_id}")
+            model.save(model_path)
+            model_path += ".zip"
+        with db:
+            db.execute("UPDATE trials SET status = ?, timesteps = ?, capture_rate = ?, mean_reward = ?, "
+                       "elapsed_s = ?, model_path = ? WHERE id = ?",
+                       (status, model.num_timesteps, rate, mean_reward, time.perf_counter() - start,
+                        model_path, trial_id))
+        return trial_id, status, rate
+    except Exception:
+        with db:
+            db.execute("UPDATE trials SET status = 'failed', error = ?, elapsed_s = ? WHERE id = ?",
+                       (traceback.format_exc(), time.perf_counter() - start, trial_id))
+        return trial_id, "failed", None
+    finally:
+        db.close()
+
+
+def core_groups(cores_per_trial, workers=None):
+    """使えるコアを cores_per_trial 個ずつに分ける（workers がそれより多ければ使い回す）"""
+    if hasattr(os, "sched_getaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count()))
+    groups = [cores[i:i + cores_per_trial] for i in range(0, len(cores) - cores_per_trial + 1, cores_per_trial)]
+    groups = groups or [cores]
+    workers = workers or len(groups)
+    return [groups[i % len(groups)] for i in range(workers)]
+
+
+def run(args):
+    space = DEFAULT_SPACE
+    if args.space:
+        with open(args.space) as f:
+            space = json.load(f)
+    model_dir = os.path.join(os.path.dirname(args.db) or ".", args.study)
+    os.makedirs(model_dir, exist_ok=True)
+    db = connect(args.db)
+
+    # 同じ study に試行を足すときは、前と違う設定を引くよう乱数の種をずらす
+    existing = db.execute("SELECT COUNT(*) FROM trials WHERE study = ?", (args.study,)).fetchone()[0]
+    rng = random.Random(args.seed + existing)
+    trial_ids = []
+    with db:
+        for _ in range(args.trials):
+            cursor = db.execute(
+                "INSERT INTO trials (study, status, params, env, seed, created) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (args.study, json.dumps(sample_params(space, rng)), args.env, rng.randrange(2**31),
+                 time.strftime("%Y-%m-%dT%H:%M:%S")))
+            trial_ids.append(cursor.lastrowid)
+    db.close()
+
+    settings = {
+        "db": args.db, "study": args.study, "env": args.env, "env_dir": args.env_dir, "model_dir": model_dir,
+        "timesteps": args.timesteps, "eval_freq": args.eval_freq, "eval_episodes": args.eval_episodes,
+        "final_episodes": args.final_episodes, "n_startup_trials": args.n_startup_trials,
+        "n_warmup_steps": args.n_warmup_steps,
+    }
+    groups = core_groups(args.cores_per_trial, args.workers)
+    print(f"{args.study}: {args.trials} 試行を {len(groups)} ワーカー（1試行 {args.cores_per_trial} コア）で実行します")
+
+    ctx = mp.get_context("forkserver")
+    queue = ctx.Queue()
+    for group in groups:
+        queue.put(group)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(len(groups), mp_context=ctx, initializer=_init_worker,
+                             initargs=(queue, args.cores_per_trial)) as pool:
+        futures = [pool.submit(run_trial, trial_id, settings) for trial_id in trial_ids]
+        for future in as_completed(futures):
+            trial_id, status, rate = future.result()
+            print(f"試行 {trial_id}: {status}" + (f" 捕獲率 {rate:.1%}" if rate is not None else ""))
+    print(f"{time.perf_counter() - start:.0f} 秒")
+    show(args)
+
+
+def show(args):
+    db = connect(args.db)
+    rows = db.execute(
+        "SELECT id, status, capture_rate, timesteps, elapsed_s, params FROM trials WHERE study = ? "
+        "ORDER BY status = 'complete' DESC, capture_rate DESC LIMIT ?", (args.study, args.top)).fetchall()
+    counts = dict(db.execute("SELECT status, COUNT(*) FROM trials WHERE study = ? GROUP BY status", (args.study,)))
+    db.close()
+    print(f"{args.study}: " + ", ".join(f"{status} {n}" for status, n in sorted(counts.items())))
+    for trial_id, status, rate, timesteps, elapsed, params in rows:
+        params = json.loads(params)
+        rate = "-" if rate is None else f"{rate:.1%}"
+        print(f"{trial_id:>4} {status:9} {rate:>6} {timesteps or 0:>7} steps {elapsed or 0:6.0f}s  "
+              + " ".join(f"{k}={_format(v)}" for k, v in params.items()))
+
+
+def _format(value):
+    return f"{value:.3g}" if isinstance(value, float) else str(value).replace(" ", "")
+
+
+def best_trial(db, study):
+    """完了した試行のうち、最後の評価の捕獲率（同じなら平均報酬）がいちばん高いもの"""
+    return db.execute(
+        "SELECT id, params, env, capture_rate, mean_reward, timesteps, model_path FROM trials "
+        "WHERE study = ? AND status = 'complete' ORDER BY capture_rate DESC, mean_reward DESC LIMIT 1",
+        (study,)).fetchone()
+
+
+def export(args):
+    """いちばん良い試行の設定を JSON（学習スクリプトの --config で読める形）に書き出し、モデルもコピーする"""
+    db = connect(args.db)
+    row = best_trial(db, args.study)
+    db.close()
+    if row is None:
+        raise SystemExit(f"{args.study} に完了した試行がありません")
+    trial_id, params, env, rate, mean_reward, timesteps, model_path = row
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({"study": args.study, "trial": trial_id, "env": env, "capture_rate": rate,
+                   "mean_reward": mean_reward, "timesteps": timesteps, "config": json.loads(params)}, f, indent=2)
+    print(f"試行 {trial_id}（捕獲率 {rate:.1%}）の設定を {args.output} に書き出しました")
+    if args.model:
+        target = args.model if args.model.endswith(".zip") else args.model + ".zip"
+        shutil.copyfile(model_path, target)
+        print(f"モデルを {target} にコピーしました")
+
+
+def main(argv=None):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--db", default=DEFAULT_DB, help="結果を入れる sqlite ファイル")
+    common.add_argument("--study", default="oni_double", help="探索の名前（同じ名前なら試行を足していく）")
+    parser = argparse.ArgumentParser(description="鬼の PPO のハイパーパラメータを探す")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", parents=[common], help="試行を実行する")
+    run_parser.add_argument("--space", default=None, help="探索範囲の JSON（省略時は DEFAULT_SPACE）")
+    run_parser.add_argument("--trials", type=int, default=20)
+    run_parser.add_argument("--cores-per-trial", type=int, default=1, help="1試行に使うコア数")
+    run_parser.add_argument("--workers", type=int, default=None,
+                            help="同時に動かす試行の数（省略時はコア数 / --cores-per-trial）")
+    run_parser.add_argument("--env", default="oni_double_env:ChaseEnv", help="環境 (モジュール:クラス)")
+    run_parser.add_argument("--env-dir", default=None, help="環境モジュールのあるフォルダ")
+    run_parser.add_argument("--timesteps", type=int, default=50000, help="1試行の学習ステップ数")
+    run_parser.add_argument("--eval-freq", type=int, default=10000, help="途中の評価（枝刈りの判定）の間隔")
+    run_parser.add_argument("--eval-episodes", type=int, default=100, help="途中の評価のエピソード数")
+    run_parser.add_argument("--final-episodes", type=int, default=300, help="学習し終えた試行の評価のエピソード数")
+    run_parser.add_argument("--n-startup-trials", type=int, default=4, help="この数の試行が完了するまでは枝刈りしない")
+    run_parser.add_argument("--n-warmup-steps", type=int, default=10000, help="このステップ数より前は枝刈りしない")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--top", type=int, default=10, help="最後に表示する試行の数")
+
+    show_parser = commands.add_parser("show", parents=[common], help="結果の表を表示する")
+    show_parser.add_argument("--top", type=int, default=20)
+
+    export_parser = commands.add_parser("export", parents=[common], help="いちばん良い試行の設定とモデルを書き出す")
+    export_parser.add_argument("--output", default=os.path.join("sweeps", "best_config.json"))
+    export_parser.add_argument("--model", default=None, help="モデルのコピー先（省略時はコピーしない）")
+
+    args = parser.parse_args(argv)
+    os.makedirs(os.path.dirname(args.db) or ".", exist_ok=True)
+    {"run": run, "show": show, "export": export}[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,518 @@
+"""
+PPO 学習スクリプト共通の PPO の設定と、チェックポイント保存・途中からの再開・評価による早期終了。
+
+code_ueno / code_tougou / test_intern の *_learn.py もこのフォルダを sys.path に足してこのモジュールを使う。
+
+    python oni_double_learn.py                      # 最初から学習（checkpoints/oni_double_model/ に定期保存）
+    python oni_double_learn.py --resume             # いちばん新しいチェックポイントから続きを学習
+    python oni_double_learn.py --eval-freq 10000 --target-capture-rate 0.9 --patience 5   # 評価して早期終了
+    python oni_double_learn.py --config sweeps/best_config.json   # sweep.py で選んだ設定で学習
+    python oni_double_learn.py --telemetry logs/telemetry.jsonl    # ロールアウトごとの時間の内訳を記録
+
+チェックポイントは SB3 の zip（方策とオプティマイザの状態）と、乱数の状態を入れた _rng.pkl の組。
+再開時は進行中のエピソードだけは失われ、環境をリセットしてから続きのロールアウトを集める。
+"""
+import csv
+import glob
+import json
+import os
+import pickle
+import random
+import re
+import time
+
+import numpy as np
+import torch
+from stable_baselines3 import PPO
+from stable_baselines3.common.callbacks import BaseCallback
+
+# 各フォルダの oni_learn.py / oni_double_learn.py / enemy_learn.py 共通の PPO の設定（sweep.py で探すのもこの値）
+PPO_CONFIG = {
+    "learning_rate": 3e-4,  # 学習率
+    "n_steps": 2048,        # 1回の rollout に使用するステップ数
+    "batch_size": 64,
+    "gamma": 0.9,           # 割引率
+    "gae_lambda": 0.95,
+    "clip_range": 0.2,
+    "net_arch": [128, 128],  # 方策・価値の全結合NNの隠れ層
+}
+CHECKPOINT_PREFIX = "ckpt_"
+EVAL_SEED = 10_000  # 評価のエピソード i は種 EVAL_SEED + i（毎回同じ対戦で比べる）
+
+
+def load_config(path=None):
+    """
+    PPO_CONFIG に path の JSON の値を上書きした設定を返す。
+
+    :param path: 設定の JSON（sweep.py export が書き出すものも、その "config" を使う）。None なら PPO_CONFIG のまま
+    """
+    config = dict(PPO_CONFIG)
+    if path:
+        with open(path) as f:
+            data = json.load(f)
+        config.update(data.get("config", data))
+    return config
+
+
+def make_ppo(env, config=None, **kwargs):
+    """
+    config（省略時は PPO_CONFIG）の PPO を作る。"MlpPolicy" は多層パーセプトロン（全結合NN）
+
+    :param kwargs: verbose や seed など、PPO にそのまま渡す引数
+    """
+    config = {**PPO_CONFIG, **(config or {})}
+    net_arch = list(config.pop("net_arch"))
+    return PPO("MlpPolicy", env, policy_kwargs=dict(net_arch=net_arch), **config, **kwargs)
+
+
+def status_is_capture(info):
+    """
+    terminated で終わったエピソードの最後の info から、捕獲で終わったかを判定する（既定の判定）。
+
+    ステージのクリアでも終わる環境（oni_stage_env.StageChaseEnv）は info["status"] で見分ける（game_state.CAUGHT）。
+    status のない環境では terminated はいつも捕獲。
+    """
+    return info.get("status", "caught") == "caught"
+
+
+def get_rng_state():
+    # 自作環境は組み込みの random / np.random、PPO の行動サンプリングは torch の乱数を使う
+    return {"random": random.getstate(), "numpy": np.random.get_state(), "torch": torch.get_rng_state()}
+
+
+def set_rng_state(state):
+    random.setstate(state["random"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+
+
+def save_checkpoint(model, path):
+    """path.zip に方策とオプティマイザ、path_rng.pkl に乱数の状態を保存する"""
+    model.save(path)
+    with open(path + "_rng.pkl", "wb") as f:
+        pickle.dump(get_rng_state(), f)
+
+
+def load_checkpoint(path, env):
+    """save_checkpoint で保存したモデルを env につないで読み込み、乱数の状態も戻す"""
+    path = path[:-4] if path.endswith(".zip") else path
+    model = PPO.load(path, env=env)
+    if os.path.exists(path + "_rng.pkl"):
+        with open(path + "_rng.pkl", "rb") as f:
+            set_rng_state(pickle.load(f))
+    return model
+
+
+def list_checkpoints(directory):
+    """directory のチェックポイントを (ステップ数, パス) の昇順で返す"""
+    found = []
+    for path in glob.glob(os.path.join(directory, CHECKPOINT_PREFIX + "*.zip")):
+        match = re.fullmatch(CHECKPOINT_PREFIX + r"(\d+)\.zip", os.path.basename(path))
+        if match:
+            found.append((int(match.group(1)), path[:-4]))
+    return sorted(found)
+
+
+def latest_checkpoint(directory):
+    checkpoints = list_checkpoints(directory)
+    return checkpoints[-1][1] if checkpoints else None
+
+
+class CheckpointCallback(BaseCallback):
+    """
+    save_freq ステップごとに checkpoints/ckpt_<ステップ数> を保存し、新しいものから keep 個だけ残す。
+
+    保存はロールアウトの始め（PPO の更新が終わった直後）に行うので、集めかけのロールアウトは含まない。
+    """
+
+    def __init__(self, save_freq, directory, keep=3, verbose=0):
+        super().__init__(verbose)
+        self.save_freq = save_freq
+        self.directory = directory
+        self.keep = keep
+        self.last_save = None
+
+    def _on_training_start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.last_save = self.model.num_timesteps
+
+    def _on_rollout_start(self):
+        if self.model.num_timesteps - self.last_save >= self.save_freq:
+            self.save()
+
+    def save(self):
+        path = os.path.join(self.directory, f"{CHECKPOINT_PREFIX}{self.model.num_timesteps}")
+        save_checkpoint(self.model, path)
+        self.last_save = self.model.num_timesteps
+        for _, old in list_checkpoints(self.directory)[:-self.keep]:
+            for suffix in (".zip", "_rng.pkl"):
+                if os.path.exists(old + suffix):
+                    os.remove(old + suffix)
+        if self.verbose:
+            print(f"チェックポイントを {path} に保存しました")
+
+    def _on_step(self):
+        return True
+
+
+def evaluate_capture_rate(model, env, n_episodes, seed=EVAL_SEED, is_capture=status_is_capture):
+    """
+    決定的な行動で n_episodes 回対戦し、(捕獲率, 平均報酬) を返す。
+
+    学習側の乱数を乱さないよう、評価の前後で乱数の状態を保存・復元する。
+
+    :param is_capture: terminated で終わったエピソードの最後の info → 捕獲か
+    """
+    saved = get_rng_state()
+    captured, total_reward = 0, 0.0
+    try:
+        for i in range(n_episodes):
+            random.seed(seed + i)
+            np.random.seed(seed + i)
+            obs, _ = env.reset(seed=seed + i)
+            while True:
+                action, _ = model.predict(obs, deterministic=True)
+                obs, reward, terminated, truncated, info = env.step(action)
+                total_reward += float(reward)
+                if terminated or truncated:
+                    break
+            captured += bool(terminated) and is_capture(info)
+    finally:
+        set_rng_state(saved)
+    return captured / n_episodes, total_reward / n_episodes
+
+
+class CaptureEvalCallback(BaseCallback):
+    """
+    eval_freq ステップごとに eval_env で捕獲率を測り、最高のモデルを best_path に保存する。
+
+    捕獲率が target 以上になるか、patience 回続けて min_delta より伸びなければ学習を止める。
+    評価の履歴は log_path の JSON に書き、再開時はそこから最高値と伸びなかった回数を引き継ぐ。
+    """
+
+    def __init__(self, eval_env, eval_freq, n_episodes, best_path, log_path,
+                 target=None, patience=0, min_delta=0.01, is_capture=status_is_capture, verbose=1):
+        super().__init__(verbose)
+        self.eval_env = eval_env
+        self.is_capture = is_capture
+        self.eval_freq = eval_freq
+        self.n_episodes = n_episodes
+        self.best_path = best_path
+        self.log_path = log_path
+        self.target = target
+        self.patience = patience
+        self.min_delta = min_delta
+        self.history = []  # {"timesteps", "capture_rate", "mean_reward"}
+        self.best = -1.0
+        self.no_improvement = 0
+        self.last_eval = None
+        self.stop_reason = None
+
+    def _on_training_start(self):
+        self.last_eval = self.model.num_timesteps
+        if self.model.num_timesteps and os.path.exists(self.log_path):
+            with open(self.log_path) as f:
+                log = json.load(f)
+            self.history = [h for h in log["history"] if h["timesteps"] <= self.model.num_timesteps]
+            for h in self.history:
+                self._update_best(h["capture_rate"])
+
+    def _update_best(self, rate):
+        if rate > self.best + self.min_delta:
+            self.best, self.no_improvement = rate, 0
+            return True
+        self.best = max(self.best, rate)
+        self.no_improvement += 1
+        return False
+
+    def _on_rollout_start(self):
+        if self.stop_reason is None and self.model.num_timesteps - self.last_eval >= self.eval_freq:
+            self.evaluate()
+
+    def _on_training_end(self):
+        # 最後のロールアウトの後の方策も評価して、最高のモデルの候補に入れる
+        if self.stop_reason is None and self.model.num_timesteps > self.last_eval:
+            self.evaluate()
+
+    def evaluate(self):
+        self.last_eval = self.model.num_timesteps
+        rate, mean_reward = evaluate_capture_rate(self.model, self.eval_env, self.n_episodes,
+                                                  is_capture=self.is_capture)
+        self.history.append({"timesteps": self.model.num_timesteps, "capture_rate": rate, "mean_reward": mean_reward})
+        self.logger.record("eval/capture_rate", rate)
+        self.logger.record("eval/mean_reward", mean_reward)
+
+        # 最高値を更新したら保存する（min_delta 未満の伸びでも保存はするが、伸びなかった回に数える）
+        if rate > self.best:
+            self.model.save(self.best_path)
+        improved = self._update_best(rate)
+        with open(self.log_path, "w") as f:
+            json.dump({"best_capture_rate": self.best, "history": self.history}, f, indent=2)
+        if self.verbose:
+            print(f"評価 {self.model.num_timesteps} ステップ: 捕獲率 {rate:.1%}, 平均報酬 {mean_reward:.2f}"
+                  + (" (最高)" if improved else f" (伸びなし {self.no_improvement}回)"))
+
+        if self.target is not None and rate >= self.target:
+            self.stop_reason = f"捕獲率 {rate:.1%} が目標 {self.target:.1%} に達した"
+        elif self.patience and self.no_improvement >= self.patience:
+            self.stop_reason = f"捕獲率が {self.patience} 回続けて伸びなかった（最高 {self.best:.1%}）"
+
+    def _on_step(self):
+        return self.stop_reason is None
+
+
+class TelemetryWriter:
+    """
+    1回のロールアウトを1行として path に追記し、max_bytes を超えたら path.1, path.2, ... にずらす。
+
+    拡張子が .csv なら CSV（ファイルごとに見出し行を付ける）、それ以外は JSONL で書く。
+    """
+
+    def __init__(self, path, fields, max_bytes=10 * 1024 * 1024, backups=3):
+        self.path = path
+        self.fields = fields
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.is_csv = path.endswith(".csv")
+        self.file = None
+        self.writer = None
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.file = open(self.path, "a", newline="")
+        if self.is_csv:
+            self.writer = csv.DictWriter(self.file, self.fields)
+            if self.file.tell() == 0:
+                self.writer.writeheader()
+
+    def _rotate(self):
+        self.file.close()
+        self.file = None
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def write(self, record):
+        if self.file is None:
+            self._open()
+        if self.is_csv:
+            self.writer.writerow(record)
+        else:
+            self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        if self.file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class TelemetryCallback(BaseCallback):
+    """
+    ロールアウトごとに、学習の時間がどこにかかったかを TelemetryWriter に書く。
+
+    - env_step_s: 環境の step（VecEnv.step）の時間
+    - policy_s: ロールアウト中の方策の計算（行動のサンプリング）の時間
+    - rollout_other_s: ロールアウトの残り（バッファへの追加、GAE の計算、毎ステップのコールバックなど）
+    - update_s: PPO の更新（勾配計算とログの出力）の時間
+    - callback_s: ロールアウトの始めのコールバック（評価やチェックポイントの保存）の時間
+
+    VecEnv.step と方策の forward をインスタンス属性で包んで測るので、1ステップあたりの手間は
+    perf_counter 数回分だけ。コールバックの並びの先頭に置くこと（train() はそうしている）。
+    """
+
+    FIELDS = ["time", "rollout", "timesteps", "n_envs", "n_params", "rollout_s", "env_step_s", "policy_s",
+              "rollout_other_s", "update_s", "callback_s", "env_steps_per_sec", "episodes",
+              "mean_episode_length", "capture_rate"]
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backups=3, is_capture=status_is_capture, verbose=0):
+        super().__init__(verbose)
+        self.is_capture = is_capture
+        self.writer = TelemetryWriter(path, self.FIELDS, max_bytes, backups)
+        self.pending = None  # 更新時間が分かるまで書くのを待っているレコード
+        self.rollouts = 0
+        self.wrapped = None  # 包んだ (VecEnv, 方策)。close() で元に戻す
+
+    def _on_training_start(self):
+        env, policy = self.model.env, self.model.policy
+        env_step, policy_forward = env.step, policy.forward
+
+        def timed_step(actions):
+            start = time.perf_counter()
+            result = env_step(actions)
+            self.env_time += time.perf_counter() - start
+            return result
+
+        def timed_forward(*args, **kwargs):
+            start = time.perf_counter()
+            if self.first_forward is None:
+                self.first_forward = start
+            result = policy_forward(*args, **kwargs)
+            self.policy_time += time.perf_counter() - start
+            return result
+
+        env.step, policy.forward = timed_step, timed_forward
+        self.wrapped = (env, policy)
+        self.n_envs = env.num_envs
+        self.n_params = sum(p.numel() for p in policy.parameters())
+        self.lengths = np.zeros(self.n_envs, dtype=np.int64)
+        self.rollout_end = None
+
+    def _on_rollout_start(self):
+        now = time.perf_counter()
+        if self.pending is not None:
+            self._flush(now)
+        self.rollout_start = now
+        self.first_forward = None
+        self.env_time = self.policy_time = 0.0
+        self.steps = 0
+        self.episode_lengths = []
+        self.captured = 0
+
+    def _on_step(self):
+        self.steps += 1
+        self.lengths += 1
+        dones = self.locals["dones"]
+        if dones.any():
+            infos = self.locals["infos"]
+            for i in np.flatnonzero(dones):
+                info = infos[i]
+                self.episode_lengths.append(int(self.lengths[i]))
+                self.captured += not info.get("TimeLimit.truncated", False) and self.is_capture(info)
+                self.lengths[i] = 0
+        return True
+
+    def _on_rollout_end(self):
+        self.rollout_end = time.perf_counter()
+        self.rollouts += 1
+        start = self.first_forward or self.rollout_start
+        rollout_s = self.rollout_end - start
+        episodes = len(self.episode_lengths)
+        self.pending = {
+            "time": time.time(),
+            "rollout": self.rollouts,
+            "timesteps": self.model.num_timesteps,
+            "n_envs": self.n_envs,
+            "n_params": self.n_params,
+            "rollout_s": rollout_s,
+            "env_step_s": self.env_time,
+            "policy_s": self.policy_time,
+            "rollout_other_s": rollout_s - self.env_time - self.policy_time,
+            "callback_s": start - self.rollout_start,
+            "env_steps_per_sec": self.steps * self.n_envs / rollout_s,
+            "episodes": episodes,
+            "mean_episode_length": float(np.mean(self.episode_lengths)) if episodes else None,
+            "capture_rate": self.captured / episodes if episodes else None,
+        }
+
+    def _flush(self, now):
+        self.pending["update_s"] = now - self.rollout_end
+        self.writer.write(self.pending)
+        self.pending = None
+
+    def _on_training_end(self):
+        if self.pending is not None:
+            self._flush(time.perf_counter())
+        self.close()
+
+    def close(self):
+        """
+        包んだメソッドを元に戻し、ファイルを閉じる（何度呼んでもよい）。
+
+        学習が例外や Ctrl+C で止まると _on_training_end は呼ばれないので、train() が finally でも呼ぶ。
+        """
+        if self.wrapped is not None:
+            env, policy = self.wrapped
+            vars(env).pop("step", None)
+            vars(policy).pop("forward", None)
+            self.wrapped = None
+        self.writer.close()
+
+
+def add_training_args(parser, total_timesteps=50000):
+    """学習スクリプトに、PPO の設定・チェックポイント・再開・評価・テレメトリの引数を追加する"""
+    parser.add_argument("--config", default=None,
+                        help="PPO の設定の JSON（sweep.py export で書き出したものなど）。省略時は PPO_CONFIG")
+    parser.add_argument("--total-timesteps", type=int, default=total_timesteps, help="再開時も合計のステップ数")
+    parser.add_argument("--checkpoint-dir", default=None, help="省略時は checkpoints/<保存名>")
+    parser.add_argument("--checkpoint-freq", type=int, default=10000, help="チェックポイントを保存する間隔（ステップ）")
+    parser.add_argument("--keep-checkpoints", type=int, default=3)
+    parser.add_argument("--resume", nargs="?", const="latest", default=None,
+                        help="チェックポイントから再開する（パスを省略するといちばん新しいもの）")
+    parser.add_argument("--eval-freq", type=int, default=0,
+                        help="評価の間隔（ステップ）。0（既定）で評価せず、--total-timesteps まで学習する")
+    parser.add_argument("--eval-episodes", type=int, default=100)
+    parser.add_argument("--target-capture-rate", type=float, default=None, help="この捕獲率に達したら学習を止める")
+    parser.add_argument("--patience", type=int, default=5,
+                        help="捕獲率が続けてこの回数伸びなければ学習を止める。0 で止めない")
+    parser.add_argument("--min-delta", type=float, default=0.01, help="伸びたとみなす捕獲率の差")
+    parser.add_argument("--telemetry", default=None,
+                        help="ロールアウトごとの時間の内訳を書き出すファイル（.jsonl か .csv）")
+    parser.add_argument("--telemetry-max-mb", type=float, default=10, help="これを超えたら古いファイルを .1, .2 にずらす")
+    return parser
+
+
+def train(make_model, env, eval_env, save_path, args, callbacks=(), is_capture=status_is_capture):
+    """
+    チェックポイントから再開するか make_model() で新しく作ったモデルを学習し、save_path に保存する。
+
+    :param make_model: env を使う新しい PPO を返す関数
+    :param eval_env: 評価用の環境（学習用とは別のインスタンス）。None なら評価しない
+    :param args: add_training_args で追加した引数
+    :param is_capture: terminated で終わったエピソードの最後の info → 捕獲か（評価とテレメトリの捕獲率に使う）
+    :return: 学習したモデル
+    """
+    if args.target_capture_rate is not None and args.eval_freq <= 0:
+        raise SystemExit("--target-capture-rate を使うには --eval-freq で評価の間隔を指定してください")
+    directory = args.checkpoint_dir or os.path.join("checkpoints", os.path.basename(save_path))
+    checkpoint = latest_checkpoint(directory) if args.resume == "latest" else args.resume
+    if args.resume and checkpoint is None:
+        raise SystemExit(f"{directory} にチェックポイントがありません")
+    if checkpoint:
+        model = load_checkpoint(checkpoint, env)
+        print(f"{checkpoint} の {model.num_timesteps} ステップから再開します")
+    else:
+        model = make_model()
+
+    checkpointer = CheckpointCallback(args.checkpoint_freq, directory, keep=args.keep_checkpoints)
+    callbacks = [checkpointer, *callbacks]
+    telemetry = None
+    if args.telemetry:
+        # 評価やチェックポイントの時間を callback_s に分けて測れるよう、先頭に置く
+        telemetry = TelemetryCallback(args.telemetry, max_bytes=int(args.telemetry_max_mb * 1024 * 1024),
+                                      is_capture=is_capture)
+        callbacks.insert(0, telemetry)
+    evaluator = None
+    if eval_env is not None and args.eval_freq > 0:
+        evaluator = CaptureEvalCallback(eval_env, args.eval_freq, args.eval_episodes,
+                                        best_path=save_path + "_best",
+                                        log_path=os.path.join(directory, "evaluations.json"),
+                                        target=args.target_capture_rate, patience=args.patience,
+                                        min_delta=args.min_delta, is_capture=is_capture)
+        callbacks.append(evaluator)
+
+    remaining = args.total_timesteps - model.num_timesteps
+    if remaining > 0:
+        try:
+            model.learn(total_timesteps=remaining, callback=callbacks, reset_num_timesteps=not checkpoint)
+        except KeyboardInterrupt:
+            # 中断しても、そこまでの学習は次の --resume で続けられるようにする
+            checkpointer.save()
+            print(f"中断しました。--resume で {model.num_timesteps} ステップから再開できます")
+            raise
+        finally:
+            if telemetry is not None:
+                telemetry.close()
+        checkpointer.save()
+    if evaluator is not None and evaluator.stop_reason:
+        print(f"早期終了: {evaluator.stop_reason}")
+
+    model.save(save_path)
+    print(f"モデルを {save_path} に保存しました。")
+    return model
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+
+import pygame
+
+
+class TransformCache:
+    """
+    拡大縮小・回転した Surface を (元画像, サイズ, 角度) ごとに覚えておく LRU キャッシュ。
+
+    同じ変形を毎フレーム頼まれても2回目からは作らずに返すので、定常状態では Surface を新しく確保しない。
+    上限 max_items を超えたら最も長く使われていないものから捨てる。
+    """
+
+    def __init__(self, max_items=256):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, image, size=None, angle=0):
+        """
+        image を size に拡大縮小してから angle 度回転した Surface を返す。
+
+        :param size: (幅, 高さ)。None なら拡大縮小しない
+        :param angle: pygame.transform.rotate と同じく反時計回りの角度
+        """
+        # 元画像は値の中で参照を持ち続けるので、id が別の画像に使い回されることはない
+        key = (id(image), None if size is None else (int(size[0]), int(size[1])), angle)
+        item = self._items.get(key)
+        if item is not None:
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+        self.misses += 1
+        surface = image
+        if key[1] is not None and key[1] != image.get_size():
+            surface = pygame.transform.scale(surface, key[1])
+        if angle:
+            surface = pygame.transform.rotate(surface, angle)
+        self._items[key] = (image, surface)
+        if len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+        return surface
+
+    def scaled(self, image, size):
+        return self.get(image, size)
+
+    def rotated(self, image, angle):
+        return self.get(image, None, angle)
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class HudCache:
+    """
+    いくつかの画像を並べた HUD を1枚の Surface にまとめておき、表示する値が変わったときだけ作り直す。
+
+    :param render: 値を受け取り、[(画像, (x, y)), ...] を返す関数。座標は HUD の左上からの相対位置
+    """
+
+    def __init__(self, render):
+        self.render = render
+        self.value = None
+        self.surface = None
+
+    def get(self, value):
+        if self.surface is None or value != self.value:
+            parts = self.render(value)
+            width = max(x + image.get_width() for image, (x, y) in parts)
+            height = max(y + image.get_height() for image, (x, y) in parts)
+            self.surface = pygame.Surface((width, height), pygame.SRCALPHA)
+            for image, pos in parts:
+                # 部品どうしは重ならないので、透明な下地に加算すれば画素をそのまま写せる
+                # （普通に合成するとアルファが二重にかかって、画面に直接描いたときと色が変わる）
+                self.surface.blit(image, pos, special_flags=pygame.BLEND_RGBA_ADD)
+            self.value = value
+        return self.surface
@@ -1,7 +1,6 @@
 import pygame
 import sys
 import random
-from stable_baselines3 import PPO
 
 # oni.pyから鬼の移動アルゴリズムを読み込む
 from oni import get_oni_next_move
@@ -11,6 +10,7 @@ pygame.init()
 
 # --- 環境とモデルの読み込み ---
 # oni.py 内でモデルをロードするため、ここでは不要です。
+# （oni.py を import した時点でバックグラウンドで読み込みが始まり、鬼が最初に動くときに完了を待ちます）
 # ただし、ani.pyがモデルを見つけられるように、パスを確認してください。
 
 # --- グリッドの設定 ---
@@ -1,9 +1,9 @@
 import gymnasium as gym
 import numpy as np
-from stable_baselines3 import PPO
 from collections import deque
 import os
 import sys
+from model_loader import BackgroundLoader
 
 # --- ダミー環境の定義 ---
 # AIモデルをロードするために、モデルが学習した環境の形式を再現するためのダミークラス
@@ -24,22 +24,37 @@ class DummyEnv(gym.Env):
         return self.observation_space.sample(), 0, False, False, {}
 
 # 学習済みモデルをロード
-# グローバルスコープで一度だけロード
 model_path = "model/oni_model.zip"
-try:
+
+def load_model():
+    """学習済みモデルを読み込む（torch の読み込みも含めてバックグラウンドのスレッドで実行される）"""
+    from stable_baselines3 import PPO
     # Stable Baselines3のモデルは、`.zip`拡張子がないと正しくロードできない場合があります
     if not os.path.exists(model_path):
         # 以前のバージョンで保存したモデル名が `enemy_model3` だった場合に対応
         # この処理は、新しいモデルを保存する際に `.zip` を付けることで不要になります
         PPO.load("model/oni_model", env=DummyEnv()).save(model_path)
-    
+
     # env=DummyEnv() を指定して、モデルが環境の観測・行動空間を認識できるようにします
-    model = PPO.load(model_path, env=DummyEnv())
-    print("AIモデルをロードしました。")
-except FileNotFoundError:
-    print(f"エラー: 学習済みモデル '{model_path}' が見つかりません。")
-    print("AIが学習を完了しているか、パスが正しいか確認してください。")
-    sys.exit()
+    return PPO.load(model_path, env=DummyEnv())
+
+# import した時点で読み込みを始め、ゲームは待たずに画面を出す。
+# 鬼が最初に動くときに get_model() で完了を待つ
+model_loader = BackgroundLoader(load_model)
+model = None
+
+def get_model():
+    """読み込み済みのモデルを返す。読み込み中ならここで待つ"""
+    global model
+    if model is None:
+        try:
+            model = model_loader.result()
+            print(f"AIモデルをロードしました。({model_loader.elapsed:.2f} 秒)")
+        except FileNotFoundError:
+            print(f"エラー: 学習済みモデル '{model_path}' が見つかりません。")
+            print("AIが学習を完了しているか、パスが正しいか確認してください。")
+            sys.exit()
+    return model
 
 
 def get_oni_next_move(grid, oni_pos, player_pos):
@@ -57,7 +72,7 @@ def get_oni_next_move(grid, oni_pos, player_pos):
     obs = np.array([oni_pos[0], oni_pos[1], player_pos[0], player_pos[1]])
     
     # AIモデルに行動を予測させる
-    action, _states = model.predict(obs)
+    action, _states = get_model().predict(obs)
     
     # 行動から座標の変更量を決定
     dx, dy = 0, 0
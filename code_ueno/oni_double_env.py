@@ -3,6 +3,8 @@ from gymnasium import spaces
 import numpy as np
 import random
 
+from field_grid import FieldGrid
+
 # グリッド設定
 GRID_SIZE = 50
 GRID_WIDTH = 10
@@ -10,15 +12,25 @@ GRID_HEIGHT = 10
 WIDTH = GRID_WIDTH * GRID_SIZE
 HEIGHT = GRID_HEIGHT * GRID_SIZE
 
+
+def rock_range(width, height):
+    """岩の個数の範囲。10x10 で 5〜10 個（盤面の 5〜10%）になるよう面積に比例させる"""
+    n_cells = width * height
+    return 5 * n_cells // 100, 10 * n_cells // 100
+
+
 class ChaseEnv(gym.Env):
-    def __init__(self, human_control=False):
+    def __init__(self, human_control=False, width=GRID_WIDTH, height=GRID_HEIGHT):
         super().__init__()
+        # 盤面の大きさ（学習済みモデルは 10x10 用）
+        self.width, self.height = width, height
+        self.rock_min, self.rock_max = rock_range(width, height)
         # 観測空間：(鬼1座標 + 鬼2座標 + プレイヤー座標)
         self.observation_space = spaces.Box(
             low=np.array([0,0,0,0,0,0]),
-            high=np.array([GRID_WIDTH-1, GRID_HEIGHT-1,
-                           GRID_WIDTH-1, GRID_HEIGHT-1,
-                           GRID_WIDTH-1, GRID_HEIGHT-1]),
+            high=np.array([self.width-1, self.height-1,
+                           self.width-1, self.height-1,
+                           self.width-1, self.height-1]),
             dtype=np.int32
         )
         
@@ -28,11 +40,8 @@ class ChaseEnv(gym.Env):
         self.max_steps = 100
         self.current_step = 0
 
-        # 岩座標
-        self.rocks = set()
-
-        # フィールド
-        self.field = None
+        # フィールド（岩の配置もここで管理する）
+        self.grid = FieldGrid(self.width, self.height)
 
         # プレイヤー & 敵座標
         self.player_pos = None
@@ -44,33 +53,36 @@ class ChaseEnv(gym.Env):
     def _init_field(self):
         """フィールドと岩・鬼・プレイヤーの初期配置を行う"""
         # プレイヤー初期位置
-        self.player_pos = np.array([GRID_WIDTH // 2, GRID_HEIGHT // 2])
+        self.player_pos = np.array([self.width // 2, self.height // 2])
         
         # フィールド初期化
-        self.field = [[{"type": "grass"} for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
-        self.rocks.clear()
+        self.grid.clear()
 
         # ランダムに岩を配置
-        while len(self.rocks) < random.randint(5, 10):
-            rx, ry = random.randint(0, GRID_WIDTH - 1), random.randint(0, GRID_HEIGHT - 1)
+        while self.grid.rock_count < random.randint(self.rock_min, self.rock_max):
+            rx, ry = random.randint(0, self.width - 1), random.randint(0, self.height - 1)
             if (rx, ry) != tuple(self.player_pos):
-                self.field[ry][rx]["type"] = "rock"
-                self.rocks.add((rx, ry))
+                self.grid.set_rock(rx, ry)
 
         # 鬼の初期位置を2体決定（被らないように）
         self.enemy_positions = []
         while len(self.enemy_positions) < 2:
-            ex, ey = random.randint(0, GRID_WIDTH - 1), random.randint(0, GRID_HEIGHT - 1)
+            ex, ey = random.randint(0, self.width - 1), random.randint(0, self.height - 1)
             distance = abs(ex - self.player_pos[0]) + abs(ey - self.player_pos[1])
             pos = (ex, ey)
             if (
                 pos != tuple(self.player_pos)
-                and pos not in self.rocks
+                and self.grid.is_passable(ex, ey)
                 and pos not in [tuple(p) for p in self.enemy_positions]
                 and distance >= 3
             ):
                 self.enemy_positions.append(np.array([ex, ey]))
 
+    @property
+    def rocks(self):
+        """岩座標の集合（描画・人間操作用）"""
+        return self.grid.rock_positions()
+
     def reset(self, seed=None, options=None):
         super().reset(seed=seed)
         self._init_field()
@@ -90,11 +102,7 @@ class ChaseEnv(gym.Env):
         if action == 3: new_pos[0] += 1  # 右
 
         # 無効な場合 → その場に留まる
-        if (
-            0 <= new_pos[0] < GRID_WIDTH
-            and 0 <= new_pos[1] < GRID_HEIGHT
-            and self.field[new_pos[1]][new_pos[0]]["type"] != "rock"
-        ):
+        if self.grid.is_passable(new_pos[0], new_pos[1]):
             return new_pos, False  # 有効移動
         else:
             return pos, True  # 岩などにぶつかった
@@ -135,18 +143,14 @@ class ChaseEnv(gym.Env):
                 player_dx = -1
 
             next_player_pos = self.player_pos + np.array([player_dx, player_dy])
-            if (
-                0 <= next_player_pos[0] < GRID_WIDTH
-                and 0 <= next_player_pos[1] < GRID_HEIGHT
-                and self.field[next_player_pos[1]][next_player_pos[0]]["type"] != "rock"
-            ):
+            if self.grid.is_passable(next_player_pos[0], next_player_pos[1]):
                 self.player_pos = next_player_pos
 
             # 10%の確率でランダム移動
             if random.random() < 0.1:
                 rand_move = random.choice([(-1,0),(1,0),(0,-1),(0,1),(0,0)])
-                self.player_pos[0] = max(0, min(GRID_WIDTH-1, self.player_pos[0] + rand_move[0]))
-                self.player_pos[1] = max(0, min(GRID_HEIGHT-1, self.player_pos[1] + rand_move[1]))
+                self.player_pos[0] = max(0, min(self.width-1, self.player_pos[0] + rand_move[0]))
+                self.player_pos[1] = max(0, min(self.height-1, self.player_pos[1] + rand_move[1]))
 
         # --- 終了判定 ---
         terminated = any(np.array_equal(enemy, self.player_pos) for enemy in self.enemy_positions)
@@ -3,6 +3,8 @@ from gymnasium import spaces
 import numpy as np
 import random  # 簡易AIにランダム性を加えるために追加
 
+from field_grid import FieldGrid
+
 # グリッド設定
 GRID_SIZE = 50
 GRID_WIDTH = 10
@@ -10,13 +12,23 @@ GRID_HEIGHT = 10
 WIDTH = GRID_WIDTH * GRID_SIZE
 HEIGHT = GRID_HEIGHT * GRID_SIZE
 
+
+def rock_range(width, height):
+    """岩の個数の範囲。10x10 で 5〜10 個（盤面の 5〜10%）になるよう面積に比例させる"""
+    n_cells = width * height
+    return 5 * n_cells // 100, 10 * n_cells // 100
+
+
 class ChaseEnv(gym.Env):
-    def __init__(self, human_control =False):
+    def __init__(self, human_control=False, width=GRID_WIDTH, height=GRID_HEIGHT):
         super().__init__()
+        # 盤面の大きさ（学習済みモデルは 10x10 用）
+        self.width, self.height = width, height
+        self.rock_min, self.rock_max = rock_range(width, height)
         # 観測空間：(敵座標 + プレイヤー座標)
         self.observation_space = spaces.Box(
             low=np.array([0,0,0,0]),
-            high=np.array([GRID_WIDTH-1, GRID_HEIGHT-1, GRID_WIDTH-1, GRID_HEIGHT-1]),
+            high=np.array([self.width-1, self.height-1, self.width-1, self.height-1]),
             dtype=np.int32
         )
         
@@ -25,8 +37,8 @@ class ChaseEnv(gym.Env):
         self.max_steps = 100
         self.current_step = 0
 
-        # 岩座標を管理するセット
-        self.rocks = set()
+        # フィールド（岩の配置もここで管理する）
+        self.grid = FieldGrid(self.width, self.height)
 
         # ★追加：人間操作モードフラグ
         self.human_control = human_control
@@ -34,31 +46,32 @@ class ChaseEnv(gym.Env):
     def _init_field(self):
         """フィールドと岩・鬼・プレイヤーの初期配置を行う"""
         # プレイヤー初期位置
-        self.player_pos = np.array([GRID_WIDTH // 2, GRID_HEIGHT // 2])
-        
-        # フィールド初期化
-        self.field = [[{"type": "grass", "bush": False} for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
+        self.player_pos = np.array([self.width // 2, self.height // 2])
         
         # ランダムに岩を配置
-        while len(self.rocks) < random.randint(5, 10):
-            rx, ry = random.randint(0, GRID_WIDTH - 1), random.randint(0, GRID_HEIGHT - 1)
+        while self.grid.rock_count < random.randint(self.rock_min, self.rock_max):
+            rx, ry = random.randint(0, self.width - 1), random.randint(0, self.height - 1)
             if (rx, ry) != tuple(self.player_pos):
-                self.field[ry][rx]["type"] = "rock"
-                self.rocks.add((rx, ry))
+                self.grid.set_rock(rx, ry)
 
         # 鬼の初期位置を決定
         while True:
-            ex, ey = random.randint(0, GRID_WIDTH - 1), random.randint(0, GRID_HEIGHT - 1)
+            ex, ey = random.randint(0, self.width - 1), random.randint(0, self.height - 1)
             distance = abs(ex - self.player_pos[0]) + abs(ey - self.player_pos[1])
-            if (ex, ey) != tuple(self.player_pos) and self.field[ey][ex]["type"] != "rock" and distance >= 3:
+            if (ex, ey) != tuple(self.player_pos) and self.grid.is_passable(ex, ey) and distance >= 3:
                 self.enemy_pos = np.array([ex, ey])
                 break
 
+    @property
+    def rocks(self):
+        """岩座標の集合（描画・人間操作用）"""
+        return self.grid.rock_positions()
+
     def reset(self, seed=None, options=None):
         super().reset(seed=seed)
         self.enemy_pos = np.array([0, 0])  # 敵の初期位置
-        self.player_pos = np.array([GRID_WIDTH-5, GRID_HEIGHT-5])  # プレイヤーの初期位置
-        self.rocks.clear()  # 前回の岩をリセット
+        self.player_pos = np.array([self.width-5, self.height-5])  # プレイヤーの初期位置
+        self.grid.clear()  # 前回の岩をリセット
         self._init_field()
         self.current_step = 0
         return np.concatenate([self.enemy_pos, self.player_pos]), {}
@@ -74,7 +87,7 @@ class ChaseEnv(gym.Env):
         if action == 3: next_enemy_pos[0] += 1  # 右
 
         # 岩を通れない判定
-        if (0 <= next_enemy_pos[0] < GRID_WIDTH and 0 <= next_enemy_pos[1] < GRID_HEIGHT and self.field[next_enemy_pos[1]][next_enemy_pos[0]]["type"] != "rock"):
+        if self.grid.is_passable(next_enemy_pos[0], next_enemy_pos[1]):
             self.enemy_pos = next_enemy_pos
         
         #print(f"self.player_controlled_by_human = {self.player_controlled_by_human}")
@@ -94,14 +107,14 @@ class ChaseEnv(gym.Env):
             
             next_player_pos = self.player_pos + np.array([player_dx, player_dy])
 
-            if (0 <= next_player_pos[0] < GRID_WIDTH and 0 <= next_player_pos[1] < GRID_HEIGHT and self.field[next_player_pos[1]][next_player_pos[0]]["type"] != "rock"):
+            if self.grid.is_passable(next_player_pos[0], next_player_pos[1]):
                 self.player_pos = next_player_pos
 
             # 10%の確率でランダム移動
             if random.random() < 0.1:
                 rand_move = random.choice([(-1,0), (1,0), (0,-1), (0,1), (0,0)])
-                self.player_pos[0] = max(0, min(GRID_WIDTH-1, self.player_pos[0] + rand_move[0]))
-                self.player_pos[1] = max(0, min(GRID_HEIGHT-1, self.player_pos[1] + rand_move[1]))
+                self.player_pos[0] = max(0, min(self.width-1, self.player_pos[0] + rand_move[0]))
+                self.player_pos[1] = max(0, min(self.height-1, self.player_pos[1] + rand_move[1]))
 
         # 報酬設計
         dist = np.linalg.norm(self.enemy_pos - self.player_pos)
@@ -4,9 +4,9 @@ import numpy as np
 import random  # 簡易AIにランダム性を加えるために追加
 
 class ChaseEnv(gym.Env):
-    def __init__(self, player_controlled_by_human=False):
+    def __init__(self, player_controlled_by_human=False, size=10):
         super().__init__()
-        self.size = 10  # 10x10 グリッド
+        self.size = size  # size x size グリッド（学習済みモデルは 10x10 用）
         # 観測空間：(敵座標 + プレイヤー座標)
         self.observation_space = spaces.Box(low=0, high=self.size-1, shape=(4,), dtype=np.int32)
         # 行動空間：0=上, 1=下, 2=左, 3=右